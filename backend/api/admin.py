@@ -1,15 +1,22 @@
 from typing import Annotated
-from fastapi import APIRouter, Depends, HTTPException, status, Request, Form
+from fastapi import APIRouter, Depends, HTTPException, status, Request, Form, Query, UploadFile, BackgroundTasks
+from fastapi.responses import StreamingResponse, Response
 from fastapi.security import OAuth2PasswordRequestForm
 from pydantic import BaseModel
 from sqlmodel import Session, select, func
 
-from api.security import generate_secure_password, hash_password
+from api.security import generate_secure_password
+from api.hashing import hash_password
 from api.functions import *
 from api.models import *
 from api.database import engine, get_db
 from api.security import credentials_exception
 from api.schemas import *
+from api.config import ADMIN_PAGE_SIZE, ADMIN_PAGE_SIZE_MAX
+from api.pagination import paginate, approximate_count, page_headers
+from api.responses import typed_response
+from api.export import ExportEntity, ExportFormat, EXPORT_MEDIA_TYPES, stream_export
+from api.patient_import import ImportFormat, ImportJob, import_jobs, detect_format, parse_rows, run_import, passwords_csv
 
 admin_router = APIRouter()
 
@@ -26,18 +33,24 @@ admin_router = APIRouter()
                       }
                     }
                   )
-def get_users(db: Session = Depends(get_db),
+def get_users(limit: int = Query(ADMIN_PAGE_SIZE, ge=1, le=ADMIN_PAGE_SIZE_MAX, description="Page size"),
+              cursor: Optional[str] = Query(None, description="Value of X-Next-Cursor from the previous page"),
+              count: bool = Query(False, description="Return an approximate total in X-Total-Count"),
+              db: Session = Depends(get_db),
               payload: dict = Depends(get_my_info)) -> list:
-    """Retrieve a list of all registered users in the system"""
+    """
+    Retrieve a page of registered users in the system, ordered by id.
+    The cursor of the next page is returned in the `X-Next-Cursor` header, it is absent on the last page.
+    """
 
     if not payload or payload["type"] != "Admin":
         raise credentials_exception
 
-    stmt = select(User)
-    users = db.exec(stmt).all()
+    stmt = select(User.id, User.email, User.mfa_type, User.type)
+    rows, next_cursor = paginate(db, stmt, User.id, limit, cursor, "admin/users:id")
+    users = [UserStripped(id=row.id, email=row.email, mfa_type=row.mfa_type, type=row.type) for row in rows]
 
-
-    return(users)
+    return typed_response(users, headers=page_headers(next_cursor, approximate_count(db, User, User.id) if count else None))
 
 
 
@@ -51,17 +64,22 @@ def get_users(db: Session = Depends(get_db),
                       }
                     }
                   )
-def get_users(db: Session = Depends(get_db),
+def get_users(limit: int = Query(ADMIN_PAGE_SIZE, ge=1, le=ADMIN_PAGE_SIZE_MAX, description="Page size"),
+              cursor: Optional[str] = Query(None, description="Value of X-Next-Cursor from the previous page"),
+              count: bool = Query(False, description="Return an approximate total in X-Total-Count"),
+              db: Session = Depends(get_db),
               payload: dict = Depends(get_my_info)) -> list:
-    """Retrieve a list of all patients in the system"""
+    """Retrieve a page of patients in the system, ordered by id. Paging works like in `/admin/users`"""
 
     if not payload or payload["type"] != "Admin":
         raise credentials_exception
 
-    stmt = select(Patient)
-    patients: list = db.exec(stmt).all()
+    stmt = select(Patient.id, Patient.first_name, Patient.middle_name, Patient.last_name, Patient.gender)
+    rows, next_cursor = paginate(db, stmt, Patient.id, limit, cursor, "admin/patients:id")
+    patients = [PatientStripped(first_name=row.first_name, middle_name=row.middle_name, last_name=row.last_name,
+                                gender=row.gender) for row in rows]
 
-    return patients
+    return typed_response(patients, headers=page_headers(next_cursor, approximate_count(db, Patient, Patient.id) if count else None))
 
 
 @admin_router.get("/doctors",
@@ -74,17 +92,55 @@ def get_users(db: Session = Depends(get_db),
                       }
                   }
                   )
-def get_users(db: Session = Depends(get_db),
+def get_users(limit: int = Query(ADMIN_PAGE_SIZE, ge=1, le=ADMIN_PAGE_SIZE_MAX, description="Page size"),
+              cursor: Optional[str] = Query(None, description="Value of X-Next-Cursor from the previous page"),
+              count: bool = Query(False, description="Return an approximate total in X-Total-Count"),
+              db: Session = Depends(get_db),
               payload: dict = Depends(get_my_info)) -> list:
-    """Retrieve a list of all doctors in the system"""
+    """Retrieve a page of doctors in the system, ordered by id. Paging works like in `/admin/users`"""
 
     if not payload or payload["type"] != "Admin":
         raise credentials_exception
 
-    stmt = select(Doctor)
-    doctors = db.exec(stmt).all()
+    stmt = select(Doctor.id, Doctor.first_name, Doctor.middle_name, Doctor.last_name, Doctor.phone_number,
+                  Doctor.license_number, Doctor.hire_date)
+    rows, next_cursor = paginate(db, stmt, Doctor.id, limit, cursor, "admin/doctors:id")
+    doctors = [DoctorStripped(id=row.id, first_name=row.first_name, middle_name=row.middle_name,
+                              last_name=row.last_name, phone_number=row.phone_number,
+                              license_number=row.license_number, hire_date=row.hire_date) for row in rows]
+
+    return typed_response(doctors, headers=page_headers(next_cursor, approximate_count(db, Doctor, Doctor.id) if count else None))
+
+@admin_router.get("/export/{entity}",
+                  tags=["User Management"],
+                  response_class=StreamingResponse,
+                  responses={
+                      200: {
+                          "description": "Rows as NDJSON (one object per line) or CSV",
+                          "content": {"application/x-ndjson": {}, "text/csv": {}}
+                      },
+                      401: {
+                          "description": "Auth error",
+                          "model": ErrorSchema
+                      }
+                  }
+                  )
+def export_entity(entity: ExportEntity,
+                  format: ExportFormat = Query(ExportFormat.ndjson, description="Output format"),
+                  payload: dict = Depends(get_my_info)):
+    """
+    Stream every patient, doctor or appointment in the same shape as the list endpoints.
+    Rows are serialized while they are read from the database, so memory stays constant for any table size.
+    Nested objects are flattened to `patient.first_name` style columns in CSV.
+    """
+
+    if not payload or payload["type"] != "Admin":
+        raise credentials_exception
+
+    return StreamingResponse(stream_export(entity, format),
+                             media_type=EXPORT_MEDIA_TYPES[format],
+                             headers={"Content-Disposition": f'attachment; filename="{entity.value}.{format.value}"'})
 
-    return doctors
 
 @admin_router.get("/users/{user_id}",
                   tags=["User Management"],
@@ -263,10 +319,109 @@ def create_new_patient(new_user_data: NewPatient,
 
     db.add(new_user)
     db.commit()
+    invalidate_principal(new_user_data.email)
 
     return {"message": "Patient created", "patient_temp_password": password}
 
 
+@admin_router.post("/patients/import",
+                   status_code=status.HTTP_202_ACCEPTED,
+                   tags=["User Management"],
+                   response_model=ImportJobStatus,
+                   responses={
+                       401: {
+                           "description": "Auth error",
+                           "model": ErrorSchema
+                       },
+                       400: {
+                           "description": "Bad Request",
+                           "model": ErrorSchema
+                       },
+                       503: {
+                           "description": "Too many unfinished imports",
+                           "model": ErrorSchema
+                       }
+                     }
+                   )
+def import_patients(file: UploadFile,
+                    background_tasks: BackgroundTasks,
+                    format: Optional[ImportFormat] = Query(None, description="File format, detected from the file name when omitted"),
+                    payload: dict = Depends(get_my_info)):
+    """
+    Create patient accounts from a CSV file or NDJSON (one object per line) upload with the fields of `/admin/patients/add`.
+    The import runs in the background, poll `/admin/patients/import/{job_id}` for progress and the per-row report.
+    Temporary passwords are downloaded once from `/admin/patients/import/{job_id}/passwords` after the job has finished.
+    """
+
+    if not payload or payload["type"] != "Admin":
+        raise credentials_exception
+
+    rows = parse_rows(file.file.read(), format or detect_format(file.filename, file.content_type))
+    job = ImportJob(total=len(rows))
+    import_jobs.add(job)
+    background_tasks.add_task(run_import, job, rows)
+
+    return job.to_dict()
+
+
+@admin_router.get("/patients/import/{job_id}",
+                  tags=["User Management"],
+                  response_model=ImportJobStatus,
+                  responses={
+                      401: {
+                          "description": "Auth error",
+                          "model": ErrorSchema
+                      },
+                      404: {
+                          "description": "Not Found",
+                          "model": ErrorSchema
+                      }
+                    }
+                  )
+def get_import_status(job_id: str,
+                      payload: dict = Depends(get_my_info)):
+    """Progress of a patient import and the result of every processed row"""
+
+    if not payload or payload["type"] != "Admin":
+        raise credentials_exception
+
+    return import_jobs.get(job_id).to_dict()
+
+
+@admin_router.get("/patients/import/{job_id}/passwords",
+                  tags=["User Management"],
+                  response_class=Response,
+                  responses={
+                      200: {
+                          "description": "CSV with email and temp_password columns",
+                          "content": {"text/csv": {}}
+                      },
+                      401: {
+                          "description": "Auth error",
+                          "model": ErrorSchema
+                      },
+                      409: {
+                          "description": "Import still running",
+                          "model": ErrorSchema
+                      },
+                      410: {
+                          "description": "Passwords already downloaded",
+                          "model": ErrorSchema
+                      }
+                    }
+                  )
+def get_import_passwords(job_id: str,
+                         payload: dict = Depends(get_my_info)):
+    """Download the temporary passwords of the imported patients. The file can only be downloaded once"""
+
+    if not payload or payload["type"] != "Admin":
+        raise credentials_exception
+
+    return Response(passwords_csv(import_jobs.get(job_id)),
+                    media_type="text/csv",
+                    headers={"Content-Disposition": f'attachment; filename="import-{job_id}-passwords.csv"'})
+
+
 @admin_router.post("/doctors/add",
                    status_code=status.HTTP_201_CREATED,
                    tags=["User Management"],
@@ -317,5 +472,6 @@ def create_new_doctor(new_doctor_data: NewDoctor,
 
     db.add(new_user)
     db.commit()
+    invalidate_principal(new_doctor_data.email)
 
     return {"message": "Doctor created", "doctor_temp_password": password}
\ No newline at end of file
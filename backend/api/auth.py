@@ -1,6 +1,6 @@
 from datetime import timedelta
 from typing import Annotated
-from fastapi import APIRouter, Depends, HTTPException, status, Form, Response
+from fastapi import APIRouter, Depends, HTTPException, status, Form, Response, Cookie, Request
 
 from api.security import credentials_exception, create_token_from_user, create_token_from_data
 from api.functions import *
@@ -8,6 +8,9 @@ from api.models import *
 from api.database import get_db
 from api.security import *
 from api.schemas import *
+from api.hashing import hash_password, verify_password, verify_and_update_password
+from api.etags import is_not_modified, not_modified, etag_headers
+from api.security import verify_token as verify_access_token  # verify_token is also an endpoint below
 
 auth_router = APIRouter()
 
@@ -52,6 +55,7 @@ def register_user(response: Response,
     db.add(new_user)
     db.commit()
     db.refresh(new_user)
+    invalidate_principal(new_user.email)
 
     # Generate a JWT token for the newly registered user
     access_token = create_token_from_user(new_user)
@@ -91,9 +95,17 @@ def login(response: Response,
         hash_password(password)
         print("No such user")
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid username or password")
-    elif not verify_password(password, db_user.hashed_password):
+
+    valid, new_hash = verify_and_update_password(password, db_user.hashed_password)
+    if not valid:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid username or password")
     else:
+        if new_hash:
+            # Stored hash was created with a different hashing profile, upgrade it while we know the password
+            db_user.hashed_password = new_hash
+            db.add(db_user)
+            db.commit()
+
         access_token = create_token_from_user(db_user)
         response.set_cookie(
             key="access_token",
@@ -121,7 +133,7 @@ def login(response: Response,
                       }
                     }
                   )
-async def change_user_password(
+def change_user_password(
         current_password: Annotated[str, Form()],
         new_password: Annotated[str, Form()],
         payload: dict = Depends(verify_token),
@@ -152,6 +164,7 @@ async def change_user_password(
     db.add(user)
     db.commit()
     db.refresh(user)
+    invalidate_principal(email)
 
     return {"message": "Password change successful"}
 
@@ -189,6 +202,31 @@ def extend_session(response: Response, payload: dict = Depends(verify_token)):
     return {"message": "Session extend successful"}
 
 
+@auth_router.post("/logout",
+                  tags=['Auth'],
+                  response_model=MessageSchema,
+                  responses={
+                      401: {
+                          "description": "Auth error",
+                          "model": ErrorSchema
+                      }
+                    }
+                  )
+def logout(response: Response,
+           access_token: Annotated[str | None, Cookie()] = None,
+           payload: dict = Depends(verify_token)):
+    """
+    ### API Endpoint: Logout
+
+    Revokes the current access token and removes the session cookie. The revocation is stored in the database,
+    other workers reject the token within TOKEN_REVOCATION_CHECK_SECONDS.
+    """
+
+    revoke_token(access_token)
+    response.delete_cookie(key="access_token", httponly=True)
+    return {"message": "Logout successful"}
+
+
 @auth_router.get("/verify_token",
                  tags=['Auth'],
                  response_model=VerifyTokenResponse,
@@ -223,12 +261,21 @@ def verify_token(db: Session = Depends(get_db), payload: dict = Depends(verify_t
                      }
                    }
                  )
-def get_info(payload: dict = Depends(get_my_info)):
+def get_info(request: Request, response: Response, token: dict = Depends(verify_access_token),
+             db: Session = Depends(get_db)):
     """
     ### API Endpoint: Get My Information
 
     This endpoint allows you to obtain extended information about the user's access token. This includes email, type and stripped versions of (Patient, Doctor) entries'
+
+    Supports conditional requests, send the ETag back in If-None-Match to get 304 when nothing changed.
     """
+    etag = principal_etag(token, db)
+    if is_not_modified(request, etag):
+        return not_modified(etag)
+    response.headers.update(etag_headers(etag))
+
+    payload = get_versioned_principal(token["sub"], etag, db)
     if payload["type"] == "patient":
        return GetUserInfoResponsePatient(email=payload["email"], type=payload["type"], patient=payload["patient"])
     elif payload["type"] == "doctor":
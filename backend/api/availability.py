@@ -0,0 +1,310 @@
+import heapq
+import re
+import threading
+import time
+from bisect import bisect_right, insort
+from datetime import datetime, timedelta
+
+from sqlalchemy import event, inspect
+from sqlmodel import Session, select
+
+from api.config import APPOINTMENT_MINUTES, AVAILABILITY_REFRESH_SECONDS
+from api.database import engine
+from api.models import Appointment, AppointmentStatus, Doctor, DoctorFacilityAssociation, MedicalFacility
+
+
+# Free slot search. Every doctor gets an agenda: the sorted start times of their appointments, in minutes since
+# EPOCH, so "is [t, t + duration) free" is a single bisect. Working hours come from the operating hours of the
+# facilities the doctor works at. Queries over many doctors lazily walk each doctor's free slots in time order
+# and merge the streams, so the first results are found without materializing anyone's full agenda.
+#
+# Agendas are loaded on first use and kept current by session events on committed Appointment changes.
+# Changes made by other processes are picked up by the full refresh every AVAILABILITY_REFRESH_SECONDS.
+# Database reads run outside the engine lock, which is only held to swap results in and to search memory, so
+# lookups keep being answered from the current agendas while one thread reloads them.
+
+EPOCH = datetime(2000, 1, 1)
+MINUTES_PER_DAY = 24 * 60
+WEEKDAYS = {"mon": 0, "tue": 1, "wed": 2, "thu": 3, "fri": 4, "sat": 5, "sun": 6}
+# Appointments in these states no longer occupy the doctor
+FREE_STATUSES = {AppointmentStatus.CANCELLED}
+
+_hours_pattern = re.compile(r"^\s*(\w{3})(?:\s*-\s*(\w{3}))?\s+(\d{1,2}):(\d{2})\s*-\s*(\d{1,2}):(\d{2})\s*$")
+
+
+def to_minutes(value: datetime) -> int:
+    return (value - EPOCH) // timedelta(minutes=1)
+
+
+def from_minutes(value: int) -> datetime:
+    return EPOCH + timedelta(minutes=value)
+
+
+def to_local(value: datetime) -> datetime:
+    """Naive local time, like the stored appointment dates, of a datetime that may carry a timezone"""
+    return value.astimezone().replace(tzinfo=None) if value.tzinfo is not None else value
+
+
+def parse_operating_hours(value: str | None) -> list[list[tuple[int, int]]]:
+    """
+    Opening windows per weekday (Monday first) in minutes after midnight, from strings like
+    "Mon-Fri 8:00-20:00, Sat 8:00-14:00". Unreadable parts are skipped, so such a facility is simply closed.
+    """
+    week = [[] for _ in range(7)]
+    for part in (value or "").split(","):
+        match = _hours_pattern.match(part)
+        if not match or match.group(1).lower() not in WEEKDAYS or (match.group(2) or "mon").lower() not in WEEKDAYS:
+            continue
+        first = WEEKDAYS[match.group(1).lower()]
+        last = WEEKDAYS[match.group(2).lower()] if match.group(2) else first
+        opens = int(match.group(3)) * 60 + int(match.group(4))
+        closes = int(match.group(5)) * 60 + int(match.group(6))
+        if closes <= opens:
+            continue
+        for day in range(first, last + 1):
+            week[day].append((opens, closes))
+    for windows in week:
+        windows.sort()
+    return week
+
+
+class DoctorAgenda:
+    __slots__ = ("doctor_id", "first_name", "last_name", "speciality_id", "facility_ids", "busy", "version")
+
+    def __init__(self, doctor_id: int, first_name: str, last_name: str, speciality_id: int | None):
+        self.doctor_id = doctor_id
+        self.first_name = first_name
+        self.last_name = last_name
+        self.speciality_id = speciality_id
+        self.facility_ids: list[int] = []
+        self.busy: list[int] | None = None  # Appointment starts, None until loaded
+        self.version = 0  # Bumped by commits, a load that started before one is not kept
+
+    def free_slots(self, busy: list[int], hours: list[list[tuple[int, int]]], start: int, end: int, duration: int,
+                   step: int):
+        """Free slots within the windows of one facility as (start minute, doctor id) in time order"""
+        day = start // MINUTES_PER_DAY
+        while day * MINUTES_PER_DAY < end:
+            day_start = day * MINUTES_PER_DAY
+            for opens, closes in hours[(EPOCH.weekday() + day) % 7]:
+                window_start = day_start + opens
+                window_end = min(day_start + closes, end)
+                slot = window_start
+                if slot < start:
+                    slot += -(-(start - slot) // step) * step  # First slot on the grid at or after start
+                index = bisect_right(busy, slot - APPOINTMENT_MINUTES)
+                while slot + duration <= window_end:
+                    while index < len(busy) and busy[index] + APPOINTMENT_MINUTES <= slot:
+                        index += 1
+                    if index < len(busy) and busy[index] < slot + duration:
+                        # Jump to the first grid slot after the conflicting appointment
+                        free_from = busy[index] + APPOINTMENT_MINUTES
+                        slot += -(-(free_from - slot) // step) * step
+                        continue
+                    yield slot, self.doctor_id
+                    slot += step
+            day += 1
+
+
+class AvailabilityEngine:
+    def __init__(self, bind=engine, refresh_seconds: int = AVAILABILITY_REFRESH_SECONDS):
+        self.bind = bind
+        self.refresh_seconds = refresh_seconds
+        self._lock = threading.RLock()
+        self._refresh_lock = threading.Lock()  # Only one thread reloads the doctors at a time
+        self._agendas: dict[int, DoctorAgenda] = {}
+        self._facility_hours: dict[int, list[list[tuple[int, int]]]] = {}
+        self._loaded_at: float | None = None
+        self._generation = 0  # Bumped by invalidate, a refresh that started before it does not count as fresh
+        self._agendas_from = 0  # Appointments before this minute are not loaded, they cannot block future slots
+
+    def _is_fresh(self) -> bool:
+        return self._loaded_at is not None and time.monotonic() - self._loaded_at <= self.refresh_seconds
+
+    def _load_doctors(self):
+        with Session(self.bind) as db:
+            doctors = db.exec(select(Doctor.id, Doctor.first_name, Doctor.last_name, Doctor.speciality_id)).all()
+            links = db.exec(select(DoctorFacilityAssociation.doctor_id, DoctorFacilityAssociation.facility_id)).all()
+            facilities = db.exec(select(MedicalFacility.facility_id, MedicalFacility.operating_hours)).all()
+
+        agendas = {row.id: DoctorAgenda(row.id, row.first_name, row.last_name, row.speciality_id) for row in doctors}
+        for doctor_id, facility_id in links:
+            if doctor_id in agendas:
+                agendas[doctor_id].facility_ids.append(facility_id)
+        return agendas, {facility_id: parse_operating_hours(hours) for facility_id, hours in facilities}
+
+    def _load_busy(self, doctor_ids: list[int], agendas_from: int, chunk_size: int = 500) -> dict[int, list[int]]:
+        """Sorted appointment starts of the doctors from agendas_from on, read without holding the lock"""
+        busy = {doctor_id: [] for doctor_id in doctor_ids}
+        for offset in range(0, len(doctor_ids), chunk_size):
+            with Session(self.bind) as db:
+                rows = db.exec(select(Appointment.doctor_id, Appointment.date)
+                               .where(Appointment.doctor_id.in_(doctor_ids[offset:offset + chunk_size]),
+                                      Appointment.status.not_in(FREE_STATUSES),
+                                      Appointment.date >= from_minutes(agendas_from))).all()
+            for doctor_id, date in rows:
+                busy[doctor_id].append(to_minutes(date))
+        for starts in busy.values():
+            starts.sort()
+        return busy
+
+    def _ensure_loaded(self):
+        """Reload the doctors when stale. Called without the lock, other threads keep the current agendas meanwhile"""
+        if self._is_fresh():
+            return
+        # Without any agendas yet there is nothing to answer from, so then everyone waits for the first load
+        if not self._refresh_lock.acquire(blocking=self._loaded_at is None and not self._agendas):
+            return
+        try:
+            if self._is_fresh():
+                return
+            generation = self._generation
+            agendas_from = to_minutes(datetime.now()) - APPOINTMENT_MINUTES
+            agendas, facility_hours = self._load_doctors()
+            with self._lock:
+                self._agendas, self._facility_hours, self._agendas_from = agendas, facility_hours, agendas_from
+                if generation == self._generation:
+                    self._loaded_at = time.monotonic()
+        finally:
+            self._refresh_lock.release()
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = None
+            self._generation += 1
+
+    def facility_ids(self, doctor_id: int) -> list[int]:
+        self._ensure_loaded()
+        with self._lock:
+            agenda = self._agendas.get(doctor_id)
+            return list(agenda.facility_ids) if agenda else []
+
+    def doctor_facilities_open(self, doctor_id: int, start: datetime, duration: int = APPOINTMENT_MINUTES) -> list[int] | None:
+        """Facilities of the doctor that are open for the whole of [start, start + duration), None for unknown doctors"""
+        self._ensure_loaded()
+        with self._lock:
+            agenda = self._agendas.get(doctor_id)
+            if agenda is None:
+                return None
+            minute = to_minutes(start)
+            day, minute_of_day = divmod(minute, MINUTES_PER_DAY)
+            weekday = (EPOCH.weekday() + day) % 7
+            return [facility for facility in agenda.facility_ids
+                    if any(opens <= minute_of_day and minute_of_day + duration <= closes
+                           for opens, closes in self._facility_hours.get(facility, [[]] * 7)[weekday])]
+
+    def find_slots(self, start: datetime, end: datetime, duration: int = APPOINTMENT_MINUTES, limit: int = 10,
+                   speciality_id: int | None = None, facility_id: int | None = None,
+                   doctor_ids: list[int] | None = None) -> list[dict]:
+        """The earliest free slots of all matching doctors, ordered by start time, then doctor id"""
+        self._ensure_loaded()
+        with self._lock:
+            start_minute = max(to_minutes(start), to_minutes(datetime.now()))
+            end_minute = to_minutes(end)
+
+            candidates = [agenda for agenda in (self._agendas.values() if doctor_ids is None
+                                                else (self._agendas[i] for i in doctor_ids if i in self._agendas))
+                          if (speciality_id is None or agenda.speciality_id == speciality_id)
+                          and (facility_id is None or facility_id in agenda.facility_ids)]
+            versions = {agenda.doctor_id: agenda.version for agenda in candidates if agenda.busy is None}
+            agendas_from = self._agendas_from
+
+        loaded = self._load_busy(list(versions), agendas_from) if versions else {}
+
+        with self._lock:
+            # Kept unless a commit touched the doctor meanwhile, this search uses what was read either way
+            for agenda in candidates:
+                if agenda.busy is None and agenda.doctor_id in loaded and agenda.version == versions[agenda.doctor_id]:
+                    agenda.busy = loaded[agenda.doctor_id]
+
+            streams = []
+            for agenda in candidates:
+                busy = agenda.busy if agenda.busy is not None else loaded[agenda.doctor_id]
+                facilities = [facility_id] if facility_id is not None else agenda.facility_ids
+                for facility in facilities:
+                    hours = self._facility_hours.get(facility)
+                    if hours:
+                        stream = agenda.free_slots(busy, hours, start_minute, end_minute, duration, step=duration)
+                        streams.append(((slot, doctor_id, facility) for slot, doctor_id in stream))
+
+            results = []
+            seen = set()
+            for slot, doctor_id, facility in heapq.merge(*streams):
+                # A doctor working at two facilities with overlapping hours is still only free once
+                if (slot, doctor_id) in seen:
+                    continue
+                seen.add((slot, doctor_id))
+                agenda = self._agendas[doctor_id]
+                results.append({"doctor_id": doctor_id, "first_name": agenda.first_name,
+                                "last_name": agenda.last_name, "speciality_id": agenda.speciality_id,
+                                "facility_id": facility, "start": from_minutes(slot),
+                                "end": from_minutes(slot + duration)})
+                if len(results) >= limit:
+                    break
+            return results
+
+    def apply_changes(self, booked: list[tuple[int, datetime]], changed_doctors: set[int]):
+        """
+        Apply a commit: booked appointments are inserted into the loaded agendas. Agendas of doctors whose
+        appointments were updated or deleted are dropped and reloaded from the database when next searched.
+        """
+        with self._lock:
+            for doctor_id in changed_doctors:
+                agenda = self._agendas.get(doctor_id)
+                if agenda is not None:
+                    agenda.busy = None
+                    agenda.version += 1
+            for doctor_id, date in booked:
+                agenda = self._agendas.get(doctor_id)
+                if agenda is None or date is None:
+                    continue
+                if agenda.busy is None:
+                    agenda.version += 1  # A load in flight may have missed this booking
+                    continue
+                minute = to_minutes(date)
+                if minute >= self._agendas_from:
+                    insort(agenda.busy, minute)
+
+
+availability_engine = AvailabilityEngine()
+
+
+def _occupies(status) -> bool:
+    return status is not None and AppointmentStatus(status) not in FREE_STATUSES
+
+
+# Session events. Bookings are applied exactly, since inserting into a sorted list is cheap. For updates and
+# deletes the previous date and status may already be expired from the session, so the doctor is reloaded instead.
+
+def _changes(session) -> tuple[list, set]:
+    return session.info.setdefault("availability_changes", ([], set()))
+
+
+@event.listens_for(Session, "before_flush")
+def _collect_changed_doctors(session, flush_context, instances):
+    # Before the flush the rows still exist, so expired attributes of deleted appointments can be loaded
+    changed_doctors = _changes(session)[1]
+    for appointment in list(session.dirty) + list(session.deleted):
+        if isinstance(appointment, Appointment) and (appointment in session.deleted or session.is_modified(appointment)):
+            changed_doctors.add(appointment.doctor_id)
+            changed_doctors.update(inspect(appointment).attrs.doctor_id.history.deleted)
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_bookings(session, flush_context):
+    booked = _changes(session)[0]
+    for appointment in session.new:
+        if isinstance(appointment, Appointment) and _occupies(appointment.status):
+            booked.append((appointment.doctor_id, appointment.date))
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_appointment_changes(session):
+    booked, changed_doctors = session.info.pop("availability_changes", ([], set()))
+    if booked or changed_doctors:
+        availability_engine.apply_changes(booked, changed_doctors)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_appointment_changes(session):
+    session.info.pop("availability_changes", None)
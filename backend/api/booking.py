@@ -0,0 +1,125 @@
+import random
+import time
+from datetime import datetime, timedelta
+
+from fastapi import HTTPException
+from sqlalchemy import delete, event, inspect
+from sqlalchemy.exc import IntegrityError, OperationalError
+from sqlmodel import Session, select
+from starlette import status
+
+from api.availability import FREE_STATUSES, availability_engine, to_local
+from api.config import APPOINTMENT_MINUTES, BOOKING_RETRIES, BOOKING_RETRY_BACKOFF_MS
+from api.models import Appointment, AppointmentSlot, AppointmentStatus
+
+
+# Double bookings are prevented by the appointment_slot primary key (doctor_id, slot_start), not by locking:
+# concurrent bookings of one slot all try to insert it and the database lets exactly one commit. A conflict
+# is final and reported as 409. Only transient failures (SQLite busy, MySQL deadlock or lock timeout) are
+# retried, a bounded number of times with jittered backoff, so a hot slot can never make requests spin.
+#
+# Not every appointment has a slot: seed data, the admin and other ORM code insert appointments directly,
+# possibly off the grid or booked under a different APPOINTMENT_MINUTES. So after its own rows are written,
+# a booking also looks for any overlapping appointment of the doctor. On SQLite the write transaction
+# already holds the database write lock at that point, so no other booking can commit in between.
+
+slot_taken = HTTPException(status_code=status.HTTP_409_CONFLICT, detail="This slot is already booked")
+
+
+def _backoff(attempt: int):
+    time.sleep(random.uniform(0, BOOKING_RETRY_BACKOFF_MS * 2 ** attempt) / 1000)
+
+
+def validate_slot(doctor_id: int, start: datetime) -> list[int]:
+    """Facilities where the doctor can see the patient at start, raises HTTPException for unbookable slots"""
+    if start <= datetime.now():
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Appointments can only be booked in the future")
+    if start.second or start.microsecond or (start.hour * 60 + start.minute) % APPOINTMENT_MINUTES:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail=f"Appointments start on a {APPOINTMENT_MINUTES} minute grid")
+
+    facilities = availability_engine.doctor_facilities_open(doctor_id, start)
+    if facilities is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Doctor not found")
+    if not facilities:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="The doctor does not work at this time")
+    return facilities
+
+
+def overlapping_appointment(db: Session, doctor_id: int, start: datetime, exclude_id: int | None = None) -> int | None:
+    """Id of an appointment of the doctor that still occupies part of [start, start + APPOINTMENT_MINUTES)"""
+    duration = timedelta(minutes=APPOINTMENT_MINUTES)
+    return db.exec(select(Appointment.id)
+                   .where(Appointment.doctor_id == doctor_id, Appointment.id != exclude_id,
+                          Appointment.status.not_in(FREE_STATUSES),
+                          Appointment.date > start - duration, Appointment.date < start + duration)
+                   .limit(1)).first()
+
+
+def book_appointment(db: Session, patient_id: int, doctor_id: int, start: datetime, reason: str | None = None) -> dict:
+    start = to_local(start)
+    facilities = validate_slot(doctor_id, start)
+
+    for attempt in range(BOOKING_RETRIES + 1):
+        try:
+            # Most losers of a race are turned away by this read, without queueing for the database write lock
+            if db.get(AppointmentSlot, (doctor_id, start)) is not None:
+                raise slot_taken
+            appointment = Appointment(doctor_id=doctor_id, patient_id=patient_id, date=start, reason=reason or "",
+                                      treatment_plan="", diagnosis="", recommendations="",
+                                      status=AppointmentStatus.SCHEDULED)
+            db.add(appointment)
+            db.flush()
+            db.add(AppointmentSlot(doctor_id=doctor_id, slot_start=start, appointment_id=appointment.id))
+            db.flush()
+            if overlapping_appointment(db, doctor_id, start, appointment.id) is not None:
+                db.rollback()
+                raise slot_taken
+            db.commit()
+            return {"id": appointment.id, "doctor_id": doctor_id, "facility_ids": facilities, "start": start,
+                    "end": start + timedelta(minutes=APPOINTMENT_MINUTES), "status": AppointmentStatus.SCHEDULED}
+        except IntegrityError:
+            db.rollback()
+            raise slot_taken
+        except OperationalError:
+            db.rollback()
+            if attempt == BOOKING_RETRIES:
+                raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                                    detail="Booking is busy, please try again", headers={"Retry-After": "1"})
+            _backoff(attempt)
+
+
+def cancel_appointment(db: Session, patient_id: int, appointment_id: int):
+    """Cancel a scheduled appointment of the patient and release its slot"""
+    for attempt in range(BOOKING_RETRIES + 1):
+        try:
+            appointment = db.get(Appointment, appointment_id)
+            if appointment is None or appointment.patient_id != patient_id:
+                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Appointment not found")
+            if appointment.status != AppointmentStatus.SCHEDULED:
+                raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Only scheduled appointments can be cancelled")
+
+            appointment.status = AppointmentStatus.CANCELLED  # Its slot is released by _release_slots
+            db.commit()
+            return
+        except OperationalError:
+            db.rollback()
+            if attempt == BOOKING_RETRIES:
+                raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                                    detail="Booking is busy, please try again", headers={"Retry-After": "1"})
+            _backoff(attempt)
+
+
+@event.listens_for(Session, "before_flush")
+def _release_slots(session, flush_context, instances):
+    # Whichever code cancels, moves or deletes an appointment, its slot is freed in the same transaction
+    released = [appointment.id for appointment in session.deleted if isinstance(appointment, Appointment)]
+    for appointment in session.dirty:
+        if not isinstance(appointment, Appointment) or not session.is_modified(appointment):
+            continue
+        attributes = inspect(appointment).attrs
+        if attributes.date.history.added or \
+                attributes.status.history.added and AppointmentStatus(appointment.status) in FREE_STATUSES:
+            released.append(appointment.id)
+    if released:
+        session.execute(delete(AppointmentSlot).where(AppointmentSlot.appointment_id.in_(released)))
@@ -0,0 +1,64 @@
+# Benchmarks Argon2 on this host and prints the hashing parameters that hit a target verify latency.
+#
+#   python -m api.calibrate_hashing --target-ms 500 --memory-mb 64
+#
+# Put the printed HASH_* lines into backend/.env. Existing hashes are upgraded on the next login.
+
+import argparse
+import os
+import statistics
+import time
+
+from api.security import build_pwd_context
+
+
+def measure_verify(time_cost: int, memory_cost: int, parallelism: int, rounds: int) -> float:
+    """Median verify time in seconds for the given parameters"""
+    context = build_pwd_context(time_cost=time_cost, memory_cost=memory_cost, parallelism=parallelism)
+    hashed = context.hash("calibration-password")
+
+    samples = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        context.verify("calibration-password", hashed)
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+
+def calibrate(target_ms: float, memory_mb: int, parallelism: int, rounds: int = 3, max_time_cost: int = 100) -> dict:
+    memory_cost = memory_mb * 1024
+    target = target_ms / 1000
+
+    # Argon2 time scales linearly with time_cost, so estimate from a single pass and refine around the guess
+    single_pass = measure_verify(1, memory_cost, parallelism, rounds)
+    time_cost = max(1, min(max_time_cost, round(target / single_pass)))
+    elapsed = measure_verify(time_cost, memory_cost, parallelism, rounds)
+
+    while elapsed < target and time_cost < max_time_cost:
+        time_cost += 1
+        elapsed = measure_verify(time_cost, memory_cost, parallelism, rounds)
+    while elapsed > target * 1.25 and time_cost > 1:
+        time_cost -= 1
+        elapsed = measure_verify(time_cost, memory_cost, parallelism, rounds)
+
+    return {"time_cost": time_cost, "memory_cost": memory_cost, "parallelism": parallelism, "verify_ms": elapsed * 1000}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pick Argon2 parameters that hit a target verify latency on this host")
+    parser.add_argument("--target-ms", type=float, default=500, help="Desired verify latency in milliseconds")
+    parser.add_argument("--memory-mb", type=int, default=64, help="Memory used by a single hash")
+    parser.add_argument("--parallelism", type=int, default=min(4, os.cpu_count() or 1), help="Argon2 lanes")
+    parser.add_argument("--rounds", type=int, default=3, help="Measurements per candidate")
+    args = parser.parse_args()
+
+    result = calibrate(args.target_ms, args.memory_mb, args.parallelism, args.rounds)
+
+    print(f"# Measured verify latency: {result['verify_ms']:.0f} ms")
+    print(f"HASH_TIME_COST={result['time_cost']}")
+    print(f"HASH_MEMORY_COST={result['memory_cost']}")
+    print(f"HASH_PARALLELISM={result['parallelism']}")
+
+
+if __name__ == "__main__":
+    main()
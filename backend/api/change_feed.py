@@ -0,0 +1,257 @@
+import asyncio
+import json
+import threading
+import uuid
+from collections import deque
+
+from fastapi import APIRouter, Depends, Header, HTTPException, WebSocket, WebSocketDisconnect, WebSocketException
+from fastapi.responses import StreamingResponse
+from sqlalchemy import event, inspect
+from sqlmodel import Session
+from starlette import status
+from starlette.concurrency import run_in_threadpool
+
+from api.availability import availability_engine
+from api.config import CHANGE_FEED_HISTORY, CHANGE_FEED_HEARTBEAT_SECONDS
+from api.database import engine
+from api.functions import get_my_info
+from api.models import Appointment, AppointmentStatus, Doctor, MedicalFacility
+from api.security import verify_token
+
+
+# Appointment change feed. Committed bookings and status changes are published to an in-process broker under
+# "doctor:<id>" and "facility:<id>" topics, and pushed to subscribers over SSE or WebSocket.
+#
+# Every topic keeps its last CHANGE_FEED_HISTORY events in a ring, each with a sequence number. Event ids are
+# "<epoch>:<seq>" where the epoch identifies this broker instance, so a client can resume after a reconnect
+# by sending the last id it saw. When that is no longer possible (the events fell out of the ring, or the
+# worker restarted) the client gets a "reset" event and should reload /doctor/appointments.
+#
+# An idle subscriber is one suspended coroutine and one future, events are serialized once per publish and
+# shared by every subscriber. Like the availability agendas, the broker only sees commits of its own process.
+# Subscriptions are only accepted for existing doctors and facilities, so there is at most one topic for each.
+
+class Topic:
+    __slots__ = ("seq", "events", "waiters")
+
+    def __init__(self, history: int):
+        self.seq = 0
+        self.events: deque[tuple[int, str]] = deque(maxlen=history)  # (seq, JSON)
+        self.waiters: set[tuple[asyncio.AbstractEventLoop, asyncio.Future]] = set()
+
+
+def _wake(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
+
+
+class ChangeBroker:
+    def __init__(self, history: int = CHANGE_FEED_HISTORY):
+        if history < 1:
+            raise ValueError("CHANGE_FEED_HISTORY must be at least 1, resuming subscribers need the last event")
+        self.history = history
+        self.epoch = uuid.uuid4().hex[:8]
+        self.published = 0
+        self._topics: dict[str, Topic] = {}
+        self._lock = threading.Lock()
+
+    def _topic(self, name: str) -> Topic:
+        topic = self._topics.get(name)
+        if topic is None:
+            topic = self._topics[name] = Topic(self.history)
+        return topic
+
+    def publish(self, name: str, payload: dict):
+        """Append an event to a topic and wake its subscribers, safe to call from any thread"""
+        with self._lock:
+            topic = self._topic(name)
+            topic.seq += 1
+            data = json.dumps({"id": f"{self.epoch}:{topic.seq}", "topic": name, **payload}, default=str)
+            topic.events.append((topic.seq, data))
+            waiters, topic.waiters = topic.waiters, set()
+            self.published += 1
+        for loop, future in waiters:
+            loop.call_soon_threadsafe(_wake, future)
+
+    def resume(self, name: str, last_event_id: str | None) -> tuple[int, bool]:
+        """Cursor to continue from after last_event_id, and whether events in between were lost"""
+        with self._lock:
+            current = self._topic(name).seq
+        if not last_event_id:
+            return current, False
+        epoch, _, seq = last_event_id.partition(":")
+        if epoch != self.epoch or not seq.isdigit() or int(seq) > current:
+            return current, True
+        return int(seq), False
+
+    def read(self, name: str, cursor: int) -> tuple[list[tuple[int, str]], bool]:
+        """Events after cursor, and whether some of them already fell out of the ring"""
+        with self._lock:
+            topic = self._topic(name)
+            if topic.seq <= cursor:
+                return [], False
+            first = topic.events[0][0]
+            gap = cursor < first - 1
+            return list(topic.events)[max(0, cursor - first + 1):], gap
+
+    async def wait(self, name: str, cursor: int, timeout: float) -> bool:
+        """Wait until the topic has events after cursor, False on timeout"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        waiter = (loop, future)
+        with self._lock:
+            topic = self._topic(name)
+            if topic.seq > cursor:
+                return True
+            topic.waiters.add(waiter)
+        try:
+            await asyncio.wait_for(future, timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            with self._lock:
+                topic.waiters.discard(waiter)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"epoch": self.epoch, "topics": len(self._topics), "published": self.published,
+                    "subscribers": sum(len(topic.waiters) for topic in self._topics.values())}
+
+
+change_broker = ChangeBroker()
+
+
+def _value(value):
+    return value.value if isinstance(value, AppointmentStatus) else value
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_appointment_events(session, flush_context):
+    events = session.info.setdefault("change_feed_events", [])
+    for appointment in session.new:
+        if isinstance(appointment, Appointment):
+            events.append({"type": "booked", "appointment_id": appointment.id, "doctor_id": appointment.doctor_id,
+                           "date": appointment.date, "status": _value(appointment.status)})
+    for appointment in session.dirty:
+        if not isinstance(appointment, Appointment) or not session.is_modified(appointment):
+            continue
+        state = inspect(appointment)
+        for attribute, event_type in (("status", "status_changed"), ("date", "rescheduled")):
+            history = state.attrs[attribute].history
+            if history.added:
+                events.append({"type": event_type, "appointment_id": appointment.id,
+                               "doctor_id": appointment.doctor_id, "date": appointment.date,
+                               "status": _value(appointment.status),
+                               f"previous_{attribute}": _value(history.deleted[0]) if history.deleted else None})
+    for appointment in session.deleted:
+        if isinstance(appointment, Appointment):
+            events.append({"type": "deleted", "appointment_id": appointment.id,
+                           "doctor_id": inspect(appointment).dict.get("doctor_id")})
+
+
+@event.listens_for(Session, "after_commit")
+def _commit_appointment_events(session):
+    session.info.setdefault("change_feed_committed", []).extend(session.info.pop("change_feed_events", []))
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _publish_appointment_events(session, transaction):
+    # Published once the transaction is over: the facility lookup may reload the agendas, and until then a
+    # SQLite production session still holds sqlite_writer_lock (api.database releases it in its own, earlier
+    # registered after_transaction_end listener)
+    if transaction.parent is not None:
+        return
+    for payload in session.info.pop("change_feed_committed", []):
+        doctor_id = payload["doctor_id"]
+        if doctor_id is None:
+            continue
+        change_broker.publish(f"doctor:{doctor_id}", payload)
+        for facility_id in availability_engine.facility_ids(doctor_id):
+            change_broker.publish(f"facility:{facility_id}", payload)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_appointment_events(session):
+    session.info.pop("change_feed_events", None)
+
+
+def subscription_topic(payload: dict, doctor_id: int | None, facility_id: int | None) -> str:
+    """
+    Topic for the subscription, admins may follow any doctor or facility, doctors themselves and their facilities.
+    Runs queries on a sync session, async routes call it through run_in_threadpool.
+    """
+    if (doctor_id is None) == (facility_id is None):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Pass exactly one of doctor_id, facility_id")
+    if payload.get("type") not in ("Doctor", "Admin"):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Only doctors and admins can subscribe")
+
+    # Own short session, a long lived connection must not keep a pooled database connection
+    with Session(engine) as db:
+        if payload["type"] == "Doctor":
+            doctor = get_my_info(payload, db)["doctor"]
+            if doctor_id is not None and doctor_id != doctor.id or \
+                    facility_id is not None and facility_id not in availability_engine.facility_ids(doctor.id):
+                raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not allowed to follow this agenda")
+        elif (db.get(Doctor, doctor_id) if doctor_id is not None else db.get(MedicalFacility, facility_id)) is None:
+            # Every subscription creates a topic, unknown ids would let the broker grow without bound
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Doctor or facility not found")
+
+    return f"doctor:{doctor_id}" if doctor_id is not None else f"facility:{facility_id}"
+
+
+async def feed_events(topic: str, last_event_id: str | None, heartbeat: float = CHANGE_FEED_HEARTBEAT_SECONDS):
+    """(event id, JSON) of every event of the topic, or None after heartbeat seconds without any"""
+    cursor, lost = change_broker.resume(topic, last_event_id)
+    if lost:
+        yield None, json.dumps({"type": "reset", "topic": topic})
+    while True:
+        events, lost = change_broker.read(topic, cursor)
+        if lost:
+            yield None, json.dumps({"type": "reset", "topic": topic})
+        for seq, data in events:
+            cursor = seq
+            yield f"{change_broker.epoch}:{seq}", data
+        if not events and not await change_broker.wait(topic, cursor, heartbeat):
+            yield None
+
+
+feed_router = APIRouter()
+
+
+@feed_router.get("/appointments", tags=["feed"])
+async def appointment_events(doctor_id: int | None = None, facility_id: int | None = None, since: str | None = None,
+                             last_event_id: str | None = Header(None), payload: dict = Depends(verify_token)):
+    """
+    Server-Sent Events stream of booked, rescheduled and cancelled appointments of one doctor or facility.
+    Reconnecting browsers resume automatically through Last-Event-ID, other clients can pass since=<id>.
+    """
+    topic = await run_in_threadpool(subscription_topic, payload, doctor_id, facility_id)
+
+    async def stream():
+        yield "retry: 3000\n\n"
+        async for item in feed_events(topic, last_event_id or since):
+            if item is None:
+                yield ": keepalive\n\n"
+            else:
+                event_id, data = item
+                yield (f"id: {event_id}\n" if event_id else "") + f"data: {data}\n\n"
+
+    return StreamingResponse(stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@feed_router.websocket("/appointments/ws")
+async def appointment_events_ws(websocket: WebSocket, doctor_id: int | None = None, facility_id: int | None = None,
+                                since: str | None = None, payload: dict = Depends(verify_token)):
+    """The same events as JSON messages over a WebSocket, heartbeats are {"type": "heartbeat"}"""
+    try:
+        topic = await run_in_threadpool(subscription_topic, payload, doctor_id, facility_id)
+    except HTTPException as e:
+        raise WebSocketException(code=status.WS_1008_POLICY_VIOLATION, reason=e.detail)
+    await websocket.accept()
+    try:
+        async for item in feed_events(topic, since):
+            await websocket.send_text(item[1] if item is not None else '{"type": "heartbeat"}')
+    except (WebSocketDisconnect, RuntimeError):
+        pass  # The client went away, noticed on the next send at the latest
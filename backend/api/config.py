@@ -0,0 +1,122 @@
+import os
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    if value is None or value == "":
+        return default
+    return int(value)
+
+
+def _env_float(name: str, default: float) -> float:
+    value = os.getenv(name)
+    if value is None or value == "":
+        return default
+    return float(value)
+
+
+def _total_memory_mb() -> int:
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") // (1024 * 1024)
+    except (ValueError, OSError, AttributeError):
+        return 2048
+
+
+# Password hashing executor
+# HASH_WORKERS=0 disables the process pool and hashes inline on the request thread
+HASH_WORKERS = _env_int("HASH_WORKERS", -1)  # -1 = size automatically from cores and memory
+HASH_QUEUE_SIZE = _env_int("HASH_QUEUE_SIZE", 16)  # Requests allowed to wait for a free worker
+HASH_MEMORY_BUDGET_MB = _env_int("HASH_MEMORY_BUDGET_MB", _total_memory_mb() // 2)
+
+# Password hashing cost, see HASH_PROFILES in api/security.py
+# The HASH_TIME_COST / HASH_MEMORY_COST / HASH_PARALLELISM overrides are printed by api/calibrate_hashing.py
+HASH_PROFILE = os.getenv("HASH_PROFILE", "production")
+HASH_TIME_COST = _env_int("HASH_TIME_COST", 0)
+HASH_MEMORY_COST = _env_int("HASH_MEMORY_COST", 0)  # KiB
+HASH_PARALLELISM = _env_int("HASH_PARALLELISM", 0)
+
+# Verified JWT payload cache
+TOKEN_CACHE_SIZE = _env_int("TOKEN_CACHE_SIZE", 10000)
+# Seconds a cached payload is trusted before the token is checked against the shared revocation table again,
+# the longest a logout on one worker takes to reach the others
+TOKEN_REVOCATION_CHECK_SECONDS = _env_int("TOKEN_REVOCATION_CHECK_SECONDS", 30)
+
+# Principal (current user) cache used by get_my_info
+PRINCIPAL_CACHE_TTL = _env_int("PRINCIPAL_CACHE_TTL", 30)  # Seconds, 0 disables the cache
+PRINCIPAL_CACHE_SIZE = _env_int("PRINCIPAL_CACHE_SIZE", 10000)
+
+# Database
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///orm.db")
+# Async driver URL, derived from DATABASE_URL when not set (aiosqlite for SQLite, aiomysql for MySQL)
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL", "")
+DB_POOL_SIZE = _env_int("DB_POOL_SIZE", 5)
+DB_MAX_OVERFLOW = _env_int("DB_MAX_OVERFLOW", 10)
+DB_POOL_TIMEOUT = _env_int("DB_POOL_TIMEOUT", 30)  # Seconds to wait for a free connection
+DB_POOL_RECYCLE = _env_int("DB_POOL_RECYCLE", 1800)  # Seconds, reconnect before the server drops idle connections
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1") == "1"
+
+# SQLite production profile: WAL journal, tuned pragmas and serialized writers
+SQLITE_PRODUCTION = os.getenv("SQLITE_PRODUCTION", "0") == "1"
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")  # NORMAL is durable enough with WAL
+SQLITE_CACHE_SIZE_MB = _env_int("SQLITE_CACHE_SIZE_MB", 64)  # Page cache per connection
+SQLITE_MMAP_SIZE_MB = _env_int("SQLITE_MMAP_SIZE_MB", 256)
+SQLITE_BUSY_TIMEOUT_MS = _env_int("SQLITE_BUSY_TIMEOUT_MS", 5000)  # Wait for writers in other processes
+
+# Admin list endpoints (keyset pagination)
+ADMIN_PAGE_SIZE = _env_int("ADMIN_PAGE_SIZE", 100)
+ADMIN_PAGE_SIZE_MAX = _env_int("ADMIN_PAGE_SIZE_MAX", 1000)
+
+# Streaming exports, rows fetched from the database cursor per chunk
+EXPORT_CHUNK_SIZE = _env_int("EXPORT_CHUNK_SIZE", 1000)
+
+# Bulk patient import
+IMPORT_CHUNK_SIZE = _env_int("IMPORT_CHUNK_SIZE", 500)  # Rows hashed and inserted per transaction
+IMPORT_MAX_JOBS = _env_int("IMPORT_MAX_JOBS", 100)  # Import jobs kept in memory for status and downloads
+
+# Request metrics served at /metrics in the Prometheus text format
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+
+# Per-request SQL statistics
+DB_DEBUG_HEADERS = os.getenv("DB_DEBUG_HEADERS", "0") == "1"  # Add X-DB-Queries / X-DB-Time to every response
+N_PLUS_ONE_THRESHOLD = _env_int("N_PLUS_ONE_THRESHOLD", 5)  # Executions of one statement shape per request to warn about
+
+# Weak password index, see api/password_index.py. Built from the wordlist on first use when missing
+WEAK_PASSWORD_INDEX = os.getenv("WEAK_PASSWORD_INDEX", "api/weak_passwords.idx")
+WEAK_PASSWORD_WORDLIST = os.getenv("WEAK_PASSWORD_WORDLIST", "api/wordlist_pl.txt")
+
+# JWT signing keys, read on first use
+JWT_PRIVATE_KEY_PATH = os.getenv("JWT_PRIVATE_KEY_PATH", "DEV_private_key.pem")
+JWT_PUBLIC_KEY_PATH = os.getenv("JWT_PUBLIC_KEY_PATH", "DEV_public_key.pem")
+
+# Free slot search, see api/availability.py
+APPOINTMENT_MINUTES = _env_int("APPOINTMENT_MINUTES", 20)  # Length of one appointment
+AVAILABILITY_REFRESH_SECONDS = _env_int("AVAILABILITY_REFRESH_SECONDS", 60)  # Full reload, picks up other workers' writes
+AVAILABILITY_MAX_DAYS = _env_int("AVAILABILITY_MAX_DAYS", 31)  # Longest range one search may cover
+
+# Appointment booking, see api/booking.py
+BOOKING_RETRIES = _env_int("BOOKING_RETRIES", 3)  # Attempts after the first when the database is busy (locked, deadlock)
+BOOKING_RETRY_BACKOFF_MS = _env_int("BOOKING_RETRY_BACKOFF_MS", 20)  # Base of the jittered exponential backoff
+
+# Appointment change feed (SSE / WebSocket), see api/change_feed.py
+CHANGE_FEED_HISTORY = _env_int("CHANGE_FEED_HISTORY", 1000)  # Events kept per topic for resuming subscribers
+CHANGE_FEED_HEARTBEAT_SECONDS = _env_int("CHANGE_FEED_HEARTBEAT_SECONDS", 15)  # Keeps idle connections open through proxies
+
+# Live appointment transcription (WebSocket audio ingestion), see api/transcription.py
+STT_ENGINE = os.getenv("STT_ENGINE", "stub")  # Name of a registered engine, "stub" is local and deterministic
+STT_LANGUAGE = os.getenv("STT_LANGUAGE", "pl-PL")
+STT_SAMPLE_RATE = _env_int("STT_SAMPLE_RATE", 16000)  # Clients send 16 bit little endian mono PCM at this rate
+STT_BUFFER_MS = _env_int("STT_BUFFER_MS", 5000)  # Audio buffered per session before the client is slowed down
+STT_MAX_SESSIONS = _env_int("STT_MAX_SESSIONS", 200)  # Concurrent sessions per worker, more are refused with 1013
+
+# Voice activity detection before the STT engine, see api/vad.py. Only speech spans are sent to the engine
+VAD_ENABLED = os.getenv("VAD_ENABLED", "1") == "1"
+VAD_FRAME_MS = _env_int("VAD_FRAME_MS", 20)
+VAD_ENERGY_DB = _env_float("VAD_ENERGY_DB", -45.0)  # Frame RMS level in dBFS a speech frame has to exceed
+VAD_ZCR_MAX = _env_float("VAD_ZCR_MAX", 0.35)  # Zero crossings per sample above which a quiet frame is noise (hiss)
+VAD_LOUD_DB = _env_float("VAD_LOUD_DB", 15.0)  # Frames this far above VAD_ENERGY_DB are speech whatever their ZCR
+VAD_MIN_SPEECH_MS = _env_int("VAD_MIN_SPEECH_MS", 60)  # Shorter bursts (keyboard clicks) are dropped
+VAD_HANGOVER_MS = _env_int("VAD_HANGOVER_MS", 300)  # Audio kept after speech, so word endings and short pauses survive
+
+# Transcript store, see api/transcripts.py
+TRANSCRIPT_BLOCK_SEGMENTS = _env_int("TRANSCRIPT_BLOCK_SEGMENTS", 8)  # Final segments per block written during a session
+TRANSCRIPT_COMPACT_SEGMENTS = _env_int("TRANSCRIPT_COMPACT_SEGMENTS", 128)  # Segments per block after compaction
@@ -1,12 +1,192 @@
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
 from datetime import datetime
 from typing import Optional
 
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
 from sqlmodel import create_engine, Session, SQLModel
+from sqlmodel.ext.asyncio.session import AsyncSession
 
+from api.config import (DATABASE_URL, ASYNC_DATABASE_URL, DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT,
+                        DB_POOL_RECYCLE, DB_POOL_PRE_PING, SQLITE_PRODUCTION, SQLITE_SYNCHRONOUS,
+                        SQLITE_CACHE_SIZE_MB, SQLITE_MMAP_SIZE_MB, SQLITE_BUSY_TIMEOUT_MS, N_PLUS_ONE_THRESHOLD)
 from api.models import *
 
-DATABASE_URL = "sqlite:///orm.db"
-engine = create_engine(DATABASE_URL)
+# Sync drivers and their async counterparts
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "sqlite+pysqlite": "sqlite+aiosqlite",
+    "mysql": "mysql+aiomysql",
+    "mysql+mysqlconnector": "mysql+aiomysql",
+    "mysql+pymysql": "mysql+aiomysql",
+}
+
+
+def to_async_url(url: str) -> str:
+    scheme, separator, rest = url.partition("://")
+    if scheme not in ASYNC_DRIVERS:
+        raise ValueError(f"No async driver known for '{scheme}', set ASYNC_DATABASE_URL explicitly")
+    return ASYNC_DRIVERS[scheme] + separator + rest
+
+
+def pool_options(url: str, pool_class) -> dict:
+    # In-memory SQLite lives inside a single connection, the dialect default (StaticPool) has to stay
+    if url.startswith("sqlite") and (":memory:" in url or url.rstrip("/").endswith(":")):
+        return {}
+
+    return {"poolclass": pool_class,
+            "pool_size": DB_POOL_SIZE,
+            "max_overflow": DB_MAX_OVERFLOW,
+            "pool_timeout": DB_POOL_TIMEOUT,
+            "pool_recycle": DB_POOL_RECYCLE,
+            "pool_pre_ping": DB_POOL_PRE_PING}
+
+
+engine = create_engine(DATABASE_URL, **pool_options(DATABASE_URL, QueuePool))
+
+# Async engine for routes that have been migrated to `async def` + get_async_db, both engines share the database
+async_database_url = ASYNC_DATABASE_URL or to_async_url(DATABASE_URL)
+async_engine = create_async_engine(async_database_url, **pool_options(async_database_url, AsyncAdaptedQueuePool))
+
+
+# SQLite allows a single writer at a time. In production mode every connection switches to WAL, so readers
+# never wait for the writer, and write transactions of this process queue up on sqlite_writer_lock instead of
+# failing with "database is locked". Writers in other processes are covered by busy_timeout.
+#
+# The lock is held from a session's first write until its transaction ends, and it is not reentrant: while
+# one session of a thread has written, that thread must not write through another session (in an event hook
+# or a helper opening its own Session), it would wait for itself forever. Such a write raises RuntimeError.
+# The lock is a plain Lock rather than an RLock because a transaction may end on another thread than the one
+# that started it, e.g. the teardown of the get_db dependency.
+sqlite_writer_lock = threading.Lock()
+_sqlite_writer_thread: int | None = None  # Thread whose session holds sqlite_writer_lock
+_serialized_engines = set()
+
+
+def apply_sqlite_pragmas(dbapi_connection, connection_record=None):
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+    cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_MB * 1024}")  # Negative value = size in KiB
+    cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE_MB * 1024 * 1024}")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
+
+
+def enable_sqlite_production_mode(target_engine):
+    """Apply the production pragmas to every new connection and serialize write transactions of sync sessions"""
+    event.listen(target_engine, "connect", apply_sqlite_pragmas)
+    _serialized_engines.add(target_engine)
+
+
+def _acquire_sqlite_writer(session):
+    # pysqlite only opens a transaction on the first write statement, so holding the lock from the first
+    # flush until the transaction ends covers exactly the time the database write lock is held
+    global _sqlite_writer_thread
+    if session.info.get("sqlite_writer") or session.bind not in _serialized_engines:
+        return
+    if _sqlite_writer_thread == threading.get_ident():
+        raise RuntimeError("A session of this thread already holds the SQLite writer lock, writing through a "
+                           "second session before its transaction ends would deadlock")
+    sqlite_writer_lock.acquire()
+    _sqlite_writer_thread = threading.get_ident()
+    session.info["sqlite_writer"] = True
+
+
+@event.listens_for(Session, "before_flush")
+def _serialize_flush(session, flush_context, instances):
+    _acquire_sqlite_writer(session)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _serialize_dml(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        _acquire_sqlite_writer(orm_execute_state.session)
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _release_sqlite_writer(session, transaction):
+    global _sqlite_writer_thread
+    if transaction.parent is None and session.info.pop("sqlite_writer", False):
+        _sqlite_writer_thread = None
+        sqlite_writer_lock.release()
+
+
+if SQLITE_PRODUCTION and DATABASE_URL.startswith("sqlite"):
+    enable_sqlite_production_mode(engine)
+    # Async sessions must not block the event loop on the lock, they only get the pragmas and busy_timeout
+    event.listen(async_engine.sync_engine, "connect", apply_sqlite_pragmas)
+
+
+# Per-request statement statistics. The middleware in api/metrics.py opens a QueryStats for every request and
+# the cursor events below fill whichever one is active in the current context. Sync endpoints run on worker
+# threads, which get a copy of the request context, so they report into the same object.
+_literal_pattern = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_in_list_pattern = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)|\(\s*%s(?:\s*,\s*%s)+\s*\)")
+
+
+def statement_shape(statement: str) -> str:
+    """Statement text with literals and expanded IN lists collapsed, equal for every execution of one query"""
+    shape = _literal_pattern.sub("?", statement)
+    shape = _in_list_pattern.sub("(?)", shape)
+    return " ".join(shape.split())
+
+
+class QueryStats:
+    def __init__(self):
+        self.count = 0
+        self.total_time = 0.0
+        self.shapes = Counter()
+
+    def record(self, statement: str, elapsed: float):
+        self.count += 1
+        self.total_time += elapsed
+        self.shapes[statement_shape(statement)] += 1
+
+    def repeated(self, threshold: int = N_PLUS_ONE_THRESHOLD) -> list[tuple[str, int]]:
+        """Statement shapes executed at least threshold times, the usual sign of a lazy load inside a loop"""
+        return [(shape, count) for shape, count in self.shapes.most_common() if count >= threshold]
+
+
+query_stats: ContextVar[Optional[QueryStats]] = ContextVar("query_stats", default=None)
+
+
+@contextmanager
+def track_queries():
+    stats = QueryStats()
+    token = query_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        query_stats.reset(token)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if query_stats.get() is not None:
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = query_stats.get()
+    if stats is not None and conn.info.get("query_start"):
+        stats.record(statement, time.perf_counter() - conn.info["query_start"].pop())
+
+
+def instrument_engine(target_engine):
+    event.listen(target_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(target_engine, "after_cursor_execute", _after_cursor_execute)
+
+
+instrument_engine(engine)
+instrument_engine(async_engine.sync_engine)
+
 
 def init_db():
     SQLModel.metadata.create_all(engine)
@@ -15,5 +195,10 @@ def get_db():
     with Session(engine) as session:
         yield session
 
+async def get_async_db():
+    # Objects must stay readable after commit without an implicit (and in async code, forbidden) refresh
+    async with AsyncSession(async_engine, expire_on_commit=False) as session:
+        yield session
+
 def drop_db():
     SQLModel.metadata.drop_all(engine)
@@ -1,7 +1,7 @@
 from datetime import timedelta, date
 from typing import Union
 
-from fastapi import APIRouter, Depends, Query, Body
+from fastapi import APIRouter, Depends, Query, Body, Request
 from sqlmodel import Session, select
 
 from api.functions import *
@@ -9,6 +9,8 @@ from api.models import *
 from api.database import get_db
 from api.security import credentials_exception
 from api.schemas import *
+from api.responses import typed_response
+from api.etags import table_key, doctor_appointments_key, current_etag, is_not_modified, not_modified, etag_headers
 
 
 doctor_router = APIRouter()
@@ -19,6 +21,7 @@ doctor_router = APIRouter()
 
 @doctor_router.get("/appointments", tags=["doctor"], response_model=List[AppointmentWithPatient])
 def get_my_appointments(
+                        request: Request,
                         start_date: Optional[date] = Query(None, description="Start date of the range"),
                         end_date: Optional[date] = Query(None, description="End date of the range"),
                         appointment_status: Optional[Union[AppointmentStatus, str]] = Query(None, description="Status of the queried appointments"),
@@ -80,22 +83,30 @@ def get_my_appointments(
     end_date = end_date or (today + timedelta(days=90))  # 3 months ago
     appointment_status = appointment_status or AppointmentStatus.SCHEDULED
 
+    # The agenda shows patient names, so patient changes count as well
+    etag = current_etag(db, [doctor_appointments_key(payload["doctor"].id), table_key("patient")],
+                        start_date, end_date, appointment_status)
+    if is_not_modified(request, etag):
+        return not_modified(etag)
 
-    query = select(Appointment)
+    # One joined query with only the columns the response needs, instead of a Patient lazy load per appointment
+    query = (select(Appointment.date, Appointment.reason, Appointment.diagnosis, Appointment.status,
+                    Patient.first_name, Patient.middle_name, Patient.last_name, Patient.gender)
+             .join(Patient, Patient.id == Appointment.patient_id))
     query = query.where(Appointment.doctor_id == payload["doctor"].id )
     query = query.where(Appointment.date >= start_date)
     query = query.where(Appointment.date <= end_date)
     if appointment_status != "Any":
         query = query.where(Appointment.status == appointment_status)
+    query = query.order_by(Appointment.date)
 
-    appointments = db.exec(query).fetchall()
-
-    output = appointments
-
-
-    for appointment in output:
-        appointment.patient = appointment.patient
-
-    return output
+    rows = db.exec(query).all()
 
+    output = [
+        AppointmentWithPatient(date=row.date, reason=row.reason, diagnosis=row.diagnosis, status=row.status,
+                               patient=PatientStripped(first_name=row.first_name, middle_name=row.middle_name,
+                                                       last_name=row.last_name, gender=row.gender))
+        for row in rows
+    ]
 
+    return typed_response(output, headers=etag_headers(etag))
@@ -0,0 +1,97 @@
+import hashlib
+
+from fastapi import Request
+from fastapi.responses import Response
+from sqlalchemy import event, inspect, insert, update
+from sqlmodel import Session, select
+
+from api.models import Appointment, ChangeStamp
+
+
+# Conditional GET. Every cached resource depends on a few change stamps: version counters in the change_stamp
+# table that are incremented in the same transaction as the change, so every worker sees the same versions.
+# The ETag is a hash of those versions and the request parameters. Checking If-None-Match costs one primary
+# key lookup, and when it matches the endpoint answers 304 before running its own query.
+#
+# Keys are "table:<name>" for reference data and "doctor_appointments:<doctor id>" for one doctor's agenda.
+# Writes that bypass the ORM session (Core bulk inserts, migrations) do not bump anything.
+
+TRACKED_TABLES = {"user", "patient", "doctor", "doctor_speciality", "medical_facility", "doctor_facility_association"}
+CACHE_CONTROL = "private, no-cache"  # Clients may store responses but have to revalidate every time
+
+
+def table_key(table: str) -> str:
+    return f"table:{table}"
+
+
+def doctor_appointments_key(doctor_id: int) -> str:
+    return f"doctor_appointments:{doctor_id}"
+
+
+def stamps_query(keys: list[str]):
+    return select(ChangeStamp.key, ChangeStamp.version).where(ChangeStamp.key.in_(keys))
+
+
+def make_etag(rows, *parts) -> str:
+    """Strong ETag from (key, version) rows and whatever else the response depends on. Missing keys count as 0"""
+    versions = dict(rows)
+    digest = hashlib.blake2b(digest_size=12)
+    for part in parts:
+        digest.update(f"{part}\x00".encode())
+    for key in sorted(versions):
+        digest.update(f"{key}={versions[key]}\x00".encode())
+    return f'"{digest.hexdigest()}"'
+
+
+def current_etag(db: Session, keys: list[str], *parts) -> str:
+    return make_etag(db.exec(stamps_query(keys)).all(), *keys, *parts)
+
+
+async def current_etag_async(db, keys: list[str], *parts) -> str:
+    return make_etag((await db.exec(stamps_query(keys))).all(), *keys, *parts)
+
+
+def is_not_modified(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    # If-None-Match uses the weak comparison, W/ prefixes are ignored
+    return any(candidate.strip().removeprefix("W/") == etag for candidate in header.split(","))
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": CACHE_CONTROL})
+
+
+def etag_headers(etag: str) -> dict:
+    return {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+
+
+def _changed_keys(session) -> set[str]:
+    keys = set()
+    for instance in list(session.new) + list(session.dirty) + list(session.deleted):
+        if instance in session.dirty and not session.is_modified(instance):
+            continue
+        table = getattr(instance, "__tablename__", None)
+        if table in TRACKED_TABLES:
+            keys.add(table_key(table))
+        elif isinstance(instance, Appointment):
+            keys.add(doctor_appointments_key(instance.doctor_id))
+            keys.update(doctor_appointments_key(doctor_id)
+                        for doctor_id in inspect(instance).attrs.doctor_id.history.deleted if doctor_id is not None)
+    return keys
+
+
+@event.listens_for(Session, "before_flush")
+def _bump_change_stamps(session, flush_context, instances):
+    # Runs in the transaction of the change, if it rolls back the bump is undone with it
+    keys = _changed_keys(session)
+    if not keys:
+        return
+    connection = session.connection()
+    connection.execute(insert(ChangeStamp.__table__).prefix_with("OR IGNORE", dialect="sqlite")
+                       .prefix_with("IGNORE", dialect="mysql"), [{"key": key, "version": 0} for key in sorted(keys)])
+    connection.execute(update(ChangeStamp.__table__).where(ChangeStamp.__table__.c.key.in_(sorted(keys)))
+                       .values(version=ChangeStamp.__table__.c.version + 1))
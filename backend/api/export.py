@@ -0,0 +1,106 @@
+import csv
+import io
+from enum import Enum
+
+from sqlmodel import Session, select
+
+from api.config import EXPORT_CHUNK_SIZE
+from api.database import engine
+from api.models import Patient, Doctor, Appointment
+from api.schemas import PatientStripped, DoctorStripped, AppointmentWithPatient
+
+
+class ExportEntity(str, Enum):
+    patients = "patients"
+    doctors = "doctors"
+    appointments = "appointments"
+
+
+class ExportFormat(str, Enum):
+    ndjson = "ndjson"
+    csv = "csv"
+
+
+EXPORT_MEDIA_TYPES = {
+    ExportFormat.ndjson: "application/x-ndjson",
+    ExportFormat.csv: "text/csv",
+}
+
+
+def _patients():
+    stmt = (select(Patient.first_name, Patient.middle_name, Patient.last_name, Patient.gender)
+            .order_by(Patient.id))
+    return stmt, lambda row: PatientStripped(first_name=row.first_name, middle_name=row.middle_name,
+                                             last_name=row.last_name, gender=row.gender)
+
+
+def _doctors():
+    stmt = (select(Doctor.id, Doctor.first_name, Doctor.middle_name, Doctor.last_name, Doctor.phone_number,
+                   Doctor.license_number, Doctor.hire_date)
+            .order_by(Doctor.id))
+    return stmt, lambda row: DoctorStripped(id=row.id, first_name=row.first_name, middle_name=row.middle_name,
+                                            last_name=row.last_name, phone_number=row.phone_number,
+                                            license_number=row.license_number, hire_date=row.hire_date)
+
+
+def _appointments():
+    stmt = (select(Appointment.date, Appointment.reason, Appointment.diagnosis, Appointment.status,
+                   Patient.first_name, Patient.middle_name, Patient.last_name, Patient.gender)
+            .join(Patient, Patient.id == Appointment.patient_id)
+            .order_by(Appointment.id))
+    return stmt, lambda row: AppointmentWithPatient(date=row.date, reason=row.reason, diagnosis=row.diagnosis,
+                                                    status=row.status,
+                                                    patient=PatientStripped(first_name=row.first_name,
+                                                                            middle_name=row.middle_name,
+                                                                            last_name=row.last_name,
+                                                                            gender=row.gender))
+
+
+EXPORTS = {
+    ExportEntity.patients: _patients,
+    ExportEntity.doctors: _doctors,
+    ExportEntity.appointments: _appointments,
+}
+
+
+def _flatten(data: dict, prefix: str = "") -> dict:
+    output = {}
+    for key, value in data.items():
+        if isinstance(value, dict):
+            output.update(_flatten(value, f"{prefix}{key}."))
+        else:
+            output[f"{prefix}{key}"] = value
+    return output
+
+
+def _ndjson_chunk(models: list) -> str:
+    return "".join(model.model_dump_json() + "\n" for model in models)
+
+
+def _csv_chunk(models: list, header: bool) -> str:
+    buffer = io.StringIO()
+    rows = [_flatten(model.model_dump(mode="json")) for model in models]
+    writer = csv.DictWriter(buffer, fieldnames=list(rows[0]))
+    if header:
+        writer.writeheader()
+    writer.writerows(rows)
+    return buffer.getvalue()
+
+
+def stream_export(entity: ExportEntity, export_format: ExportFormat, chunk_size: int = EXPORT_CHUNK_SIZE):
+    """
+    Yield the serialized entity chunk by chunk while the rows are read from a server-side cursor.
+    Runs in its own session because the response is streamed after the request dependencies are closed.
+    """
+    stmt, build = EXPORTS[entity]()
+
+    with Session(engine) as session:
+        result = session.exec(stmt.execution_options(stream_results=True, yield_per=chunk_size))
+        first = True
+        for rows in result.partitions():
+            models = [build(row) for row in rows]
+            if export_format == ExportFormat.csv:
+                yield _csv_chunk(models, header=first)
+            else:
+                yield _ndjson_chunk(models)
+            first = False
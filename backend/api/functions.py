@@ -1,18 +1,126 @@
+import threading
+import time
+from collections import OrderedDict
+
 from fastapi import HTTPException
 from fastapi.params import Depends
 from sqlmodel import select, Session
 from starlette import status
 
+from api.config import PRINCIPAL_CACHE_TTL, PRINCIPAL_CACHE_SIZE
 from api.models import Doctor
 from api.models import User, Patient
 from api.schemas import PatientStripped, DoctorStripped
 from api.security import verify_token, credentials_exception
 from api.database import get_db
+from api.etags import table_key, current_etag
+
+
+class PrincipalCache:
+    """
+    Short lived cache of resolved principals (the result of get_my_info), keyed by user email.
+    Endpoints that modify a user, doctor or patient must call invalidate() with the affected email.
+    """
+
+    def __init__(self, ttl: int, max_size: int):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries: OrderedDict[str, tuple[float, dict, int, str | None]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.queries_saved = 0
+
+    def get(self, email: str, version: str | None = None) -> dict | None:
+        """With a version (the ETag of the principal), entries resolved under another version are misses"""
+        with self._lock:
+            entry = self._entries.get(email)
+            if entry is None or entry[0] <= time.monotonic() or (version is not None and entry[3] != version):
+                if entry is not None:
+                    del self._entries[email]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(email)
+            self.hits += 1
+            self.queries_saved += entry[2]
+            return dict(entry[1])
+
+    def put(self, email: str, info: dict, query_count: int, version: str | None = None):
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            self._entries[email] = (time.monotonic() + self.ttl, info, query_count, version)
+            self._entries.move_to_end(email)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, email: str):
+        with self._lock:
+            self._entries.pop(email, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+            self.queries_saved = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"size": len(self._entries),
+                    "ttl": self.ttl,
+                    "hits": self.hits,
+                    "misses": self.misses,
+                    "hit_ratio": self.hits / lookups if lookups else 0.0,
+                    "queries_saved": self.queries_saved}
+
+
+principal_cache = PrincipalCache(PRINCIPAL_CACHE_TTL, PRINCIPAL_CACHE_SIZE)
+
+
+def invalidate_principal(email: str):
+    principal_cache.invalidate(email)
 
 
 def get_my_info(payload: dict = Depends(verify_token), db: Session = Depends(get_db)) -> dict:
     email = payload['sub']
 
+    cached = principal_cache.get(email)
+    if cached is not None:
+        return cached
+
+    info, query_count = resolve_principal(email, db)
+    principal_cache.put(email, info, query_count)
+    return dict(info)
+
+
+def principal_stamp_keys(user_type: str | None) -> list[str]:
+    """Change stamps of every table resolve_principal reads for this type of user"""
+    if user_type == "Patient":
+        return [table_key("user"), table_key("patient")]
+    if user_type == "Doctor":
+        return [table_key("user"), table_key("doctor")]
+    return [table_key("user")]
+
+
+def principal_etag(payload: dict, db: Session) -> str:
+    return current_etag(db, principal_stamp_keys(payload.get("type")), payload["sub"])
+
+
+def get_versioned_principal(email: str, etag: str, db: Session) -> dict:
+    """Like get_my_info, but a cached principal is only used when it was resolved under the same ETag"""
+    cached = principal_cache.get(email, etag)
+    if cached is not None:
+        return cached
+
+    info, query_count = resolve_principal(email, db)
+    principal_cache.put(email, info, query_count, etag)
+    return dict(info)
+
+
+def resolve_principal(email: str, db: Session) -> tuple[dict, int]:
+    """Load the user with its patient/doctor profile, returns the principal and the number of queries it took"""
     stmt = select(User).where(User.email == email)
     user = db.exec(stmt).first()
 
@@ -20,30 +128,31 @@ def get_my_info(payload: dict = Depends(verify_token), db: Session = Depends(get
         raise credentials_exception
 
     if user.type == "Patient":
-        patient = db.query(Patient).where(Patient.id == user.link_id).first()
+        stmt = select(Patient).where(Patient.id == user.link_id)
+        patient = db.exec(stmt).first()
 
         if not patient:
             raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Fatal DB error")
 
-        return {"email": user.email, "type": user.type, 'patient': PatientStripped(first_name=patient.first_name, last_name=patient.last_name, middle_name=patient.middle_name, gender=patient.gender)}
+        return {"email": user.email, "type": user.type, 'patient': PatientStripped(first_name=patient.first_name, last_name=patient.last_name, middle_name=patient.middle_name, gender=patient.gender)}, 2
 
     elif user.type == "Doctor":
+        # DoctorStripped carries no speciality or facilities, so neither is loaded
         stmt = select(Doctor).where(Doctor.id == user.link_id)
         doctor = db.exec(stmt).first()
 
         if not doctor:
             raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Fatal DB error")
-        return {"email": user.email, "type": user.type, 'doctor': DoctorStripped(id=doctor.id, first_name=doctor.first_name, last_name=doctor.last_name, middle_name=doctor.middle_name, phone_number=doctor.phone_number, license_number=doctor.license_number, hire_date=doctor.hire_date, speciality=doctor.speciality, facilities=doctor.facilities)}
+
+        return {"email": user.email, "type": user.type, 'doctor': DoctorStripped(id=doctor.id, first_name=doctor.first_name, last_name=doctor.last_name, middle_name=doctor.middle_name, phone_number=doctor.phone_number, license_number=doctor.license_number, hire_date=doctor.hire_date)}, 2
 
     elif user.type == "Admin":
 
-        return {"email": user.email, "type": user.type, 'Admin': "UNIMPLEMENTED"}
+        return {"email": user.email, "type": user.type, 'Admin': "UNIMPLEMENTED"}, 1
 
     elif user.type == "Unassigned":
 
-        return {"email": user.email, "type": user.type}
+        return {"email": user.email, "type": user.type}, 1
 
     else:
-        return {"email": user.email, "type": "Other"}
-
-
+        return {"email": user.email, "type": "Other"}, 1
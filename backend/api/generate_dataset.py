@@ -0,0 +1,302 @@
+# Generates a production sized database for load tests and benchmarks.
+#
+#   python -m api.generate_dataset --database-url sqlite:///load.db --patients 1000000 --appointments 20000000
+#
+# The target schema is recreated from the models, so point it at a scratch database. Run `alembic stamp head`
+# on the result before using it with migrations. Every generated account logs in with --password.
+# Appointments are spread around --today (the current date by default), so agendas have both history and upcoming
+# visits. The same --seed and --today always produce the same rows.
+
+import argparse
+import math
+import random
+import time
+from datetime import date, datetime, timedelta
+
+from faker import Faker
+from sqlalchemy import event, insert
+from sqlmodel import SQLModel, create_engine
+
+from api.models import (Appointment, AppointmentSlot, AppointmentStatus, Doctor, DoctorFacilityAssociation,
+                        DoctorSpeciality, FacilityType, MedicalFacility, Patient, User, UserType)
+from api.security import pwd_context
+
+
+PESEL_WEIGHTS = [1, 3, 7, 9, 1, 3, 7, 9, 1, 3]
+
+SPECIALITIES = [
+    ("Internal medicine", "Adult diseases", "INT"),
+    ("Family medicine", "Primary care", "FAM"),
+    ("Paediatrics", "Children and adolescents", "PED"),
+    ("Cardiology", "Heart and cardiovascular system", "CARD"),
+    ("Neurology", "Brain and nervous system", "NEUR"),
+    ("Orthopedics", "Bones and muscles", "ORTH"),
+    ("Dermatology", "Skin diseases", "DERM"),
+    ("Ophthalmology", "Eyes", "OPHT"),
+    ("Gynaecology", "Female reproductive system", "GYN"),
+    ("Psychiatry", "Mental health", "PSY"),
+]
+
+OPERATING_HOURS = ["Mon-Fri 8:00-20:00, Sat 8:00-14:00", "Mon-Fri 9:00-17:00", "Mon-Fri 7:00-19:00", "Mon-Sat 8:00-18:00"]
+
+REASONS = ["Routine check-up", "Follow-up visit", "Chest pain", "Headache", "Back pain", "Skin rash", "Fever",
+           "Prescription renewal", "Test results review", "Vaccination", "Abdominal pain", "Dizziness"]
+DIAGNOSES = ["Healthy", "Hypertension", "Migraine", "Lumbago", "Atopic dermatitis", "Influenza", "Type 2 diabetes",
+             "Gastritis", "Anxiety disorder", "Upper respiratory tract infection"]
+
+SLOT_MINUTES = 20
+DAY_START_HOUR = 8
+SLOTS_PER_DAY = 8 * 60 // SLOT_MINUTES  # 8:00-16:00 on working days
+
+
+def pesel(birth_date: date, serial: int, male: bool) -> str:
+    """PESEL for the given birth date, the sex digit is odd for men. Matches the checksum in PESELMixin"""
+    month = birth_date.month + {1800: 80, 1900: 0, 2000: 20, 2100: 40, 2200: 60}[birth_date.year // 100 * 100]
+    sex_digit = serial % 5 * 2 + (1 if male else 0)
+    digits = f"{birth_date.year % 100:02}{month:02}{birth_date.day:02}{serial // 5 % 1000:03}{sex_digit}"
+    checksum = sum(int(digit) * weight for digit, weight in zip(digits, PESEL_WEIGHTS)) % 10
+    return digits + str((10 - checksum) % 10)
+
+
+class NamePools:
+    """Faker is far too slow to call per row at this scale, so names and streets are drawn once and sampled"""
+
+    def __init__(self, fake: Faker, size: int = 500):
+        letters_only = lambda values: sorted({value for value in values if value.isalpha()})
+        self.male_first = letters_only(fake.first_name_male() for _ in range(size))
+        self.female_first = letters_only(fake.first_name_female() for _ in range(size))
+        self.male_last = letters_only(fake.last_name_male() for _ in range(size * 4))
+        self.female_last = letters_only(fake.last_name_female() for _ in range(size * 4))
+        self.streets = sorted({fake.street_name() for _ in range(size)})
+        self.cities = sorted({(fake.postcode(), fake.city()) for _ in range(size)})
+
+
+def _chunks(total: int, chunk_size: int):
+    for start in range(0, total, chunk_size):
+        yield start, min(start + chunk_size, total)
+
+
+def _phone_number(rng: random.Random) -> str:
+    return str(rng.randint(500000000, 899999999))
+
+
+def _working_slot(first_day: date, slot: int) -> datetime:
+    """Datetime of the n-th 20 minute slot counted over working days only"""
+    day, slot_in_day = divmod(slot, SLOTS_PER_DAY)
+    week, weekday = divmod(day, 5)
+    day_date = first_day + timedelta(days=7 * week + weekday)
+    return (datetime(day_date.year, day_date.month, day_date.day, DAY_START_HOUR)
+            + timedelta(minutes=SLOT_MINUTES * slot_in_day))
+
+
+def _working_days(first_day: date, day: date) -> int:
+    """Working days from first_day, a Monday, up to but not including day"""
+    weeks, weekday = divmod(max(0, (day - first_day).days), 7)
+    return weeks * 5 + min(weekday, 5)
+
+
+def patient_rows(rng: random.Random, names: NamePools, start: int, end: int, today: date) -> list[dict]:
+    rows = []
+    for patient_id in range(start + 1, end + 1):
+        male = rng.random() < 0.48
+        # Ages roughly follow the shape of the Polish population pyramid, older patients visit more often
+        age = min(100, int(rng.triangular(0, 95, 60)))
+        birth_date = today - timedelta(days=365 * age + rng.randint(0, 364))
+        postcode, city = rng.choice(names.cities)
+        rows.append({
+            "id": patient_id,
+            "first_name": rng.choice(names.male_first if male else names.female_first),
+            "middle_name": rng.choice(names.male_first if male else names.female_first) if rng.random() < 0.3 else None,
+            "last_name": rng.choice(names.male_last if male else names.female_last),
+            "PESEL": pesel(birth_date, rng.randint(0, 4999), male),
+            "gender": "M" if male else "F",
+            "address": f"{rng.choice(names.streets)} {rng.randint(1, 200)}, {postcode} {city}",
+            "phone_number": _phone_number(rng),
+        })
+    return rows
+
+
+def appointment_rows(rng: random.Random, start: int, end: int, doctor_weights: list[float], next_slot: list[int],
+                     patients: int, first_day: date, now: datetime) -> list[dict]:
+    rows = []
+    doctor_ids = rng.choices(range(1, len(doctor_weights) + 1), cum_weights=doctor_weights, k=end - start)
+    for appointment_id, doctor_id in enumerate(doctor_ids, start=start + 1):
+        # Every doctor fills their agenda in order, leaving a few free slots between visits
+        slot = next_slot[doctor_id]
+        next_slot[doctor_id] = slot + 1 + (rng.random() < 0.2)
+        visit_date = _working_slot(first_day, slot)
+
+        roll = rng.random()
+        if visit_date < now:
+            appointment_status = (AppointmentStatus.COMPLETED if roll < 0.85 else
+                                  AppointmentStatus.CANCELLED if roll < 0.95 else AppointmentStatus.NO_SHOW)
+        else:
+            appointment_status = AppointmentStatus.SCHEDULED if roll < 0.93 else AppointmentStatus.CANCELLED
+        completed = appointment_status == AppointmentStatus.COMPLETED
+
+        rows.append({
+            "id": appointment_id,
+            "date": visit_date,
+            "doctor_id": doctor_id,
+            # Skewed towards low ids, so a minority of patients accounts for most of the visits
+            "patient_id": int(patients * rng.random() ** 2) + 1,
+            "reason": rng.choice(REASONS),
+            "treatment_plan": "Treatment plan" if completed else "",
+            "diagnosis": rng.choice(DIAGNOSES) if completed else "",
+            "recommendations": "Recommendations" if completed else "",
+            "status": appointment_status,
+        })
+    return rows
+
+
+def _fast_load_pragmas(dbapi_connection, connection_record=None):
+    # The generated database can always be rebuilt, so skip fsyncs while loading
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA synchronous=OFF")
+    cursor.execute("PRAGMA cache_size=-262144")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
+
+
+def generate(database_url: str, patients: int, doctors: int, appointments: int, facilities: int = 20,
+             seed: int = 42, chunk_size: int = 50000, password: str = "password", first_day: date | None = None,
+             today: date | None = None, log=print):
+    rng = random.Random(seed)
+    fake = Faker("pl_PL")
+    fake.seed_instance(seed)
+    names = NamePools(fake)
+    today = today or date.today()
+    now = datetime.combine(today, datetime.min.time())
+
+    engine = create_engine(database_url)
+    if engine.dialect.name == "sqlite":
+        event.listen(engine, "connect", _fast_load_pragmas)
+
+    # Secondary indexes are built once after loading, maintaining them row by row is several times slower
+    SQLModel.metadata.drop_all(engine)
+    SQLModel.metadata.create_all(engine)
+    indexes = [index for table in SQLModel.metadata.sorted_tables for index in table.indexes]
+    with engine.begin() as connection:
+        for index in indexes:
+            index.drop(connection)
+
+    def timed(label: str, started: float, rows: int):
+        elapsed = time.perf_counter() - started
+        log(f"{label}: {rows} rows in {elapsed:.1f} s ({rows / elapsed if elapsed else 0:.0f} rows/s)")
+
+    started = time.perf_counter()
+    with engine.begin() as connection:
+        connection.execute(insert(DoctorSpeciality.__table__), [
+            {"id": i, "name": name, "description": description, "code": code}
+            for i, (name, description, code) in enumerate(SPECIALITIES, start=1)])
+        connection.execute(insert(MedicalFacility.__table__), [
+            {"facility_id": i, "name": f"{fake.last_name()} {rng.choice(['Medical Center', 'Clinic', 'Hospital'])}",
+             "address": f"{rng.choice(names.streets)} {rng.randint(1, 200)}, {' '.join(rng.choice(names.cities))}",
+             "phone_number": _phone_number(rng), "facility_type": rng.choice([FacilityType.CLINIC, FacilityType.HOSPITAL]),
+             "website": f"https://facility{i}.example.pl", "operating_hours": rng.choice(OPERATING_HOURS)}
+            for i in range(1, facilities + 1)])
+    timed("Specialities and facilities", started, len(SPECIALITIES) + facilities)
+
+    started = time.perf_counter()
+    for start, end in _chunks(doctors, chunk_size):
+        with engine.begin() as connection:
+            rows = []
+            for doctor_id in range(start + 1, end + 1):
+                male = rng.random() < 0.45
+                rows.append({
+                    "id": doctor_id,
+                    "first_name": rng.choice(names.male_first if male else names.female_first),
+                    "middle_name": rng.choice(names.male_first if male else names.female_first),
+                    "last_name": rng.choice(names.male_last if male else names.female_last),
+                    "phone_number": _phone_number(rng),
+                    "license_number": f"{1000000 + doctor_id}",
+                    "hire_date": (today - timedelta(days=rng.randint(30, 365 * 30))).isoformat(),
+                    # Primary care specialities are by far the most common
+                    "speciality_id": rng.choices(range(1, len(SPECIALITIES) + 1),
+                                                 weights=[8, 8, 5] + [2] * (len(SPECIALITIES) - 3))[0],
+                })
+            connection.execute(insert(Doctor.__table__), rows)
+            connection.execute(insert(DoctorFacilityAssociation.__table__), [
+                {"doctor_id": row["id"], "facility_id": facility_id}
+                for row in rows
+                for facility_id in rng.sample(range(1, facilities + 1), k=min(facilities, rng.randint(1, 2)))])
+    timed("Doctors", started, doctors)
+
+    started = time.perf_counter()
+    for start, end in _chunks(patients, chunk_size):
+        with engine.begin() as connection:
+            connection.execute(insert(Patient.__table__), patient_rows(rng, names, start, end, today))
+    timed("Patients", started, patients)
+
+    # Argon2 per account would take days, every account shares one hash of --password instead
+    started = time.perf_counter()
+    password_hash = pwd_context.hash(password)
+    for start, end in _chunks(patients, chunk_size):
+        with engine.begin() as connection:
+            connection.execute(insert(User.__table__), [
+                {"email": f"patient{patient_id}@example.pl", "hashed_password": password_hash,
+                 "type": UserType.Patient, "link_id": patient_id}
+                for patient_id in range(start + 1, end + 1)])
+    with engine.begin() as connection:
+        connection.execute(insert(User.__table__), [
+            {"email": f"doctor{doctor_id}@example.pl", "hashed_password": password_hash,
+             "type": UserType.Doctor, "link_id": doctor_id}
+            for doctor_id in range(1, doctors + 1)] + [
+            {"email": "admin@example.pl", "hashed_password": password_hash, "type": UserType.Admin, "link_id": None}])
+    timed("Users", started, patients + doctors + 1)
+
+    started = time.perf_counter()
+    # Doctor popularity follows a long tail, the busiest doctors see several times more patients than the median
+    cum_weights, total = [], 0.0
+    for _ in range(doctors):
+        total += min(rng.paretovariate(2.5), 4.0)
+        cum_weights.append(total)
+    # Every agenda starts where about 90% of its expected appointments lie before today, less two standard
+    # deviations of the count, so quiet doctors have upcoming visits as well. An appointment takes 1.2 slots on
+    # average with the free slots between visits
+    expected = [appointments * (weight - previous) / total for previous, weight in zip([0.0] + cum_weights, cum_weights)]
+    past_slots = [max(0, math.ceil((share * 0.9 - 2 * math.sqrt(share)) * 1.2)) for share in expected]
+    if first_day is None:
+        # The Monday far enough back for the busiest agenda
+        past_days = math.ceil(max(past_slots, default=0) / SLOTS_PER_DAY)
+        weeks = math.ceil(max(0, past_days - min(today.weekday(), 5)) / 5)
+        first_day = today - timedelta(days=today.weekday() + 7 * weeks)
+    today_slot = _working_days(first_day, today) * SLOTS_PER_DAY
+    next_slot = [0] + [max(0, today_slot - past) for past in past_slots]
+    for start, end in _chunks(appointments, chunk_size):
+        with engine.begin() as connection:
+            rows = appointment_rows(rng, start, end, cum_weights, next_slot, patients, first_day, now)
+            connection.execute(insert(Appointment.__table__), rows)
+            connection.execute(insert(AppointmentSlot.__table__), [
+                {"doctor_id": row["doctor_id"], "slot_start": row["date"], "appointment_id": row["id"]}
+                for row in rows if row["status"] != AppointmentStatus.CANCELLED])
+    timed("Appointments", started, appointments)
+
+    started = time.perf_counter()
+    with engine.begin() as connection:
+        for index in indexes:
+            index.create(connection)
+    timed("Indexes", started, len(indexes))
+    return engine
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic database with realistic volumes")
+    parser.add_argument("--database-url", default="sqlite:///load.db", help="Target database, its tables are recreated")
+    parser.add_argument("--patients", type=int, default=100000)
+    parser.add_argument("--doctors", type=int, default=2000)
+    parser.add_argument("--appointments", type=int, default=2000000)
+    parser.add_argument("--facilities", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=42, help="The same seed and --today always generate the same data")
+    parser.add_argument("--today", type=date.fromisoformat, default=None,
+                        help="Date the agendas are built around (YYYY-MM-DD), the current date by default")
+    parser.add_argument("--chunk-size", type=int, default=50000, help="Rows inserted per transaction")
+    parser.add_argument("--password", default="password", help="Password of every generated account")
+    args = parser.parse_args()
+
+    generate(args.database_url, args.patients, args.doctors, args.appointments, args.facilities, args.seed,
+             args.chunk_size, args.password, today=args.today)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+import math
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from fastapi import HTTPException
+from starlette import status
+
+from api.config import HASH_WORKERS, HASH_QUEUE_SIZE, HASH_MEMORY_BUDGET_MB
+from api.security import pwd_context
+
+
+# Argon2 is deliberately slow and memory hungry, so hashing runs in a dedicated process pool.
+# Request threads only wait on the result, and once every worker is busy and the queue is full
+# new requests are rejected with 503 instead of piling up and starving every other endpoint.
+
+
+def _hash_job(password: str) -> tuple[str, float]:
+    start = time.perf_counter()
+    hashed = pwd_context.hash(password)
+    return hashed, time.perf_counter() - start
+
+
+def _verify_job(plain_password: str, hashed_password: str) -> tuple[bool, float]:
+    start = time.perf_counter()
+    valid = pwd_context.verify(plain_password, hashed_password)
+    return valid, time.perf_counter() - start
+
+
+def _verify_and_update_job(plain_password: str, hashed_password: str) -> tuple[tuple[bool, str | None], float]:
+    start = time.perf_counter()
+    result = pwd_context.verify_and_update(plain_password, hashed_password)
+    return result, time.perf_counter() - start
+
+
+def hash_memory_mb() -> int:
+    """Memory used by a single hash with the current Argon2 settings"""
+    memory_cost_kib = pwd_context.to_dict().get("argon2__memory_cost", 64 * 1024)
+    return max(1, math.ceil(memory_cost_kib / 1024))
+
+
+def default_worker_count() -> int:
+    cores = os.cpu_count() or 1
+    by_memory = HASH_MEMORY_BUDGET_MB // hash_memory_mb()
+    return max(1, min(cores, by_memory))
+
+
+class HashingExecutor:
+    def __init__(self, workers: int, queue_size: int, latency_window: int = 1000):
+        self.workers = workers
+        self.queue_size = queue_size
+        self._lock = threading.Lock()
+        # Free slots out of workers + queue_size. Batches take a whole chunk at once, a batch holding part of its
+        # slots while waiting for the rest could deadlock with another batch and starve single requests
+        self._free = max(1, workers) + queue_size
+        self._capacity = threading.Condition()
+        self._batch_lock = threading.Lock()
+        self._pool: ProcessPoolExecutor | None = None
+
+        self._in_flight = 0
+        self._completed = 0
+        self._rejected = 0
+        self._latency_total = 0.0
+        self._latency_max = 0.0
+        self._latencies = deque(maxlen=latency_window)
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.workers)
+            return self._pool
+
+    def _reset_pool(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def retry_after(self) -> int:
+        """Seconds after which a rejected client should retry, estimated from the current backlog"""
+        with self._lock:
+            average = self._latency_total / self._completed if self._completed else 1.0
+            backlog = self._in_flight
+        return max(1, math.ceil(average * backlog / max(1, self.workers)))
+
+    def _reserve(self, count: int, blocking: bool) -> bool:
+        with self._capacity:
+            while self._free < count:
+                if not blocking:
+                    return False
+                self._capacity.wait()
+            self._free -= count
+            return True
+
+    def _release(self, count: int):
+        with self._capacity:
+            self._free += count
+            self._capacity.notify_all()
+
+    def _run(self, job, *args):
+        if not self._reserve(1, blocking=False):
+            with self._lock:
+                self._rejected += 1
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                                detail="Server is busy, try again later",
+                                headers={"Retry-After": str(self.retry_after())})
+
+        with self._lock:
+            self._in_flight += 1
+        try:
+            if self.workers == 0:
+                result, elapsed = job(*args)
+            else:
+                try:
+                    result, elapsed = self._get_pool().submit(job, *args).result()
+                except BrokenProcessPool:
+                    # A worker died (most likely killed for using too much memory), start a fresh pool
+                    self._reset_pool()
+                    raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                                        detail="Server is busy, try again later",
+                                        headers={"Retry-After": str(self.retry_after())})
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+            self._release(1)
+
+        with self._lock:
+            self._completed += 1
+            self._latency_total += elapsed
+            self._latency_max = max(self._latency_max, elapsed)
+            self._latencies.append(elapsed)
+        return result
+
+    def hash_password(self, password: str) -> str:
+        return self._run(_hash_job, password)
+
+    def verify_password(self, plain_password: str, hashed_password: str) -> bool:
+        return self._run(_verify_job, plain_password, hashed_password)
+
+    def verify_and_update_password(self, plain_password: str, hashed_password: str) -> tuple[bool, str | None]:
+        return self._run(_verify_and_update_job, plain_password, hashed_password)
+
+    def hash_passwords(self, passwords: list[str]) -> list[str]:
+        """
+        Hash a batch for bulk jobs. Instead of being rejected the batch waits for free capacity, and it never has
+        more than one hash per worker in flight, so interactive logins still get their turn between batch items.
+        Concurrent batches run one after another.
+        """
+        with self._batch_lock:
+            return self._hash_batch(passwords)
+
+    def _hash_batch(self, passwords: list[str]) -> list[str]:
+        hashes = []
+        chunk_size = max(1, self.workers)  # Without a pool the batch hashes inline, one password at a time
+        for start in range(0, len(passwords), chunk_size):
+            chunk = passwords[start:start + chunk_size]
+            self._reserve(len(chunk), blocking=True)
+            with self._lock:
+                self._in_flight += len(chunk)
+            try:
+                if self.workers == 0:
+                    results = [_hash_job(password) for password in chunk]
+                else:
+                    results = [future.result() for future in [self._get_pool().submit(_hash_job, password) for password in chunk]]
+            finally:
+                with self._lock:
+                    self._in_flight -= len(chunk)
+                self._release(len(chunk))
+
+            with self._lock:
+                for hashed, elapsed in results:
+                    self._completed += 1
+                    self._latency_total += elapsed
+                    self._latency_max = max(self._latency_max, elapsed)
+                    self._latencies.append(elapsed)
+            hashes += [hashed for hashed, _ in results]
+        return hashes
+
+    def stats(self) -> dict:
+        with self._lock:
+            latencies = sorted(self._latencies)
+            in_flight = self._in_flight
+            output = {
+                "workers": self.workers,
+                "queue_size": self.queue_size,
+                "in_flight": in_flight,
+                "queue_depth": max(0, in_flight - max(1, self.workers)),
+                "completed": self._completed,
+                "rejected": self._rejected,
+                "latency_avg": self._latency_total / self._completed if self._completed else 0.0,
+                "latency_max": self._latency_max,
+            }
+
+        for name, quantile in (("latency_p50", 0.50), ("latency_p95", 0.95), ("latency_p99", 0.99)):
+            output[name] = latencies[min(len(latencies) - 1, int(quantile * len(latencies)))] if latencies else 0.0
+        return output
+
+    def shutdown(self):
+        self._reset_pool()
+
+
+hashing_executor = HashingExecutor(workers=default_worker_count() if HASH_WORKERS < 0 else HASH_WORKERS,
+                                   queue_size=HASH_QUEUE_SIZE)
+
+
+def hash_password(password: str) -> str:
+    return hashing_executor.hash_password(password)
+
+
+def verify_password(plain_password: str, hashed_password: str) -> bool:
+    return hashing_executor.verify_password(plain_password, hashed_password)
+
+
+def verify_and_update_password(plain_password: str, hashed_password: str) -> tuple[bool, str | None]:
+    return hashing_executor.verify_and_update_password(plain_password, hashed_password)
+
+
+def hash_passwords(passwords: list[str]) -> list[str]:
+    return hashing_executor.hash_passwords(passwords)
@@ -3,21 +3,18 @@
 
 
 
-from sqlmodel import create_engine, Session, SQLModel
+from sqlmodel import Session, SQLModel
 
 
 from api.models import *
+from api.database import engine
+from api.security import hash_password
 
 
-DATABASE_URL = "sqlite:///orm.db"
-engine = create_engine(DATABASE_URL)
 
 
 
 
-
-
-print("Adding data to db...")
 # Poplate tables
 
 def insert_mock_data():
@@ -35,14 +32,15 @@ def insert_mock_data():
 
     # Section for 'main' tables
 
-        # Users
+        # Users, all seeded accounts share the password "password" hashed with the active hashing profile
+        seed_password_hash = hash_password("password")
         users = [
-            User(email=f"user{i}@example.com", hashed_password="$argon2id$v=19$m=131072,t=25,p=4$1to7p7Q2Rqh1rnUOASDEuA$EajgMftTz5z5uXA9mK5RS/K/z7IhTV5Jel3qq27mVbAIx0bxhD/aGM0jhYlkLPqRJnc+6NyN//tHYJMBr4TJBg", type=UserType.Patient, link_id=1)
+            User(email=f"user{i}@example.com", hashed_password=seed_password_hash, type=UserType.Patient, link_id=1)
             for i in range(0, 10)  # Create 10 users
         ]
-        admin = User(email=f"admin@example.com", hashed_password="$argon2id$v=19$m=131072,t=25,p=4$1to7p7Q2Rqh1rnUOASDEuA$EajgMftTz5z5uXA9mK5RS/K/z7IhTV5Jel3qq27mVbAIx0bxhD/aGM0jhYlkLPqRJnc+6NyN//tHYJMBr4TJBg", type=UserType.Admin, link_id=1)
-        doctor = User(email=f"doctor@example.com", hashed_password="$argon2id$v=19$m=131072,t=25,p=4$1to7p7Q2Rqh1rnUOASDEuA$EajgMftTz5z5uXA9mK5RS/K/z7IhTV5Jel3qq27mVbAIx0bxhD/aGM0jhYlkLPqRJnc+6NyN//tHYJMBr4TJBg", type=UserType.Doctor, link_id=1)
-        unassigned = User(email=f"unassigned@example.com", hashed_password="$argon2id$v=19$m=131072,t=25,p=4$1to7p7Q2Rqh1rnUOASDEuA$EajgMftTz5z5uXA9mK5RS/K/z7IhTV5Jel3qq27mVbAIx0bxhD/aGM0jhYlkLPqRJnc+6NyN//tHYJMBr4TJBg", type=UserType.Unassigned)
+        admin = User(email=f"admin@example.com", hashed_password=seed_password_hash, type=UserType.Admin, link_id=1)
+        doctor = User(email=f"doctor@example.com", hashed_password=seed_password_hash, type=UserType.Doctor, link_id=1)
+        unassigned = User(email=f"unassigned@example.com", hashed_password=seed_password_hash, type=UserType.Unassigned)
         users.append(admin)
         users.append(doctor)
         users.append(unassigned)
@@ -223,6 +221,9 @@ def insert_mock_data():
     # Commit changes
         session.commit()
 
-        print("Done")
 
-insert_mock_data()
\ No newline at end of file
+# Only seed when run as a script, importing this module must not touch the database
+if __name__ == "__main__":
+    print("Adding data to db...")
+    insert_mock_data()
+    print("Done")
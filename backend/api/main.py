@@ -1,18 +1,25 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 
 from api.admin import admin_router
 from api.auth import auth_router
 from api.misc import misc_router
+from api.metrics import PrometheusMiddleware, QueryStatsMiddleware, metrics_router
+from api.change_feed import feed_router
+from api.transcription import transcription_router
+from api.config import DB_DEBUG_HEADERS
 
 
 from api.doctor.main import doctor_router
+from api.patient.main import patient_router
 
 app = FastAPI(
     title="TECHMED",
     description="This web application is designed to streamline the medical appointment process. The app's main feature is the use of speech-to-text (STT) technology to transcribe appointments in real-time, and AI to transform those transcripts into a detailed appointment report.",
     version='0.0.1',
-    servers=[{"url": "http://localhost:8000", "description": "Local server"}]
+    servers=[{"url": "http://localhost:8000", "description": "Local server"}],
+    default_response_class=ORJSONResponse
 )
 
 
@@ -24,11 +31,19 @@ app.add_middleware(
     allow_headers=["*"]
 )
 
+app.add_middleware(QueryStatsMiddleware, debug_headers=DB_DEBUG_HEADERS)
+
+# Outermost, so the recorded latency includes every other middleware
+app.add_middleware(PrometheusMiddleware)
+
 @app.get("/")
 def hello():
     return 'Hello World!'
 
 
+# Prometheus scrape endpoint
+app.include_router(metrics_router)
+
 #Actions related to auth
 app.include_router(auth_router, prefix="/auth")
 
@@ -40,6 +55,12 @@ app.include_router(misc_router, prefix="/misc")
 
 # Actions reserved for doctors
 app.include_router(doctor_router, prefix="/doctor")
-#
-# # Actions reserved for patients
-# app.include_router(patient_router, prefix="/patient")
\ No newline at end of file
+
+# Actions reserved for patients
+app.include_router(patient_router, prefix="/patient")
+
+# Live appointment changes over SSE and WebSocket
+app.include_router(feed_router, prefix="/feed")
+
+# Live appointment transcription over WebSocket
+app.include_router(transcription_router, prefix="/transcription")
@@ -0,0 +1,286 @@
+import logging
+import threading
+import time
+from bisect import bisect_left
+
+from anyio import to_thread
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from api.config import METRICS_ENABLED
+from api.database import track_queries
+
+logger = logging.getLogger(__name__)
+
+
+# Request metrics in the Prometheus text exposition format, collected by a plain ASGI middleware.
+# Routes are labelled with their template (/admin/users/{user_id}), so the number of series stays bounded.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (100, 1000, 10_000, 100_000, 1_000_000, 10_000_000)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: tuple[str, ...], values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def header(self) -> list[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, *labels, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> list[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return self.header() + [f"{self.name}{_format_labels(self.labels, labels)} {_format_value(value)}"
+                                for labels, value in values]
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...] = (), collect=None):
+        super().__init__(name, documentation, labels)
+        self._collect = collect  # Called on scrape for values that are read rather than tracked
+
+    def inc(self, *labels, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount: float = 1):
+        self.inc(*labels, amount=-amount)
+
+    def set(self, *labels, value: float):
+        with self._lock:
+            self._values[labels] = value
+
+    def render(self) -> list[str]:
+        if self._collect:
+            self._collect(self)
+        with self._lock:
+            values = sorted(self._values.items())
+        return self.header() + [f"{self.name}{_format_labels(self.labels, labels)} {_format_value(value)}"
+                                for labels, value in values]
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...] = (), buckets: tuple = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, *labels, value: float):
+        # Per label set: a count for each bucket (not cumulative, that is done on render), +Inf, then the sum
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                state = self._values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            state[index] += 1
+            state[-1] += value
+
+    def render(self) -> list[str]:
+        with self._lock:
+            values = sorted((labels, list(state)) for labels, state in self._values.items())
+
+        lines = self.header()
+        for labels, state in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), state):
+                cumulative += count
+                le = 'le="' + _format_value(bound) + '"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, labels)} {_format_value(state[-1])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, labels)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: list[Metric] = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines += metric.render()
+        return "\n".join(lines) + "\n"
+
+    def clear(self):
+        for metric in self.metrics:
+            metric.clear()
+
+
+def _collect_thread_pool(gauge: Gauge):
+    # Sync endpoints and dependencies run on anyio's default thread pool, once every token is borrowed
+    # further requests wait for a free thread before any of their code runs
+    limiter = to_thread.current_default_thread_limiter()
+    statistics = limiter.statistics()
+    gauge.set("total", value=limiter.total_tokens)
+    gauge.set("busy", value=statistics.borrowed_tokens)
+    gauge.set("waiting", value=statistics.tasks_waiting)
+
+
+registry = Registry()
+
+requests_total = registry.register(Counter(
+    "http_requests_total", "Finished HTTP requests", ("method", "route", "status")))
+request_duration = registry.register(Histogram(
+    "http_request_duration_seconds", "Time from receiving the request until the response was sent", ("method", "route")))
+request_size = registry.register(Histogram(
+    "http_request_size_bytes", "Size of the request body", ("method", "route"), buckets=SIZE_BUCKETS))
+response_size = registry.register(Histogram(
+    "http_response_size_bytes", "Size of the response body", ("method", "route"), buckets=SIZE_BUCKETS))
+requests_in_progress = registry.register(Gauge(
+    "http_requests_in_progress", "Requests currently being handled", ("method",)))
+exceptions_total = registry.register(Counter(
+    "http_exceptions_total", "Requests that failed with an unhandled exception", ("method", "route", "exception")))
+db_queries = registry.register(Histogram(
+    "http_request_db_queries", "SQL statements executed per request", ("method", "route"), buckets=QUERY_BUCKETS))
+db_time = registry.register(Histogram(
+    "http_request_db_seconds", "Time spent executing SQL statements per request", ("method", "route")))
+n_plus_one_total = registry.register(Counter(
+    "db_n_plus_one_total", "Requests that repeated one statement shape N_PLUS_ONE_THRESHOLD times or more", ("route",)))
+thread_pool = registry.register(Gauge(
+    "threadpool_tokens", "Threads of the pool running sync endpoints", ("state",), collect=_collect_thread_pool))
+
+
+def _route_template(scope) -> str:
+    route = scope.get("route")
+    # Unmatched paths share one label, so scanners cannot create a series per URL
+    return getattr(route, "path", None) or "unmatched"
+
+
+class PrometheusMiddleware:
+    """Records latency, sizes, status codes and unhandled exceptions of every HTTP request"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        start = time.perf_counter()
+        received = 0
+        sent = 0
+        status_code = 500
+
+        async def counting_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+            return message
+
+        async def counting_send(message):
+            nonlocal sent, status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            elif message["type"] == "http.response.body":
+                sent += len(message.get("body", b""))
+            await send(message)
+
+        requests_in_progress.inc(method)
+        try:
+            await self.app(scope, counting_receive, counting_send)
+        except Exception as e:
+            exceptions_total.inc(method, _route_template(scope), type(e).__name__)
+            raise
+        finally:
+            requests_in_progress.dec(method)
+            route = _route_template(scope)
+            requests_total.inc(method, route, str(status_code))
+            request_duration.observe(method, route, value=time.perf_counter() - start)
+            request_size.observe(method, route, value=received)
+            response_size.observe(method, route, value=sent)
+
+
+class QueryStatsMiddleware:
+    """
+    Counts and times the SQL statements of every request, warns about repeated statement shapes (N+1 queries)
+    and with debug_headers adds X-DB-Queries and X-DB-Time (milliseconds) to the response.
+    Statements executed while a streaming body is sent are counted, but can not be in the headers anymore.
+    """
+
+    def __init__(self, app, debug_headers: bool = False):
+        self.app = app
+        self.debug_headers = debug_headers
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        with track_queries() as stats:
+            async def send_with_headers(message):
+                if message["type"] == "http.response.start" and self.debug_headers:
+                    message["headers"] = list(message.get("headers", [])) + [
+                        (b"x-db-queries", str(stats.count).encode()),
+                        (b"x-db-time", f"{stats.total_time * 1000:.3f}".encode()),
+                    ]
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_with_headers)
+            finally:
+                route = _route_template(scope)
+                if METRICS_ENABLED:
+                    db_queries.observe(scope["method"], route, value=stats.count)
+                    db_time.observe(scope["method"], route, value=stats.total_time)
+
+                repeated = stats.repeated()
+                if repeated:
+                    n_plus_one_total.inc(route)
+                    for shape, count in repeated:
+                        logger.warning("Possible N+1 in %s %s: %d executions of %s", scope["method"], route, count, shape)
+
+
+metrics_router = APIRouter()
+
+
+@metrics_router.get("/metrics", include_in_schema=False, response_class=PlainTextResponse)
+async def metrics():
+    return PlainTextResponse(registry.render(), media_type=CONTENT_TYPE)
@@ -1,28 +1,56 @@
-from fastapi import APIRouter, Depends
+from datetime import timedelta
+
+from fastapi import APIRouter, Depends, Query, Request, Response
 from sqlmodel import Session, select
 
 from api.functions import *
 from api.models import *
-from api.database import get_db
-from api.security import credentials_exception
+from api.database import get_db, get_async_db, AsyncSession
+from api.security import credentials_exception, token_cache
 from api.schemas import *
-
-from api.insert_mock_data import *
+from api.hashing import hashing_executor
+from api.availability import availability_engine, to_local
+from api.etags import table_key, current_etag_async, is_not_modified, not_modified, etag_headers
+from api.config import APPOINTMENT_MINUTES, AVAILABILITY_MAX_DAYS
 
 misc_router = APIRouter()
 
 
 @misc_router.get("/get_doctor_specialities", tags=["misc"], response_model=List[DoctorSpeciality])
-def get_doctor_specialities(db: Session = Depends(get_db), payload: dict = Depends(verify_token)):
+async def get_doctor_specialities(request: Request, response: Response, db: AsyncSession = Depends(get_async_db),
+                                  payload: dict = Depends(verify_token)):
 
     if not payload:
         raise credentials_exception
 
+    etag = await current_etag_async(db, [table_key("doctor_speciality")])
+    if is_not_modified(request, etag):
+        return not_modified(etag)
+    response.headers.update(etag_headers(etag))
+
     stmt = select(DoctorSpeciality)
-    specialities = db.exec(stmt).all()
+    specialities = (await db.exec(stmt)).all()
 
     return specialities
 
+@misc_router.get("/availability", tags=["misc"], response_model=List[AvailableSlot])
+def get_availability(speciality_id: Optional[int] = None, facility_id: Optional[int] = None,
+                     start: Optional[datetime] = None, end: Optional[datetime] = None,
+                     duration: int = Query(APPOINTMENT_MINUTES, ge=5, le=240), limit: int = Query(10, ge=1, le=100),
+                     payload: dict = Depends(verify_token)):
+    """Earliest free slots of the doctors matching the filters, in time order"""
+
+    if not payload:
+        raise credentials_exception
+
+    start = max(to_local(start) if start else datetime.now(), datetime.now())
+    end = min(to_local(end) if end else start + timedelta(days=7), start + timedelta(days=AVAILABILITY_MAX_DAYS))
+    if end <= start:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="End must be after start")
+
+    return availability_engine.find_slots(start, end, duration=duration, limit=limit,
+                                          speciality_id=speciality_id, facility_id=facility_id)
+
 @misc_router.get("/get_appointment_statuses", tags=["DEV"], response_model=List[AppointmentStatusSchema])
 def get_appointment_statuses(db: Session = Depends(get_db), payload: dict = Depends(verify_token)):
 
@@ -38,8 +66,42 @@ def get_appointment_statuses(db: Session = Depends(get_db), payload: dict = Depe
     return appointment_status_json
 
 
+@misc_router.get("/hashing_stats", tags=["DEV"])
+def get_hashing_stats(payload: dict = Depends(verify_token)):
+    """Queue depth, rejections and latency of the password hashing executor"""
+
+    if not payload:
+        raise credentials_exception
+
+    return hashing_executor.stats()
+
+
+@misc_router.get("/token_cache_stats", tags=["DEV"])
+def get_token_cache_stats(payload: dict = Depends(verify_token)):
+    """Size, hits and misses of the verified token cache"""
+
+    if not payload:
+        raise credentials_exception
+
+    return token_cache.stats()
+
+
+@misc_router.get("/principal_cache_stats", tags=["DEV"])
+def get_principal_cache_stats(payload: dict = Depends(verify_token)):
+    """Hit ratio and saved queries of the principal cache used by get_my_info"""
+
+    if not payload:
+        raise credentials_exception
+
+    return principal_cache.stats()
+
+
 @misc_router.get("/reset_db", tags=["misc"])
 def reset_db():
+    # Seeding tooling is only needed here, keep it out of the application import
+    from api.insert_mock_data import insert_mock_data
     insert_mock_data()
+    principal_cache.clear()
+    availability_engine.invalidate()
 
     return "OK"
\ No newline at end of file
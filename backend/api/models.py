@@ -1,14 +1,12 @@
-from pyexpat.errors import messages
-
 from fastapi import HTTPException
 from pydantic import BaseModel, field_validator, constr
+from sqlalchemy import Column, Index, LargeBinary
 from sqlmodel import SQLModel, Field, Relationship
 from datetime import datetime,date
 from enum import Enum
 from typing import Optional, List
 
 from starlette import status
-from websockets.sync.server import basic_auth
 
 
 #IMPORTANT: Database models
@@ -44,7 +42,7 @@ class DoctorFacilityAssociation(SQLModel, table=True):
     __tablename__ = "doctor_facility_association"
 
     doctor_id: Optional[int] = Field(default=None, foreign_key="doctor.id", primary_key=True)
-    facility_id: Optional[int] = Field(default=None, foreign_key="medical_facility.facility_id", primary_key=True)
+    facility_id: Optional[int] = Field(default=None, foreign_key="medical_facility.facility_id", primary_key=True, index=True)
 
 class MedicalFacility(SQLModel, table=True):
     __tablename__ = "medical_facility"
@@ -74,8 +72,8 @@ class Referral(SQLModel, table=True):
     __tablename__ = "referral"
 
     referral_id: Optional[int] = Field(default=None, primary_key=True)  # Unikalny identyfikator skierowania
-    patient_id: int = Field(foreign_key="patient.id")  # ID pacjenta
-    doctor_id: int = Field(foreign_key="doctor.id")  # ID lekarza, który wystawia skierowanie
+    patient_id: int = Field(foreign_key="patient.id", index=True)  # ID pacjenta
+    doctor_id: int = Field(foreign_key="doctor.id", index=True)  # ID lekarza, który wystawia skierowanie
     issue_date: date = Field(default=None)  # Data wystawienia skierowania
     reason: str = Field(default=None)  # Powód skierowania
 
@@ -88,8 +86,8 @@ class TestResult(SQLModel, table=True):
     __tablename__ = "test_result"
 
     test_result_id: Optional[int] = Field(default=None, primary_key=True)  # Unikalny identyfikator wyniku badania
-    referral_id: int = Field(foreign_key="referral.referral_id")  # ID skierowania
-    patient_id: int = Field(foreign_key="patient.id")  # ID pacjenta
+    referral_id: int = Field(foreign_key="referral.referral_id", index=True)  # ID skierowania
+    patient_id: int = Field(foreign_key="patient.id", index=True)  # ID pacjenta
     test_name: str = Field(default=None)  # Nazwa badania
     result: str = Field(default=None)  # Wynik badania
     date_performed: date = Field(default=None)  # Data wykonania badania
@@ -116,7 +114,7 @@ class Patient(SQLModel, table=True):
     first_name: str = Field(max_length=32)
     middle_name: str | None = Field(max_length=32)
     last_name: str = Field(max_length=64)
-    PESEL: str = Field(max_length=11)
+    PESEL: str = Field(max_length=11, index=True)
     gender: str = Field(max_length=1)
     address: str = Field(max_length=255)
     phone_number: str = Field(max_length=16)
@@ -133,9 +131,9 @@ class Doctor(SQLModel, table=True):
     middle_name: str = Field(max_length=32)
     last_name: str = Field(max_length=64)
     phone_number: str = Field(max_length=16)
-    license_number: str = Field(max_length=16)
+    license_number: str = Field(max_length=16, index=True)
     hire_date: str = Field(max_length=11)
-    speciality_id: int = Field(default=None, foreign_key="doctor_speciality.id")
+    speciality_id: int = Field(default=None, foreign_key="doctor_speciality.id", index=True)
 
     speciality: DoctorSpeciality = Relationship(back_populates="doctors")
     appointments: List["Appointment"] = Relationship(back_populates="doctor")
@@ -145,10 +143,13 @@ class Doctor(SQLModel, table=True):
 
 class Appointment(SQLModel, table=True):
     __tablename__ = "appointment"
+    # Doctor agenda: equality on doctor and status, range on date. Also serves every lookup by doctor_id alone
+    __table_args__ = (Index("ix_appointment_doctor_id_status_date", "doctor_id", "status", "date"),)
+
     id: int = Field(default=None, primary_key=True)
     date: datetime = Field(default=None)
     doctor_id: int = Field(foreign_key='doctor.id')
-    patient_id: int = Field(foreign_key='patient.id')
+    patient_id: int = Field(foreign_key='patient.id', index=True)
     reason: str = Field(default=None)
     treatment_plan: str = Field(default=None)
     diagnosis: str = Field(default=None)
@@ -159,11 +160,58 @@ class Appointment(SQLModel, table=True):
     patient: Patient = Relationship(back_populates="appointments")
 
 
+class AppointmentSlot(SQLModel, table=True):
+    """
+    Reservation of a doctor's time. The primary key makes a second booking of the same doctor and start
+    fail in the database, whichever request commits first wins. Cancelling, moving or deleting an appointment
+    deletes its slot (api.booking).
+    """
+    __tablename__ = "appointment_slot"
+
+    doctor_id: int = Field(foreign_key="doctor.id", primary_key=True)
+    slot_start: datetime = Field(primary_key=True)
+    appointment_id: int = Field(foreign_key="appointment.id", unique=True)
+
+
+class TranscriptBlock(SQLModel, table=True):
+    """
+    Compressed block of consecutive final transcript segments of an appointment, see api/transcripts.py.
+    Blocks are only appended, and replaced by larger ones when the appointment is compacted.
+    """
+    __tablename__ = "transcript_block"
+    # Sparse time index: one entry per block, a time range lookup decodes only the blocks it overlaps
+    __table_args__ = (Index("ix_transcript_block_appointment_id_start", "appointment_id", "start"),)
+
+    appointment_id: int = Field(foreign_key="appointment.id", primary_key=True)
+    first_segment: int = Field(primary_key=True)  # Number of segments in the blocks before this one
+    segment_count: int
+    start: float  # Seconds, start of the first and end of the last segment
+    end: float
+    compacted: bool = Field(default=False)
+    data: bytes = Field(sa_column=Column(LargeBinary(length=2 ** 24), nullable=False))
+
+
+class RevokedToken(SQLModel, table=True):
+    """Access token revoked by logout, kept until the token would have expired anyway (api.security)"""
+    __tablename__ = "revoked_token"
+
+    digest: str = Field(primary_key=True, max_length=64)  # SHA-256 of the token, hex
+    expires_at: datetime = Field(index=True)  # UTC, like the exp claim
+
+
+class ChangeStamp(SQLModel, table=True):
+    """Version counters bumped in the same transaction as the change, ETags are derived from them"""
+    __tablename__ = "change_stamp"
+
+    key: str = Field(primary_key=True, max_length=64)
+    version: int = Field(default=0)
+
+
 class Prescription(SQLModel, table=True):
     __tablename__ = "prescription"
     prescription_id: int = Field(default=None, primary_key=True)  # Unique identifier for the prescription
-    doctor_id: int = Field(foreign_key="doctor.id")  # Doctor's ID
-    patient_id: int = Field(foreign_key="patient.id")  # Patient's ID
+    doctor_id: int = Field(foreign_key="doctor.id", index=True)  # Doctor's ID
+    patient_id: int = Field(foreign_key="patient.id", index=True)  # Patient's ID
     issue_date: date = Field(default=None)  # Issue date
     expiration_date: date = Field(default=None)  # Expiration date
     notes: Optional[str] = Field(default=None)  # Doctor's notes
@@ -187,8 +235,8 @@ class Drug(SQLModel, table=True):
 class PrescriptionItem(SQLModel, table=True):
     __tablename__ = "prescription_item"
     item_id: int = Field(default=None, primary_key=True)  # Unique identifier for the prescription item
-    prescription_id: int = Field(foreign_key="prescription.prescription_id")  # ID of the prescription this item belongs to
-    drug_id: int = Field(foreign_key="drug.drug_id") # Drug name
+    prescription_id: int = Field(foreign_key="prescription.prescription_id", index=True)  # ID of the prescription this item belongs to
+    drug_id: int = Field(foreign_key="drug.drug_id", index=True) # Drug name
     dosage: str = Field(default=None)  # Drug dosage
     quantity: int = Field(default=None)  # Quantity of drug
 
@@ -0,0 +1,64 @@
+import base64
+import binascii
+import json
+
+from fastapi import HTTPException
+from sqlalchemy import func, text
+from sqlmodel import Session, select
+from starlette import status
+
+
+# Keyset pagination: pages are ordered by a unique column and a page starts after the last key of the previous
+# one, so fetching page N costs the same as page 1 no matter how large the table gets (no OFFSET scans).
+# A cursor names the list it belongs to, a key of one list means nothing in another.
+
+
+def encode_cursor(last_key: int, scope: str) -> str:
+    return base64.urlsafe_b64encode(json.dumps({"k": last_key, "s": scope}).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, scope: str) -> int:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded))
+        last_key, cursor_scope = data["k"], data["s"]
+    except (binascii.Error, ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+    if not isinstance(last_key, int) or cursor_scope != scope:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+    return last_key
+
+
+def paginate(db: Session, stmt, key_column, limit: int, cursor: str | None, scope: str) -> tuple[list, str | None]:
+    """
+    Return one page of `stmt` ordered by `key_column` and the cursor of the next page (None on the last page).
+    scope names the endpoint and order, cursors from another scope are rejected
+    """
+    if cursor:
+        stmt = stmt.where(key_column > decode_cursor(cursor, scope))
+    # One extra row tells whether there is a next page without a separate COUNT
+    rows = db.exec(stmt.order_by(key_column).limit(limit + 1)).all()
+
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(getattr(rows[-1], key_column.key), scope)
+
+
+def approximate_count(db: Session, model, key_column) -> int:
+    """Cheap row count estimate: table statistics on MySQL, highest primary key elsewhere"""
+    bind = db.get_bind()
+    if bind.dialect.name == "mysql":
+        stmt = text("SELECT TABLE_ROWS FROM information_schema.TABLES "
+                    "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :table")
+        return int(db.connection().execute(stmt, {"table": model.__tablename__}).scalar() or 0)
+    return db.exec(select(func.max(key_column))).one() or 0
+
+
+def page_headers(next_cursor: str | None, total: int | None = None) -> dict:
+    headers = {}
+    if next_cursor:
+        headers["X-Next-Cursor"] = next_cursor
+    if total is not None:
+        headers["X-Total-Count"] = str(total)
+    return headers
@@ -0,0 +1,173 @@
+# On-disk index of weak (common or breached) passwords, memory-mapped so every worker process shares one copy
+# through the page cache and nothing is loaded at startup.
+#
+#   python -m api.password_index build --output api/weak_passwords.idx api/wordlist_pl.txt other_list.txt
+#   python -m api.password_index check --index api/weak_passwords.idx qwerty123456
+#
+# File layout: 16 byte header (magic, record width, record count) followed by the sorted, deduplicated
+# leading bytes of SHA-256 of every password. With the default 12 bytes a lookup of a strong password
+# wrongly matches with a probability of about count / 2^96, and 100 million passwords take 1.2 GB.
+
+import argparse
+import hashlib
+import heapq
+import mmap
+import os
+import struct
+import tempfile
+import threading
+from bisect import bisect_left
+
+from api.config import WEAK_PASSWORD_INDEX, WEAK_PASSWORD_WORDLIST
+
+
+MAGIC = b"TMPW"
+HEADER = struct.Struct("<4sIQ")  # magic, record width, record count
+DEFAULT_WIDTH = 12
+RUN_SIZE = 5_000_000  # Passwords sorted in memory at once while building
+
+
+def password_key(password: str, width: int = DEFAULT_WIDTH) -> bytes:
+    return hashlib.sha256(password.encode("utf-8")).digest()[:width]
+
+
+class _Records:
+    """Fixed-width records of the mapped file as a read-only sequence, so bisect can search it in place"""
+
+    def __init__(self, buffer: mmap.mmap, width: int, count: int):
+        self.buffer = buffer
+        self.width = width
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index: int) -> bytes:
+        start = HEADER.size + index * self.width
+        return self.buffer[start:start + self.width]
+
+
+class WeakPasswordIndex:
+    def __init__(self, path: str):
+        with open(path, "rb") as file:
+            self._buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, width, count = HEADER.unpack_from(self._buffer)
+        if magic != MAGIC or len(self._buffer) != HEADER.size + width * count:
+            self._buffer.close()
+            raise ValueError(f"{path} is not a weak password index")
+        self.path = path
+        self.width = width
+        self._records = _Records(self._buffer, width, count)
+
+    def __len__(self):
+        return len(self._records)
+
+    def __contains__(self, password: str) -> bool:
+        key = password_key(password, self.width)
+        position = bisect_left(self._records, key)
+        return position < len(self._records) and self._records[position] == key
+
+    def close(self):
+        self._buffer.close()
+
+
+def _write_run(keys: list[bytes], directory: str) -> str:
+    keys.sort()
+    with tempfile.NamedTemporaryFile("wb", dir=directory, suffix=".run", delete=False) as file:
+        file.write(b"".join(keys))
+        return file.name
+
+
+def _read_run(path: str, width: int):
+    with open(path, "rb") as file:
+        while record := file.read(width):
+            yield record
+
+
+def build_index(wordlists: list[str], output: str, width: int = DEFAULT_WIDTH, run_size: int = RUN_SIZE) -> int:
+    """
+    Build an index from wordlists with one password per line, returns the number of distinct passwords.
+    Lists larger than run_size are sorted in runs on disk and merged, so memory stays bounded for any input.
+    """
+    directory = os.path.dirname(os.path.abspath(output))
+    runs = []
+    keys = []
+    try:
+        for wordlist in wordlists:
+            with open(wordlist, "r", encoding="utf-8", errors="replace") as file:
+                for line in file:
+                    password = line.strip()
+                    if password:
+                        keys.append(password_key(password, width))
+                    if len(keys) >= run_size:
+                        runs.append(_write_run(keys, directory))
+                        keys = []
+        if keys or not runs:
+            runs.append(_write_run(keys, directory))
+
+        # Written next to the target and renamed, so workers never map a half written file
+        count = 0
+        with tempfile.NamedTemporaryFile("wb", dir=directory, suffix=".idx", delete=False) as file:
+            file.write(HEADER.pack(MAGIC, width, 0))
+            previous = None
+            for key in heapq.merge(*(_read_run(run, width) for run in runs)):
+                if key != previous:
+                    file.write(key)
+                    count += 1
+                    previous = key
+            file.seek(0)
+            file.write(HEADER.pack(MAGIC, width, count))
+        # NamedTemporaryFile creates the file as 0600, workers running as another user must still be able to map it
+        os.chmod(file.name, 0o644)
+        os.replace(file.name, output)
+        return count
+    finally:
+        for run in runs:
+            os.remove(run)
+
+
+_index: WeakPasswordIndex | None = None
+_index_lock = threading.Lock()
+
+
+def get_weak_password_index() -> WeakPasswordIndex:
+    """The shared index, opened on first use. It is built from WEAK_PASSWORD_WORDLIST when the file is missing"""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                if not os.path.exists(WEAK_PASSWORD_INDEX):
+                    build_index([WEAK_PASSWORD_WORDLIST], WEAK_PASSWORD_INDEX)
+                _index = WeakPasswordIndex(WEAK_PASSWORD_INDEX)
+    return _index
+
+
+def is_weak_password(password: str) -> bool:
+    return password in get_weak_password_index()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or query the weak password index")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    build = commands.add_parser("build", help="Convert wordlists (one password per line) into an index")
+    build.add_argument("wordlists", nargs="+")
+    build.add_argument("--output", default=WEAK_PASSWORD_INDEX)
+    build.add_argument("--width", type=int, default=DEFAULT_WIDTH, help="Bytes of SHA-256 stored per password")
+
+    check = commands.add_parser("check", help="Look passwords up in an index")
+    check.add_argument("passwords", nargs="+")
+    check.add_argument("--index", default=WEAK_PASSWORD_INDEX)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        count = build_index(args.wordlists, args.output, args.width)
+        print(f"Wrote {count} passwords to {args.output}")
+    else:
+        index = WeakPasswordIndex(args.index)
+        for password in args.passwords:
+            print(f"{password}: {'weak' if password in index else 'not found'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -7,11 +7,42 @@ from sqlmodel import Session, select, func
 from api.security import generate_secure_password, hash_password
 from api.functions import *
 from api.models import *
+from api.schemas import *
 from api.database import engine, get_db
 from api.security import credentials_exception
+from api.booking import book_appointment, cancel_appointment
 
 
 patient_router = APIRouter()
 
 # To be developed further, functionality could be split into multiple files in this new directory. Like CRUD separate from more complicated actions.
-# To use this router in more files just import it, and use as usual.
\ No newline at end of file
+# To use this router in more files just import it, and use as usual.
+
+
+def get_patient_id(payload: dict = Depends(verify_token), db: Session = Depends(get_db)) -> int:
+    if not payload or payload.get("type") != "Patient":
+        raise credentials_exception
+
+    patient_id = db.exec(select(User.link_id).where(User.email == payload["sub"])).first()
+    if patient_id is None:
+        raise credentials_exception
+    return patient_id
+
+
+@patient_router.post("/appointments", tags=["patient"], status_code=status.HTTP_201_CREATED,
+                     response_model=BookedAppointment, responses={409: {"model": ErrorSchema}})
+def book(booking: BookAppointment, db: Session = Depends(get_db), patient_id: int = Depends(get_patient_id)):
+    """
+    Book an appointment with a doctor. Free slots are listed by GET /misc/availability.
+    Returns 409 when the slot was booked by someone else in the meantime.
+    """
+
+    return book_appointment(db, patient_id, booking.doctor_id, booking.start, booking.reason)
+
+
+@patient_router.delete("/appointments/{appointment_id}", tags=["patient"], response_model=MessageSchema)
+def cancel(appointment_id: int, db: Session = Depends(get_db), patient_id: int = Depends(get_patient_id)):
+    """Cancel one of your scheduled appointments, the slot becomes free again"""
+
+    cancel_appointment(db, patient_id, appointment_id)
+    return {"message": "Appointment cancelled"}
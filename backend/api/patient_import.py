@@ -0,0 +1,248 @@
+import csv
+import io
+import json
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from enum import Enum
+
+from fastapi import HTTPException
+from pydantic import ValidationError
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session, select
+from starlette import status
+
+from api.config import IMPORT_CHUNK_SIZE, IMPORT_MAX_JOBS
+from api.database import engine
+from api.functions import invalidate_principal
+from api.hashing import hash_passwords
+from api.models import Patient, User, UserType
+from api.schemas import NewPatient
+from api.security import generate_secure_password
+
+
+# Bulk onboarding of patients. Rows are validated with the same rules as /admin/patients/add, then every chunk
+# gets its passwords hashed in the hashing worker pool and is inserted in a single transaction.
+# Jobs live in memory, so status and password files are only available from the process that ran the import.
+
+
+class ImportFormat(str, Enum):
+    csv = "csv"
+    ndjson = "ndjson"
+
+
+class ImportStatus(str, Enum):
+    pending = "pending"
+    running = "running"
+    completed = "completed"
+    failed = "failed"
+
+
+class ImportJob:
+    def __init__(self, total: int):
+        self.id = uuid.uuid4().hex
+        self.status = ImportStatus.pending
+        self.total = total
+        self.processed = 0
+        self.created = 0
+        self.failed = 0
+        self.error: str | None = None
+        self.started_at = time.time()
+        self.finished_at: float | None = None
+        self.report: list[dict] = []
+        self.passwords: list[tuple[str, str]] | None = []
+
+    def add_result(self, row: int, email: str | None, error: str | None = None):
+        self.report.append({"row": row, "email": email, "status": "error" if error else "created", "detail": error})
+        self.processed += 1
+        if error:
+            self.failed += 1
+        else:
+            self.created += 1
+
+    @property
+    def retired(self) -> bool:
+        """Finished and nothing left to hand out, so the job can be dropped"""
+        return self.finished_at is not None and not self.passwords
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "status": self.status,
+            "total": self.total,
+            "processed": self.processed,
+            "created": self.created,
+            "failed": self.failed,
+            "error": self.error,
+            "passwords_available": self.finished_at is not None and self.passwords is not None,
+            "report": sorted(self.report, key=lambda entry: entry["row"]),
+        }
+
+
+class ImportJobStore:
+    """
+    Recent import jobs. Once max_jobs is exceeded the oldest retired jobs are dropped, a job still running or with
+    passwords not yet downloaded is kept and new imports are refused with 503 instead
+    """
+
+    def __init__(self, max_jobs: int):
+        self.max_jobs = max_jobs
+        self._jobs: OrderedDict[str, ImportJob] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, job: ImportJob):
+        with self._lock:
+            retired = [job_id for job_id, stored in self._jobs.items() if stored.retired]
+            excess = len(self._jobs) + 1 - self.max_jobs
+            if excess > len(retired):
+                raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                                    detail="Too many unfinished imports, wait for them and download their passwords")
+            for job_id in retired[:max(0, excess)]:
+                del self._jobs[job_id]
+            self._jobs[job.id] = job
+
+    def get(self, job_id: str) -> ImportJob:
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Import job not found")
+        return job
+
+
+import_jobs = ImportJobStore(IMPORT_MAX_JOBS)
+
+
+def detect_format(filename: str | None, content_type: str | None) -> ImportFormat:
+    filename = (filename or "").lower()
+    content_type = (content_type or "").lower()
+    if filename.endswith(".csv") or "csv" in content_type:
+        return ImportFormat.csv
+    if filename.endswith((".ndjson", ".jsonl")) or "ndjson" in content_type or "jsonl" in content_type:
+        return ImportFormat.ndjson
+    raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                        detail="Unknown file format, upload a .csv or .ndjson file or pass format")
+
+
+def parse_rows(data: bytes, format: ImportFormat) -> list[dict | str]:
+    """Rows of the upload in order. A row that cannot be parsed is kept as its error message"""
+    try:
+        text = data.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="File must be UTF-8 encoded")
+
+    if format == ImportFormat.csv:
+        return [dict(row) for row in csv.DictReader(io.StringIO(text))]
+
+    rows = []
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except json.JSONDecodeError:
+            rows.append("Invalid JSON")
+            continue
+        rows.append(row if isinstance(row, dict) else "Row must be a JSON object")
+    return rows
+
+
+def validate_row(row: dict | str) -> tuple[NewPatient | None, str | None]:
+    if isinstance(row, str):
+        return None, row
+
+    row = {key.strip(): value.strip() if isinstance(value, str) else value for key, value in row.items() if key}
+    if not row.get("middle_name"):
+        row["middle_name"] = None
+    try:
+        return NewPatient(**row), None
+    except HTTPException as e:
+        return None, e.detail
+    except ValidationError as e:
+        error = e.errors()[0]
+        return None, f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}"
+
+
+def _import_chunk(job: ImportJob, chunk: list[tuple[int, NewPatient]], credentials: list[tuple[str, str]] | None = None):
+    """Insert a chunk in one transaction. credentials are the (password, hash) pairs of the rows when already hashed"""
+    if credentials is None:
+        passwords = [generate_secure_password() for _ in chunk]
+        credentials = list(zip(passwords, hash_passwords(passwords)))
+
+    with Session(engine) as db:
+        patients = [Patient(first_name=data.first_name,
+                            middle_name=data.middle_name,
+                            last_name=data.last_name,
+                            PESEL=data.PESEL,
+                            gender=data.gender,
+                            address=data.address,
+                            phone_number=data.phone_number) for _, data in chunk]
+        db.add_all(patients)
+        db.flush()
+        db.add_all([User(email=data.email, hashed_password=hashed, type=UserType.Patient, link_id=patient.id)
+                    for (_, data), patient, (_, hashed) in zip(chunk, patients, credentials)])
+        try:
+            db.commit()
+        except IntegrityError:
+            # Someone registered one of the emails after our duplicate check, retry the rows one by one with the
+            # hashes already computed
+            db.rollback()
+            if len(chunk) > 1:
+                for entry, credential in zip(chunk, credentials):
+                    _import_chunk(job, [entry], [credential])
+            else:
+                job.add_result(chunk[0][0], chunk[0][1].email, "User already exists")
+            return
+
+    for (row, data), (password, _) in zip(chunk, credentials):
+        job.passwords.append((data.email, password))
+        job.add_result(row, data.email)
+        invalidate_principal(data.email)
+
+
+def run_import(job: ImportJob, rows: list[dict | str], chunk_size: int = IMPORT_CHUNK_SIZE):
+    job.status = ImportStatus.running
+    seen_emails = set()
+    try:
+        for start in range(0, len(rows), chunk_size):
+            valid = []
+            for row, data in enumerate(rows[start:start + chunk_size], start=start + 1):
+                patient, error = validate_row(data)
+                if error:
+                    job.add_result(row, data.get("email") if isinstance(data, dict) else None, error)
+                elif patient.email in seen_emails:
+                    job.add_result(row, patient.email, "Duplicate email in file")
+                else:
+                    seen_emails.add(patient.email)
+                    valid.append((row, patient))
+
+            with Session(engine) as db:
+                existing = set(db.exec(select(User.email).where(User.email.in_([data.email for _, data in valid]))))
+            for row, data in valid:
+                if data.email in existing:
+                    job.add_result(row, data.email, "User already exists")
+            valid = [(row, data) for row, data in valid if data.email not in existing]
+
+            if valid:
+                _import_chunk(job, valid)
+        job.status = ImportStatus.completed
+    except Exception as e:
+        job.status = ImportStatus.failed
+        job.error = str(e) or e.__class__.__name__
+    finally:
+        job.finished_at = time.time()
+
+
+def passwords_csv(job: ImportJob) -> str:
+    """Temporary passwords of the created accounts. They are handed out once and then dropped from memory"""
+    if job.finished_at is None:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Import has not finished")
+    if job.passwords is None:
+        raise HTTPException(status_code=status.HTTP_410_GONE, detail="Passwords were already downloaded")
+
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(["email", "temp_password"])
+    writer.writerows(job.passwords)
+    job.passwords = None
+    return output.getvalue()
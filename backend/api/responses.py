@@ -0,0 +1,22 @@
+from functools import lru_cache
+
+from fastapi.responses import Response
+from pydantic import BaseModel, TypeAdapter
+
+
+# Handlers that already build their response models can return typed_response(...) instead of the models.
+# FastAPI passes Response objects through untouched, so the content is not validated a second time against
+# response_model (which stays on the route for the OpenAPI schema), and pydantic-core writes the JSON directly.
+
+
+@lru_cache(maxsize=None)
+def _list_adapter(model: type[BaseModel]) -> TypeAdapter:
+    return TypeAdapter(list[model])
+
+
+def typed_response(content: BaseModel | list[BaseModel], status_code: int = 200, headers: dict | None = None) -> Response:
+    if isinstance(content, list):
+        body = _list_adapter(type(content[0])).dump_json(content) if content else b"[]"
+    else:
+        body = content.model_dump_json()
+    return Response(content=body, status_code=status_code, headers=headers, media_type="application/json")
@@ -8,16 +8,13 @@ from typing import Optional, List, Union
 from datetime import datetime,date
 
 from api.models import *
+from api.password_index import is_weak_password
 
 
 email_regex = r"^[\w\-\.]+@([\w-]+\.)+[\w-]{2,}$"
 email_pattern = re.compile(email_regex, re.IGNORECASE)
 
 
-with open("api/wordlist_pl.txt", 'r', encoding="utf-8") as file:
-    weak_passwords_set = {line.strip() for line in file if line.strip()}
-
-
 def validate_email(email: str) -> bool:
     return bool(email_pattern.fullmatch(email))
 
@@ -29,7 +26,7 @@ class PasswordMixin(BaseModel):
         if len(value) < 12:
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
                                 detail="The password must be at least 12 characters long.")
-        if value in weak_passwords_set:
+        if is_weak_password(value):
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="This password is considered too weak")
         return value
 
@@ -257,4 +254,53 @@ class NewPatientResponse(SQLModel):
 
 class NewDoctorResponse(SQLModel):
     message: str
-    doctor_temp_password: str
\ No newline at end of file
+    doctor_temp_password: str
+
+class ImportRowReport(SQLModel):
+    row: int
+    email: Optional[str]
+    status: str
+    detail: Optional[str]
+
+class ImportJobStatus(SQLModel):
+    id: str
+    status: str
+    total: int
+    processed: int
+    created: int
+    failed: int
+    error: Optional[str]
+    passwords_available: bool
+    report: List[ImportRowReport]
+
+class AvailableSlot(SQLModel):
+    doctor_id: int
+    first_name: str
+    last_name: str
+    speciality_id: Optional[int]
+    facility_id: int
+    start: datetime
+    end: datetime
+
+class BookAppointment(SQLModel):
+    doctor_id: int
+    start: datetime
+    reason: Optional[str] = Field(default=None, max_length=512)
+
+class BookedAppointment(SQLModel):
+    id: int
+    doctor_id: int
+    facility_ids: List[int]
+    start: datetime
+    end: datetime
+    status: AppointmentStatus
+
+class TranscriptSegment(SQLModel):
+    start: float  # Seconds from the start of the recording
+    end: float
+    text: str
+    final: bool
+
+class TranscriptTail(SQLModel):
+    segments: List[TranscriptSegment]
+    next: int  # Pass as after= to get the segments stored later
@@ -2,28 +2,89 @@ from typing import Annotated
 
 from fastapi import Depends, HTTPException, Cookie
 from passlib.context import CryptContext
-from jose import JWTError, jwt
+from jose import JWTError, jwt, jwk
+from jose.backends.base import Key
 from fastapi.security import OAuth2PasswordBearer
 from datetime import datetime, timedelta
 import pyotp
 from starlette import status
 import secrets, string
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+
+from sqlmodel import Session, delete
 
 from api.models import *
+from api.database import engine
+
+from api.config import (HASH_PROFILE, HASH_TIME_COST, HASH_MEMORY_COST, HASH_PARALLELISM, TOKEN_CACHE_SIZE,
+                        TOKEN_REVOCATION_CHECK_SECONDS, JWT_PRIVATE_KEY_PATH, JWT_PUBLIC_KEY_PATH)
+
+# Argon2 cost profiles, selected with the HASH_PROFILE environment variable
+HASH_PROFILES = {
+    "production": {"time_cost": 25, "memory_cost": 128 * 1024, "parallelism": 4},
+    "staging": {"time_cost": 4, "memory_cost": 64 * 1024, "parallelism": 2},
+    "test": {"time_cost": 1, "memory_cost": 8 * 1024, "parallelism": 1},
+}
+
+
+def get_hash_settings(profile: str = HASH_PROFILE) -> dict:
+    if profile not in HASH_PROFILES:
+        raise ValueError(f"Unknown hashing profile '{profile}', expected one of: {', '.join(HASH_PROFILES)}")
+
+    settings = dict(HASH_PROFILES[profile])
+    # Values measured on the host by api/calibrate_hashing.py take precedence over the profile
+    if HASH_TIME_COST:
+        settings["time_cost"] = HASH_TIME_COST
+    if HASH_MEMORY_COST:
+        settings["memory_cost"] = HASH_MEMORY_COST
+    if HASH_PARALLELISM:
+        settings["parallelism"] = HASH_PARALLELISM
+    return settings
+
+
+def build_pwd_context(time_cost: int, memory_cost: int, parallelism: int) -> CryptContext:
+    # Hashes created with different parameters are reported by needs_update() and rehashed on login
+    return CryptContext(schemes=["argon2"], deprecated="auto",
+                        argon2__time_cost=time_cost,
+                        argon2__memory_cost=memory_cost,
+                        argon2__parallelism=parallelism,
+                        argon2__hash_len=64,
+                        argon2__salt_size=16)
+
 
 # Use Argon2 for hashing
-pwd_context = CryptContext(schemes=["argon2"], deprecated="auto",
-                            argon2__time_cost=25,
-                            argon2__memory_cost=128 *1024,
-                            argon2__parallelism=4,
-                            argon2__hash_len=64,
-                            argon2__salt_size=16)
+pwd_context = build_pwd_context(**get_hash_settings())
+
+
+@lru_cache(maxsize=None)
+def _read_key(path: str) -> str:
+    with open(path, "r") as key_file:
+        return key_file.read()
 
 
-with open("DEV_private_key.pem", "r") as key_file:
-    private_key = key_file.read()
-with open("DEV_public_key.pem", "r") as key_file:
-    public_key = key_file.read()
+# Keys are read and parsed on first use instead of on import. Parsing the RSA private key is by far the most
+# expensive part of signing a token, so the parsed key objects are kept and reused for every token.
+@lru_cache(maxsize=None)
+def get_signing_key() -> Key:
+    return jwk.construct(_read_key(JWT_PRIVATE_KEY_PATH), ALGORITHM)
+
+
+@lru_cache(maxsize=None)
+def get_verification_key() -> Key:
+    return jwk.construct(_read_key(JWT_PUBLIC_KEY_PATH), ALGORITHM)
+
+
+def __getattr__(name: str):
+    # private_key / public_key used to be module attributes holding the PEM text, keep them importable
+    if name == "private_key":
+        return _read_key(JWT_PRIVATE_KEY_PATH)
+    if name == "public_key":
+        return _read_key(JWT_PUBLIC_KEY_PATH)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 ALGORITHM = "RS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
@@ -58,6 +119,10 @@ def hash_password(password: str) -> str:
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
+def verify_and_update_password(plain_password: str, hashed_password: str) -> tuple[bool, str | None]:
+    """Verify the password and return a new hash if the stored one was created with outdated parameters"""
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
 def create_token_from_user(user: User):
 
 
@@ -65,7 +130,7 @@ def create_token_from_user(user: User):
     expire = datetime.utcnow() + timedelta(hours=2)
 
     to_encode.update({"exp": expire})
-    return jwt.encode(to_encode, private_key, algorithm=ALGORITHM)
+    return jwt.encode(to_encode, get_signing_key(), algorithm=ALGORITHM)
 
 def create_token_from_data(sub: string, type: string):
 
@@ -74,20 +139,133 @@ def create_token_from_data(sub: string, type: string):
     expire = datetime.utcnow() + timedelta(hours=2)
 
     to_encode.update({"exp": expire})
-    return jwt.encode(to_encode, private_key, algorithm=ALGORITHM)
+    return jwt.encode(to_encode, get_signing_key(), algorithm=ALGORITHM)
+
+class VerifiedTokenCache:
+    """
+    Bounded LRU cache of already verified JWT payloads, keyed by the SHA-256 digest of the token.
+    Entries expire together with the token's `exp` claim, so a cached payload is never valid longer than the token,
+    and after check_seconds at the latest, so tokens revoked by another worker are noticed (see verify_token).
+    Revocations of this worker are also kept in process memory until the revoked token would have expired anyway.
+    """
+
+    def __init__(self, max_size: int, check_seconds: int = TOKEN_REVOCATION_CHECK_SECONDS):
+        self.max_size = max_size
+        self.check_seconds = check_seconds
+        self._entries: OrderedDict[bytes, tuple[float, dict]] = OrderedDict()
+        self._revoked: dict[bytes, float] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def digest(token: str) -> bytes:
+        return hashlib.sha256(token.encode()).digest()
+
+    def is_revoked(self, digest: bytes) -> bool:
+        return digest in self._revoked
+
+    def get(self, digest: bytes) -> dict | None:
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is None or entry[0] <= time.time():
+                if entry is not None:
+                    del self._entries[digest]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(digest)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, digest: bytes, payload: dict):
+        expires_at = payload.get("exp")
+        if self.max_size <= 0 or not isinstance(expires_at, (int, float)):
+            return
+        with self._lock:
+            self._entries[digest] = (min(expires_at, time.time() + self.check_seconds), payload)
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def revoke(self, digest: bytes, expires_at: float):
+        with self._lock:
+            now = time.time()
+            self._revoked = {key: exp for key, exp in self._revoked.items() if exp > now}
+            self._revoked[digest] = expires_at
+            self._entries.pop(digest, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._revoked.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"size": len(self._entries),
+                    "max_size": self.max_size,
+                    "revoked": len(self._revoked),
+                    "hits": self.hits,
+                    "misses": self.misses,
+                    "hit_ratio": self.hits / lookups if lookups else 0.0}
+
+
+token_cache = VerifiedTokenCache(TOKEN_CACHE_SIZE)
+
+
+# Logouts are stored in the revoked_token table, so every worker, including ones started later, rejects the
+# token. A worker checks the table whenever it verifies a token that is not in its cache, cache entries are
+# only trusted for TOKEN_REVOCATION_CHECK_SECONDS.
+
+def is_revoked_token(digest: bytes) -> bool:
+    with Session(engine) as db:
+        return db.get(RevokedToken, digest.hex()) is not None
+
 
 def verify_token(access_token: Annotated[str | None, Cookie()] = None):
     if not access_token:
         raise credentials_exception
-    try:
-        # Decode the JWT token
-        payload = jwt.decode(access_token, public_key, algorithms=[ALGORITHM])
+
+    digest = token_cache.digest(access_token)
+    if token_cache.is_revoked(digest):
+        raise credentials_exception
+
+    payload = token_cache.get(digest)
+    if payload is None:
+        try:
+            # Decode the JWT token
+            payload = jwt.decode(access_token, get_verification_key(), algorithms=[ALGORITHM])
+        except JWTError as e:
+            raise credentials_exception
         email: str = payload.get("sub")
         if email is None:
             raise credentials_exception
-        return payload
-    except JWTError as e:
-        raise credentials_exception
+        if is_revoked_token(digest):
+            token_cache.revoke(digest, payload.get("exp", time.time()))
+            raise credentials_exception
+        token_cache.put(digest, payload)
+
+    # Callers get their own copy so the cached payload cannot be modified
+    return dict(payload)
+
+
+def revoke_token(access_token: str):
+    """Reject the token on every worker until it expires"""
+    try:
+        payload = jwt.decode(access_token, get_verification_key(), algorithms=[ALGORITHM])
+    except JWTError:
+        return  # Invalid or expired tokens are rejected anyway
+    digest = token_cache.digest(access_token)
+    expires_at = payload.get("exp", time.time())
+    token_cache.revoke(digest, expires_at)
+
+    with Session(engine) as db:
+        db.merge(RevokedToken(digest=digest.hex(), expires_at=datetime.utcfromtimestamp(expires_at)))
+        # Expired tokens are rejected without the table, their rows can go
+        db.exec(delete(RevokedToken).where(RevokedToken.expires_at < datetime.utcnow()))
+        db.commit()
 
 
 def encrypt_field(data: str):
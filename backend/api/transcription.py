@@ -0,0 +1,438 @@
+import asyncio
+import inspect
+import json
+import time
+import zlib
+from abc import ABC, abstractmethod
+from collections import deque
+
+from typing import TYPE_CHECKING, List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, WebSocket, WebSocketDisconnect, WebSocketException
+from sqlmodel import Session
+from starlette import status
+from starlette.concurrency import run_in_threadpool
+
+from api.config import STT_ENGINE, STT_LANGUAGE, STT_SAMPLE_RATE, STT_BUFFER_MS, STT_MAX_SESSIONS, VAD_ENABLED
+from api.database import engine, get_db
+from api.functions import get_my_info
+from api.metrics import Counter, Gauge, Histogram, registry
+from api.models import Appointment, AppointmentStatus
+from api.schemas import TranscriptSegment, TranscriptTail
+from api.security import verify_token
+from api.transcripts import TranscriptWriter, read_range, read_tail, transcript_position
+
+if TYPE_CHECKING:
+    from api.vad import VoiceActivityDetector
+
+
+# Live transcription of an appointment. The doctor's client streams audio over a WebSocket as binary messages
+# of 16 bit little endian mono PCM at STT_SAMPLE_RATE, and sends {"type": "end"} when the appointment is over.
+# The server answers with {"type": "partial" | "final", "start", "end", "text"} messages as the engine produces
+# them, and {"type": "done", ...session statistics} at the end.
+#
+# Audio goes through a fixed size ring buffer between the socket reader and the engine. When the engine falls
+# behind the buffer fills up and the reader stops receiving, so the client is slowed down by TCP flow control
+# instead of the worker buffering without bound.
+#
+# With VAD_ENABLED a voice activity detector (api/vad.py) sits between the buffer and the engine, so silence
+# and noise are never sent for recognition. It is imported with the first session, NumPy would otherwise load
+# on every worker start.
+#
+# Final segments are stored in the transcript store (api/transcripts.py), also when the client disconnects
+# before the audio it sent was transcribed. A new session of the same appointment continues the timeline.
+#
+# Engines are registered by name (STT_ENGINES) and picked with STT_ENGINE. The "stub" engine is deterministic
+# and needs no network, so tests and benchmarks run offline. A cloud engine is added with register_engine.
+
+BYTES_PER_SAMPLE = 2
+
+chunk_latency = registry.register(Histogram(
+    "stt_chunk_latency_seconds", "Time from receiving an audio chunk until the engine processed it and its segments were sent"))
+audio_seconds = registry.register(Counter(
+    "stt_audio_seconds_total", "Seconds of audio received for transcription"))
+speech_seconds = registry.register(Counter(
+    "stt_speech_seconds_total", "Seconds of audio the voice activity detector passed on to the engine"))
+active_sessions = registry.register(Gauge(
+    "stt_sessions_active", "Open transcription sessions"))
+
+
+class AudioRingBuffer:
+    """
+    Fixed capacity byte ring for one producer and one consumer on the same event loop. write() waits while the
+    ring is full, read() while it is empty. Reads are whole multiples of align, so samples are never split.
+    """
+
+    def __init__(self, capacity: int, align: int = BYTES_PER_SAMPLE):
+        self.capacity = capacity - capacity % align
+        self.align = align
+        self.written = 0  # Stream offsets of everything written and read so far
+        self.consumed = 0
+        self.full_waits = 0
+        self.closed = False
+        self._buffer = bytearray(self.capacity)
+        self._start = 0
+        self._size = 0
+        self._readable = asyncio.Event()
+        self._writable = asyncio.Event()
+
+    def __len__(self):
+        return self._size
+
+    async def write(self, data: bytes):
+        view = memoryview(data)
+        while view:
+            while self._size == self.capacity:
+                self.full_waits += 1
+                self._writable.clear()
+                await self._writable.wait()
+            count = min(len(view), self.capacity - self._size)
+            end = (self._start + self._size) % self.capacity
+            first = min(count, self.capacity - end)
+            self._buffer[end:end + first] = view[:first]
+            self._buffer[:count - first] = view[first:count]
+            self._size += count
+            self.written += count
+            view = view[count:]
+            self._readable.set()
+
+    def close(self):
+        """No more writes, read() returns what is left and then b"" """
+        self.closed = True
+        self._readable.set()
+
+    async def read(self, max_bytes: int) -> bytes:
+        while self._size < self.align:
+            if self.closed:
+                return b""
+            self._readable.clear()
+            await self._readable.wait()
+        count = min(self._size, max_bytes)
+        count -= count % self.align
+        first = min(count, self.capacity - self._start)
+        data = bytes(self._buffer[self._start:self._start + first]) + bytes(self._buffer[:count - first])
+        self._start = (self._start + count) % self.capacity
+        self._size -= count
+        self.consumed += count
+        self._writable.set()
+        return data
+
+
+class SttEngine(ABC):
+    """
+    One recognition stream. feed() gets consecutive PCM with the stream time of its first sample, a jump in
+    offset means audio was left out. Both methods return the segments that became available.
+    """
+
+    def __init__(self, sample_rate: int, language: str):
+        self.sample_rate = sample_rate
+        self.language = language
+
+    @abstractmethod
+    async def feed(self, pcm: bytes, offset: float) -> list[TranscriptSegment]:
+        ...
+
+    @abstractmethod
+    async def finish(self) -> list[TranscriptSegment]:
+        ...
+
+
+class StubEngine(SttEngine):
+    """
+    Deterministic stand-in for a recognizer. Every word_ms of audio becomes one word picked by a checksum of its
+    samples, a partial hypothesis is sent after every feed and utterance_words words (or a gap) make a final.
+    """
+
+    WORDS = ("pacjent", "zgłasza", "ból", "głowy", "od", "trzech", "dni", "bez", "gorączki", "ciśnienie", "w",
+             "normie", "zalecam", "odpoczynek", "i", "kontrolę")
+
+    def __init__(self, sample_rate: int, language: str, word_ms: int = 400, utterance_words: int = 8):
+        super().__init__(sample_rate, language)
+        self.bytes_per_second = sample_rate * BYTES_PER_SAMPLE
+        self.word_bytes = self.bytes_per_second * word_ms // 1000
+        self.utterance_words = utterance_words
+        self._words: list[str] = []
+        self._utterance_start = 0.0
+        self._word_start = 0.0
+        self._word_end = 0.0
+        self._position = 0.0  # Stream time of the next expected sample
+        self._pending = 0  # Bytes of the word being heard
+        self._checksum = 0
+
+    def _segment(self, final: bool) -> TranscriptSegment:
+        return TranscriptSegment(start=round(self._utterance_start, 3), end=round(self._word_end, 3),
+                                 text=" ".join(self._words), final=final)
+
+    def _final(self) -> list[TranscriptSegment]:
+        if not self._words:
+            return []
+        segment = self._segment(final=True)
+        self._words = []
+        return [segment]
+
+    async def feed(self, pcm: bytes, offset: float) -> list[TranscriptSegment]:
+        segments = []
+        if offset > self._position + 1e-6:
+            # A pause ends the utterance, a word cut by it is dropped
+            segments += self._final()
+            self._pending = self._checksum = 0
+
+        view = memoryview(pcm)
+        position = offset
+        heard = False
+        while view:
+            if not self._pending:
+                self._word_start = position
+            count = min(len(view), self.word_bytes - self._pending)
+            self._checksum = zlib.crc32(view[:count], self._checksum)
+            self._pending += count
+            position += count / self.bytes_per_second
+            view = view[count:]
+            if self._pending == self.word_bytes:
+                if not self._words:
+                    self._utterance_start = self._word_start
+                self._words.append(self.WORDS[self._checksum % len(self.WORDS)])
+                self._word_end = position
+                self._pending = self._checksum = 0
+                heard = True
+                if len(self._words) == self.utterance_words:
+                    segments += self._final()
+        self._position = position
+
+        if heard and self._words:
+            segments.append(self._segment(final=False))
+        return segments
+
+    async def finish(self) -> list[TranscriptSegment]:
+        return self._final()
+
+
+STT_ENGINES = {"stub": StubEngine}
+
+
+def register_engine(name: str, factory):
+    """factory(sample_rate, language) -> SttEngine, an engine class missing feed() or finish() is refused"""
+    if inspect.isabstract(factory):
+        missing = ", ".join(sorted(factory.__abstractmethods__))
+        raise TypeError(f"STT engine {name!r} does not implement {missing}")
+    STT_ENGINES[name] = factory
+
+
+def create_engine(name: str = STT_ENGINE) -> SttEngine:
+    factory = STT_ENGINES.get(name)
+    if factory is None:
+        raise RuntimeError(f"Unknown STT engine {name!r}, registered: {', '.join(STT_ENGINES)}")
+    return factory(STT_SAMPLE_RATE, STT_LANGUAGE)
+
+
+def create_vad() -> "VoiceActivityDetector | None":
+    if not VAD_ENABLED:
+        return None
+    from api.vad import VoiceActivityDetector
+    return VoiceActivityDetector(STT_SAMPLE_RATE)
+
+
+class TranscriptionSession:
+    """Audio of one connection on its way through the ring buffer to the engine, with per chunk latency"""
+
+    def __init__(self, stt: SttEngine, vad: "VoiceActivityDetector | None" = None,
+                 transcript: TranscriptWriter | None = None, offset: float = 0.0, buffer_ms: int = STT_BUFFER_MS):
+        self.stt = stt
+        self.vad = vad
+        self.transcript = transcript
+        self.offset = offset  # Stream time of the first sample, a reconnect continues after the stored transcript
+        self.bytes_per_second = stt.sample_rate * BYTES_PER_SAMPLE
+        self.buffer = AudioRingBuffer(max(self.bytes_per_second * buffer_ms // 1000, BYTES_PER_SAMPLE))
+        self.chunks = 0
+        self.segments = 0
+        self.latencies: list[float] = []
+        self._arrivals: deque[tuple[int, float]] = deque()  # (stream offset of the chunk end, arrival time)
+
+    async def receive(self, chunk: bytes):
+        # Timed from arrival, so waiting for room in a full buffer counts as latency
+        self.chunks += 1
+        self._arrivals.append((self.buffer.written + len(chunk), time.perf_counter()))
+        await self.buffer.write(chunk)
+        audio_seconds.inc(amount=len(chunk) / self.bytes_per_second)
+
+    def _processed(self, offset: int):
+        now = time.perf_counter()
+        while self._arrivals and self._arrivals[0][0] <= offset:
+            latency = now - self._arrivals.popleft()[1]
+            self.latencies.append(latency)
+            chunk_latency.observe(value=latency)
+
+    async def _send(self, segments: list[TranscriptSegment], send):
+        for segment in segments:
+            self.segments += 1
+            await send(segment)
+            if self.transcript is not None and self.transcript.add(segment):
+                await run_in_threadpool(self.transcript.flush)
+
+    async def _feed(self, pcm: bytes, offset: float, send):
+        await self._send(await self.stt.feed(pcm, self.offset + offset), send)
+
+    async def run(self, send):
+        """Feed the engine until the buffer is closed and drained, send(segment) for everything it returns"""
+        while True:
+            offset = self.buffer.consumed / self.bytes_per_second
+            pcm = await self.buffer.read(self.buffer.capacity)
+            if not pcm:
+                break
+            if self.vad is None:
+                await self._feed(pcm, offset, send)
+            else:
+                # Only speech reaches the engine, the offsets tell it where silence was cut out
+                for speech_offset, speech in self.vad.process(pcm):
+                    speech_seconds.inc(amount=len(speech) / self.bytes_per_second)
+                    await self._feed(speech, speech_offset, send)
+            self._processed(self.buffer.consumed)
+        if self.vad is not None:
+            for speech_offset, speech in self.vad.flush():
+                speech_seconds.inc(amount=len(speech) / self.bytes_per_second)
+                await self._feed(speech, speech_offset, send)
+        await self._send(await self.stt.finish(), send)
+        if self.transcript is not None:
+            await run_in_threadpool(self.transcript.flush)
+        self._processed(self.buffer.written)  # A trailing odd byte is never read
+
+    def stats(self) -> dict:
+        latencies = sorted(self.latencies)
+
+        def quantile(q: float) -> float | None:
+            return round(latencies[min(len(latencies) - 1, int(q * len(latencies)))], 6) if latencies else None
+
+        speech = self.vad.speech_samples * BYTES_PER_SAMPLE if self.vad is not None else self.buffer.written
+        return {"audio_seconds": round(self.buffer.written / self.bytes_per_second, 3),
+                "speech_seconds": round(speech / self.bytes_per_second, 3), "chunks": self.chunks,
+                "segments": self.segments, "buffer_full_waits": self.buffer.full_waits,
+                "latency_p50": quantile(0.5), "latency_p99": quantile(0.99), "latency_max": quantile(1.0)}
+
+
+def get_own_appointment(payload: dict, appointment_id: int, db: Session, allow_admin: bool = False) -> Appointment:
+    """The appointment if it is one of the doctor's (or any, for admins when allowed), HTTPException otherwise"""
+    if payload.get("type") == "Admin" and allow_admin:
+        appointment = db.get(Appointment, appointment_id)
+    elif payload.get("type") == "Doctor":
+        doctor = get_my_info(payload, db)["doctor"]
+        appointment = db.get(Appointment, appointment_id)
+        if appointment is not None and appointment.doctor_id != doctor.id:
+            appointment = None
+    else:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Only doctors can access transcripts")
+    if appointment is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Appointment not found")
+    return appointment
+
+
+def start_transcription(payload: dict, appointment_id: int) -> float:
+    """
+    Check the doctor may transcribe the appointment, a scheduled one is marked as in progress.
+    Returns where the stored transcript ends, the new session continues from there.
+    """
+    with Session(engine) as db:
+        appointment = get_own_appointment(payload, appointment_id, db)
+        if appointment.status == AppointmentStatus.SCHEDULED:
+            appointment.status = AppointmentStatus.IN_PROGRESS
+            db.commit()
+        elif appointment.status != AppointmentStatus.IN_PROGRESS:
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT,
+                                detail="Only scheduled or in progress appointments can be transcribed")
+        return transcript_position(db, appointment_id)[1]
+
+
+def _is_end(text: str) -> bool:
+    try:
+        return json.loads(text).get("type") == "end"
+    except (ValueError, AttributeError):
+        return False
+
+
+transcription_router = APIRouter()
+_sessions = 0  # Open sessions of this worker, all on its event loop
+
+
+@transcription_router.websocket("/appointments/{appointment_id}/ws")
+async def transcribe_appointment(websocket: WebSocket, appointment_id: int, payload: dict = Depends(verify_token)):
+    """
+    Stream appointment audio in, get transcript segments back. Binary messages are PCM audio, the text message
+    {"type": "end"} finishes the recording. The first message from the server is {"type": "ready", ...}.
+    """
+    global _sessions
+    if _sessions >= STT_MAX_SESSIONS:
+        raise WebSocketException(code=status.WS_1013_TRY_AGAIN_LATER, reason="Too many transcription sessions")
+    # The slot is taken before the first await, so handshakes arriving together cannot all pass the check
+    _sessions += 1
+    active_sessions.inc()
+    try:
+        await _transcribe(websocket, appointment_id, payload)
+    finally:
+        _sessions -= 1
+        active_sessions.dec()
+
+
+async def _transcribe(websocket: WebSocket, appointment_id: int, payload: dict):
+    try:
+        offset = await run_in_threadpool(start_transcription, payload, appointment_id)
+    except HTTPException as e:
+        raise WebSocketException(code=status.WS_1008_POLICY_VIOLATION, reason=e.detail)
+
+    session = TranscriptionSession(create_engine(), create_vad(), TranscriptWriter(appointment_id), offset)
+    await websocket.accept()
+
+    connected = True
+
+    async def send(segment: TranscriptSegment):
+        # After a disconnect the rest of the audio is still transcribed, for the transcript store
+        nonlocal connected
+        if connected:
+            try:
+                await websocket.send_json({"type": "final" if segment.final else "partial", "start": segment.start,
+                                           "end": segment.end, "text": segment.text})
+            except (WebSocketDisconnect, RuntimeError):
+                connected = False
+
+    async def receive():
+        try:
+            while True:
+                message = await websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    break
+                if message.get("bytes"):
+                    await session.receive(message["bytes"])
+                elif message.get("text") and _is_end(message["text"]):
+                    break
+        finally:
+            session.buffer.close()
+
+    receiver = asyncio.ensure_future(receive())
+    try:
+        await websocket.send_json({"type": "ready", "engine": STT_ENGINE, "sample_rate": STT_SAMPLE_RATE,
+                                   "encoding": "pcm_s16le", "buffer_bytes": session.buffer.capacity})
+        await session.run(send)
+        await websocket.send_json({"type": "done", **session.stats()})
+        await websocket.close()
+    except (WebSocketDisconnect, RuntimeError):
+        pass  # The client went away, the audio it sent was still transcribed
+    finally:
+        receiver.cancel()
+
+
+@transcription_router.get("/appointments/{appointment_id}", tags=["transcription"], response_model=List[TranscriptSegment])
+def get_transcript(appointment_id: int, start: float = Query(0, ge=0), end: Optional[float] = Query(None, gt=0),
+                   db: Session = Depends(get_db), payload: dict = Depends(verify_token)):
+    """Final transcript segments overlapping [start, end) seconds of the recording, the whole transcript by default"""
+    get_own_appointment(payload, appointment_id, db, allow_admin=True)
+    return read_range(db, appointment_id, start, end if end is not None else float("inf"))
+
+
+@transcription_router.get("/appointments/{appointment_id}/tail", tags=["transcription"], response_model=TranscriptTail)
+def get_transcript_tail(appointment_id: int, after: int = Query(0, ge=0), limit: int = Query(100, ge=1, le=1000),
+                        db: Session = Depends(get_db), payload: dict = Depends(verify_token)):
+    """
+    Follow a transcript while it is written: segments from number after on, poll again with the returned next.
+    Only stored blocks are visible, they are written every TRANSCRIPT_BLOCK_SEGMENTS segments.
+    """
+    get_own_appointment(payload, appointment_id, db, allow_admin=True)
+    segments, after = read_tail(db, appointment_id, after, limit)
+    return TranscriptTail(segments=segments, next=after)
@@ -0,0 +1,159 @@
+import zlib
+
+import orjson
+from sqlalchemy import Connection, bindparam, delete, event, func, insert, inspect
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session, select
+
+from api.config import TRANSCRIPT_BLOCK_SEGMENTS, TRANSCRIPT_COMPACT_SEGMENTS
+from api.database import engine
+from api.models import Appointment, AppointmentStatus, TranscriptBlock
+from api.schemas import TranscriptSegment
+
+
+# Transcript store. The final segments of an appointment are an append-only log of zlib compressed blocks in
+# the transcript_block table, each holding a JSON array of [start, end, text]. A session appends a small block
+# every TRANSCRIPT_BLOCK_SEGMENTS segments, so a crash loses little and followers see new text soon.
+#
+# Block rows are a sparse index: they are keyed by the ordinal of their first segment (for tail reads) and
+# indexed by the start time of their first segment (for time ranges). A read seeks to the last block starting
+# at or before what it wants and decodes from there, never the whole transcript.
+#
+# When an appointment reaches COMPLETED its blocks are merged into blocks of TRANSCRIPT_COMPACT_SEGMENTS
+# compressed at the highest level, in the transaction that changes the status.
+
+LIVE_COMPRESSION = 6
+COMPACT_COMPRESSION = 9
+
+
+# Blocks are encoded and decoded as [start, end, text] lists, models are only built for the segments returned
+
+def encode_block(entries: list[list], level: int = LIVE_COMPRESSION) -> bytes:
+    return zlib.compress(orjson.dumps(entries), level)
+
+
+def decode_block(data: bytes) -> list[list]:
+    return orjson.loads(zlib.decompress(data))
+
+
+def to_segments(entries: list[list]) -> list[TranscriptSegment]:
+    return [TranscriptSegment(start=start, end=end, text=text, final=True) for start, end, text in entries]
+
+
+def block_row(appointment_id: int, first_segment: int, entries: list[list], compacted: bool) -> dict:
+    return {"appointment_id": appointment_id, "first_segment": first_segment, "segment_count": len(entries),
+            "start": entries[0][0], "end": entries[-1][1], "compacted": compacted,
+            "data": encode_block(entries, COMPACT_COMPRESSION if compacted else LIVE_COMPRESSION)}
+
+
+def transcript_position(db: Session, appointment_id: int) -> tuple[int, float]:
+    """Number of stored segments and the end of the last one, (0, 0.0) without a transcript"""
+    last = db.exec(select(TranscriptBlock.first_segment, TranscriptBlock.segment_count, TranscriptBlock.end)
+                   .where(TranscriptBlock.appointment_id == appointment_id)
+                   .order_by(TranscriptBlock.first_segment.desc()).limit(1)).first()
+    return (last.first_segment + last.segment_count, last.end) if last else (0, 0.0)
+
+
+def append_segments(db: Session, appointment_id: int, segments: list[TranscriptSegment], attempts: int = 3) -> int:
+    """Store segments as a new block after the existing ones, returns the number of stored segments"""
+    entries = [[segment.start, segment.end, segment.text] for segment in segments]
+    for attempt in range(attempts):
+        first_segment, _ = transcript_position(db, appointment_id)
+        try:
+            db.add(TranscriptBlock(**block_row(appointment_id, first_segment, entries, False)))
+            db.commit()
+            return first_segment + len(segments)
+        except IntegrityError:
+            # Another session of the appointment appended the same block number first
+            db.rollback()
+            if attempt == attempts - 1:
+                raise
+
+
+# Reads are built once with bound parameters, compiling the statements with their subqueries on every call
+# would take longer than running them
+
+def _first_block(column, bound: str):
+    return (select(func.max(column))
+            .where(TranscriptBlock.appointment_id == bindparam("appointment_id"), column <= bindparam(bound))
+            .scalar_subquery())
+
+
+_range_query = (select(TranscriptBlock.data)
+                .where(TranscriptBlock.appointment_id == bindparam("appointment_id"),
+                       TranscriptBlock.start >= func.coalesce(_first_block(TranscriptBlock.start, "start"),
+                                                              bindparam("start")),
+                       TranscriptBlock.start < bindparam("end"))
+                .order_by(TranscriptBlock.start))
+
+_tail_query = (select(TranscriptBlock.first_segment, TranscriptBlock.data)
+               .where(TranscriptBlock.appointment_id == bindparam("appointment_id"),
+                      TranscriptBlock.first_segment >= func.coalesce(
+                          _first_block(TranscriptBlock.first_segment, "after"), 0))
+               .order_by(TranscriptBlock.first_segment))
+
+
+def read_range(db: Session, appointment_id: int, start: float, end: float) -> list[TranscriptSegment]:
+    """Segments overlapping [start, end) seconds"""
+    blocks = db.exec(_range_query, params={"appointment_id": appointment_id, "start": start, "end": end}).all()
+    return to_segments([entry for data in blocks for entry in decode_block(data) if entry[1] > start and entry[0] < end])
+
+
+def read_tail(db: Session, appointment_id: int, after: int = 0, limit: int | None = None) -> tuple[list[TranscriptSegment], int]:
+    """Segments from ordinal after on, and the ordinal to continue from"""
+    entries = []
+    for block in db.exec(_tail_query, params={"appointment_id": appointment_id, "after": after}):
+        entries += decode_block(block.data)[max(0, after - block.first_segment):]
+        if limit is not None and len(entries) >= limit:
+            entries = entries[:limit]
+            break
+    return to_segments(entries), after + len(entries)
+
+
+def compact_transcript(connection: Connection, appointment_id: int) -> int:
+    """Rewrite the blocks of an appointment as large, highly compressed ones, returns the number of new blocks"""
+    blocks = connection.execute(select(TranscriptBlock.data, TranscriptBlock.compacted)
+                                .where(TranscriptBlock.appointment_id == appointment_id)
+                                .order_by(TranscriptBlock.first_segment)).all()
+    if all(block.compacted for block in blocks):
+        return 0
+    entries = [entry for block in blocks for entry in decode_block(block.data)]
+    rows = [block_row(appointment_id, first, entries[first:first + TRANSCRIPT_COMPACT_SEGMENTS], True)
+            for first in range(0, len(entries), TRANSCRIPT_COMPACT_SEGMENTS)]
+    table = TranscriptBlock.__table__
+    connection.execute(delete(table).where(table.c.appointment_id == appointment_id))
+    connection.execute(insert(table), rows)
+    return len(rows)
+
+
+@event.listens_for(Session, "before_flush")
+def _compact_completed_transcripts(session, flush_context, instances):
+    for appointment in session.dirty:
+        if not isinstance(appointment, Appointment) or not session.is_modified(appointment):
+            continue
+        if inspect(appointment).attrs.status.history.added and appointment.status == AppointmentStatus.COMPLETED:
+            compact_transcript(session.connection(), appointment.id)
+
+
+class TranscriptWriter:
+    """Collects the final segments of one transcription session and appends them to the store in blocks"""
+
+    def __init__(self, appointment_id: int, block_segments: int = TRANSCRIPT_BLOCK_SEGMENTS):
+        self.appointment_id = appointment_id
+        self.block_segments = block_segments
+        self.pending: list[TranscriptSegment] = []
+        self.stored = 0
+
+    def add(self, segment: TranscriptSegment) -> bool:
+        """Buffer a final segment, True when a block is full and flush() should be called"""
+        if segment.final:
+            self.pending.append(segment)
+        return len(self.pending) >= self.block_segments
+
+    def flush(self):
+        if not self.pending:
+            return
+        with Session(engine) as db:
+            append_segments(db, self.appointment_id, self.pending)
+        self.stored += len(self.pending)
+        self.pending = []
@@ -0,0 +1,113 @@
+import numpy as np
+
+from api.config import (VAD_FRAME_MS, VAD_ENERGY_DB, VAD_ZCR_MAX, VAD_LOUD_DB, VAD_MIN_SPEECH_MS,
+                        VAD_HANGOVER_MS)
+
+
+# Voice activity detection for the transcription pipeline. Audio is cut into frames of VAD_FRAME_MS and every
+# frame gets two features, computed for a whole chunk at once with NumPy:
+#   energy  RMS level in dBFS, silence and room noise stay far below speech
+#   ZCR     zero crossings per sample, high for hiss and fan noise, low for voiced speech
+# A frame sounds like speech when it is loud enough and not noise-like, or when it is very loud. Runs of such
+# frames shorter than VAD_MIN_SPEECH_MS (clicks, a dropped pen) are ignored, and every accepted run is extended
+# by VAD_HANGOVER_MS, so trailing consonants and short pauses inside a sentence are kept.
+#
+# The detector is streaming: a frame cut by the chunk boundary, and a run still too short to decide, are kept
+# for the next chunk. Speech is returned with its stream offset, so the engine knows where silence was removed.
+
+FULL_SCALE = 32768.0
+
+
+def frame_features(frames: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """(energy in dBFS, zero crossing rate) of every row of int16 samples"""
+    samples = frames.astype(np.float32)
+    power = np.einsum("ij,ij->i", samples, samples) / (frames.shape[1] * FULL_SCALE * FULL_SCALE)
+    energy = 10 * np.log10(power + 1e-12)
+    signs = np.signbit(frames)
+    zcr = np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1) / (frames.shape[1] - 1)
+    return energy, zcr
+
+
+def _runs(mask: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Start and end (exclusive) indices of the True runs in mask"""
+    padded = np.zeros(len(mask) + 2, dtype=bool)
+    padded[1:-1] = mask
+    edges = np.flatnonzero(padded[1:] != padded[:-1])
+    return edges[::2], edges[1::2]
+
+
+class VoiceActivityDetector:
+    def __init__(self, sample_rate: int, frame_ms: int = VAD_FRAME_MS, energy_db: float = VAD_ENERGY_DB,
+                 zcr_max: float = VAD_ZCR_MAX, loud_db: float = VAD_LOUD_DB, min_speech_ms: int = VAD_MIN_SPEECH_MS,
+                 hangover_ms: int = VAD_HANGOVER_MS):
+        self.sample_rate = sample_rate
+        self.frame = sample_rate * frame_ms // 1000  # Samples per frame
+        self.energy_db = energy_db
+        self.zcr_max = zcr_max
+        self.loud_db = loud_db
+        self.min_frames = max(1, min_speech_ms // frame_ms)
+        self.hangover_frames = hangover_ms // frame_ms
+        self.audio_samples = 0
+        self.speech_samples = 0
+        self._pending = np.empty(0, dtype=np.int16)  # Undecided samples, they start at stream sample _position
+        self._position = 0
+        self._in_speech_run = False  # The last decided frame belongs to an accepted run that may continue
+        self._since_speech = 1 << 30  # Decided frames since the last frame of an accepted run
+
+    def is_speech(self, energy: np.ndarray, zcr: np.ndarray) -> np.ndarray:
+        return (energy > self.energy_db) & ((zcr < self.zcr_max) | (energy > self.energy_db + self.loud_db))
+
+    def process(self, pcm: bytes) -> list[tuple[float, bytes]]:
+        """(stream offset in seconds, PCM) of the speech in the next chunk of the stream, whole samples only"""
+        self.audio_samples += len(pcm) // 2
+        samples = np.concatenate((self._pending, np.frombuffer(pcm, dtype="<i2", count=len(pcm) // 2)))
+        return self._decide(samples, final=False)
+
+    def flush(self) -> list[tuple[float, bytes]]:
+        """Decide what is left at the end of the stream"""
+        return self._decide(self._pending, final=True)
+
+    def _decide(self, samples: np.ndarray, final: bool) -> list[tuple[float, bytes]]:
+        count = len(samples) // self.frame
+        frames = samples[:count * self.frame].reshape(count, self.frame)
+        voiced = self.is_speech(*frame_features(frames)) if count else np.zeros(0, dtype=bool)
+
+        starts, ends = _runs(voiced)
+        accepted = ends - starts >= self.min_frames
+        if len(starts) and starts[0] == 0 and self._in_speech_run:
+            accepted[0] = True  # Continues a run accepted in the previous chunk
+        decided = count
+        if len(starts) and ends[-1] == count and not accepted[-1] and not final:
+            decided = starts[-1]  # Too short so far, it may still grow into speech
+
+        # Frames of accepted runs, then extended by the hangover
+        marks = np.zeros(count + 1, dtype=np.int8)
+        marks[starts[accepted]] += 1
+        marks[ends[accepted]] -= 1
+        speech = np.cumsum(marks[:count]) > 0
+        index = np.arange(count)
+        last = np.maximum.accumulate(np.where(speech, index, -1 - self._since_speech))
+        speech |= index - last <= self.hangover_frames
+
+        if decided:
+            self._since_speech = int(decided - 1 - last[decided - 1])
+            self._in_speech_run = self._since_speech == 0
+        # At the end of the stream a partial last frame goes with the frame before it
+        tail = len(samples) if final and decided and speech[decided - 1] else decided * self.frame
+
+        spans = []
+        span_starts, span_ends = _runs(speech[:decided])
+        for start, end in zip(span_starts, span_ends):
+            end_sample = tail if end == decided else end * self.frame
+            spans.append((float(self._position + start * self.frame) / self.sample_rate,
+                          samples[start * self.frame:end_sample].tobytes()))
+            self.speech_samples += int(end_sample - start * self.frame)
+
+        consumed = len(samples) if final else decided * self.frame
+        self._pending = samples[consumed:].copy()
+        self._position += consumed
+        return spans
+
+    def stats(self) -> dict:
+        return {"audio_seconds": self.audio_samples / self.sample_rate,
+                "speech_seconds": self.speech_samples / self.sample_rate}
@@ -0,0 +1,93 @@
+# Free slot search over a generated database with thousands of doctors: time to load the agendas, latency of
+# typical searches, and the cost of keeping the agendas current while appointments are booked.
+#
+#   python -m benchmarks.availability --doctors 5000 --appointments 500000
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+from benchmarks.endpoints import percentile
+
+
+def measure(function, repeat: int) -> dict:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        samples.append(time.perf_counter() - started)
+    return {"p50_ms": percentile(samples, 0.50) * 1000, "p95_ms": percentile(samples, 0.95) * 1000,
+            "mean_ms": statistics.fmean(samples) * 1000}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the free slot search")
+    parser.add_argument("--patients", type=int, default=20000)
+    parser.add_argument("--doctors", type=int, default=5000)
+    parser.add_argument("--appointments", type=int, default=500000)
+    parser.add_argument("--facilities", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--database", help="Generated database to reuse, created on the first run")
+    parser.add_argument("--repeat", type=int, default=200, help="Measured searches per scenario")
+    args = parser.parse_args()
+
+    database = args.database or os.path.join(tempfile.mkdtemp(prefix="techmed-bench-"), "bench.db")
+    database_url = f"sqlite:///{database}"
+    os.environ["DATABASE_URL"] = database_url
+    os.environ.setdefault("HASH_PROFILE", "test")
+    # Agendas start next Monday, so every generated appointment is still ahead and blocks a slot
+    first_day = date.today() + timedelta(days=7 - date.today().weekday())
+    if not (args.database and os.path.exists(database)):
+        from api.generate_dataset import generate
+        generate(database_url, patients=args.patients, doctors=args.doctors, appointments=args.appointments,
+                 facilities=args.facilities, seed=args.seed, first_day=first_day,
+                 log=lambda message: print(message, file=sys.stderr)).dispose()
+
+    from sqlmodel import Session
+    from api.availability import availability_engine as availability
+    from api.database import engine
+    from api.models import Appointment, AppointmentStatus
+
+    rng = random.Random(args.seed)
+    start = datetime.combine(first_day, datetime.min.time())
+    end = start + timedelta(days=7)
+
+    started = time.perf_counter()
+    availability.find_slots(start, end, limit=1)
+    print(f"load doctors and all agendas: {(time.perf_counter() - started) * 1000:.0f} ms")
+
+    scenarios = {
+        "any doctor, first 10": lambda: availability.find_slots(start, end, limit=10),
+        "any doctor, first 100": lambda: availability.find_slots(start, end, limit=100),
+        "by speciality": lambda: availability.find_slots(start, end, speciality_id=rng.randint(1, 20)),
+        "by facility": lambda: availability.find_slots(start, end, facility_id=rng.randint(1, args.facilities)),
+        "one doctor, whole week": lambda: availability.find_slots(start, end, limit=1000,
+                                                                  doctor_ids=[rng.randint(1, args.doctors)]),
+    }
+    print(f"{'search':<28}{'p50 ms':>10}{'p95 ms':>10}")
+    for name, search in scenarios.items():
+        result = measure(search, args.repeat)
+        print(f"{name:<28}{result['p50_ms']:>10.2f}{result['p95_ms']:>10.2f}")
+
+    # Booking goes through the session events, the agendas stay loaded and are updated in place
+    def book():
+        slot = availability.find_slots(start, end, limit=1, doctor_ids=[rng.randint(1, args.doctors)])
+        if not slot:
+            return
+        with Session(engine) as db:
+            db.add(Appointment(doctor_id=slot[0]["doctor_id"], patient_id=rng.randint(1, args.patients),
+                               date=slot[0]["start"], reason="Routine check-up", treatment_plan="", diagnosis="",
+                               recommendations="", status=AppointmentStatus.SCHEDULED))
+            db.commit()
+
+    result = measure(book, min(args.repeat, 100))
+    print(f"{'search and book':<28}{result['p50_ms']:>10.2f}{result['p95_ms']:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
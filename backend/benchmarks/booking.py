@@ -0,0 +1,106 @@
+# Booking stress test: thousands of concurrent bookings race for a small pool of slots through the real
+# endpoint, then the database is checked for double bookings.
+#
+#   python -m benchmarks.booking --bookings 5000 --threads 64 --slots 200
+
+import argparse
+import os
+import queue
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from datetime import date, datetime, timedelta
+
+from benchmarks.endpoints import percentile
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stress test concurrent appointment booking")
+    parser.add_argument("--bookings", type=int, default=5000, help="Booking requests in total")
+    parser.add_argument("--threads", type=int, default=64, help="Requests in flight at once")
+    parser.add_argument("--slots", type=int, default=200, help="Distinct slots the requests compete for")
+    parser.add_argument("--doctors", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--sqlite-production", action="store_true", help="Use WAL and the tuned pragmas")
+    args = parser.parse_args()
+
+    database = os.path.join(tempfile.mkdtemp(prefix="techmed-bench-"), "bench.db")
+    os.environ["DATABASE_URL"] = f"sqlite:///{database}"
+    os.environ.setdefault("HASH_PROFILE", "test")
+    if args.sqlite_production:
+        os.environ["SQLITE_PRODUCTION"] = "1"
+    # Agendas start next Monday, so the generated appointments take some of the contested slots as well
+    first_day = date.today() + timedelta(days=7 - date.today().weekday())
+    from api.generate_dataset import generate
+    generate(os.environ["DATABASE_URL"], patients=1000, doctors=args.doctors, appointments=args.doctors * 20,
+             facilities=5, seed=args.seed, first_day=first_day,
+             log=lambda message: print(message, file=sys.stderr)).dispose()
+
+    from fastapi.testclient import TestClient
+    from sqlalchemy import func
+    from sqlmodel import Session, select
+    from api.availability import availability_engine
+    from api.database import engine
+    from api.main import app
+    from api.models import Appointment, AppointmentSlot, AppointmentStatus
+    from api.security import create_token_from_data
+
+    # Contested slots are taken from what the availability search offers, like a real client would
+    rng = random.Random(args.seed)
+    start = datetime.combine(first_day, datetime.min.time())
+    offered = availability_engine.find_slots(start, start + timedelta(days=14), limit=args.slots * 4)
+    slots = rng.sample(offered, min(args.slots, len(offered)))
+    requests = [rng.choice(slots) for _ in range(args.bookings)]
+
+    # One client per thread, entered once: a TestClient outside its context starts an event loop per request
+    clients = queue.SimpleQueue()
+    local = threading.local()
+
+    def book(slot):
+        if not hasattr(local, "client"):
+            local.client = clients.get()
+        started = time.perf_counter()
+        response = local.client.post("/patient/appointments",
+                                     json={"doctor_id": slot["doctor_id"], "start": slot["start"].isoformat()})
+        return response.status_code, time.perf_counter() - started
+
+    with ExitStack() as stack:
+        for patient in rng.sample(range(1, 1001), args.threads):
+            token = create_token_from_data(f"patient{patient}@example.pl", "Patient")
+            clients.put(stack.enter_context(TestClient(app, cookies={"access_token": token})))
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.threads) as pool:
+            results = list(pool.map(book, requests))
+        elapsed = time.perf_counter() - started
+
+    codes = Counter(code for code, _ in results)
+    latencies = [latency for _, latency in results]
+    print(f"{args.bookings} requests for {len(slots)} slots on {args.threads} threads in {elapsed:.1f} s "
+          f"({args.bookings / elapsed:.0f} requests/s)")
+    print(f"status codes: {dict(sorted(codes.items()))}")
+    print(f"latency p50 {percentile(latencies, 0.5) * 1000:.1f} ms, p95 {percentile(latencies, 0.95) * 1000:.1f} ms, "
+          f"p99 {percentile(latencies, 0.99) * 1000:.1f} ms")
+
+    with Session(engine) as db:
+        booked = db.exec(select(func.count()).select_from(AppointmentSlot)
+                         .where(AppointmentSlot.slot_start >= start)).one()
+        # Checked on the appointments themselves, the slot table can not hold duplicates by construction
+        double = db.exec(
+            select(Appointment.doctor_id, Appointment.date)
+            .where(Appointment.status != AppointmentStatus.CANCELLED, Appointment.date >= start)
+            .group_by(Appointment.doctor_id, Appointment.date)
+            .having(func.count() > 1)).all()
+    print(f"reserved slots from {first_day}: {booked}, double bookings: {len(double)}")
+    # Every contested slot was free when it was offered, so exactly one request per slot has to win
+    failed = double or codes[201] != len(slots) or set(codes) - {201, 409}
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+# Change feed load test: one uvicorn worker holds thousands of idle SSE and WebSocket subscribers, then a
+# booking is fanned out to all of them. Reports server memory per connection and delivery latency.
+#
+#   python -m benchmarks.change_feed --subscribers 5000
+#
+# Needs a file descriptor limit above the number of subscribers (ulimit -n). Per-message deflate is turned off:
+# its compressor state costs about 100 KiB per idle WebSocket, and feed events are small.
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import date, timedelta
+
+from benchmarks.endpoints import percentile
+
+
+def rss_kib(pid: int) -> int:
+    with open(f"/proc/{pid}/status", encoding="utf-8") as file:
+        for line in file:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+    raise RuntimeError("VmRSS not found")
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@contextmanager
+def uvicorn_server(env: dict, *options: str):
+    """Run the app in one uvicorn worker, yields (port, pid) once it accepts connections"""
+    port = free_port()
+    server = subprocess.Popen([sys.executable, "-m", "uvicorn", "api.main:app", "--port", str(port),
+                               "--log-level", "warning", "--ws-per-message-deflate", "false", *options], env=env)
+    try:
+        for _ in range(100):
+            try:
+                socket.create_connection(("127.0.0.1", port), timeout=0.1).close()
+                break
+            except OSError:
+                time.sleep(0.1)
+        yield port, server.pid
+    finally:
+        server.terminate()
+        server.wait()
+
+
+async def request(port: int, method: str, path: str, token: str, body: dict | None = None) -> tuple[int, dict]:
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    content = json.dumps(body).encode() if body is not None else b""
+    writer.write(f"{method} {path} HTTP/1.1\r\nHost: localhost\r\nCookie: access_token={token}\r\n"
+                 f"Content-Type: application/json\r\nContent-Length: {len(content)}\r\nConnection: close\r\n\r\n"
+                 .encode() + content)
+    response = await reader.read()
+    writer.close()
+    head, _, payload = response.partition(b"\r\n\r\n")
+    return int(head.split()[1]), json.loads(payload) if payload else None
+
+
+class SseSubscriber:
+    def __init__(self, port: int, token: str, query: str):
+        self.port, self.token, self.query = port, token, query
+        self.received = asyncio.get_running_loop().create_future()
+
+    async def connect(self):
+        self.reader, self.writer = await asyncio.open_connection("127.0.0.1", self.port)
+        self.writer.write(f"GET /feed/appointments?{self.query} HTTP/1.1\r\nHost: localhost\r\n"
+                          f"Cookie: access_token={self.token}\r\nAccept: text/event-stream\r\n\r\n".encode())
+        await self.reader.readuntil(b"retry: 3000\n\n")  # Response headers and the first chunk
+
+    async def listen(self):
+        while not self.received.done():
+            line = await self.reader.readline()
+            if b"data: " in line:  # Chunked encoding, the chunk size is on the line before
+                self.received.set_result(time.perf_counter())
+
+
+class WebSocketSubscriber:
+    def __init__(self, port: int, token: str, query: str):
+        self.port, self.token, self.query = port, token, query
+        self.received = asyncio.get_running_loop().create_future()
+
+    async def connect(self):
+        from websockets.asyncio.client import connect
+        self.connection = await connect(f"ws://127.0.0.1:{self.port}/feed/appointments/ws?{self.query}",
+                                        additional_headers={"Cookie": f"access_token={self.token}"})
+
+    async def listen(self):
+        while not self.received.done():
+            if json.loads(await self.connection.recv()).get("type") != "heartbeat":
+                self.received.set_result(time.perf_counter())
+
+
+async def load_test(args, port: int, server_pid: int):
+    from api.security import create_token_from_data
+    admin = create_token_from_data("admin@example.pl", "Admin")
+    patient = create_token_from_data("patient1@example.pl", "Patient")
+
+    # Warm up the worker, so imports and caches are not counted as connection memory
+    status, slots = await request(port, "GET", "/misc/availability?facility_id=1&limit=1", patient)
+    assert status == 200 and slots, slots
+    baseline = rss_kib(server_pid)
+
+    subscribers = []
+    started = time.perf_counter()
+    for i in range(args.subscribers):
+        kind = WebSocketSubscriber if i < args.subscribers * args.websocket_share else SseSubscriber
+        subscriber = kind(port, admin, "facility_id=1")
+        await subscriber.connect()
+        subscribers.append(subscriber)
+    connected = time.perf_counter() - started
+    listeners = [asyncio.ensure_future(subscriber.listen()) for subscriber in subscribers]
+    await asyncio.sleep(1)
+    held = rss_kib(server_pid)
+
+    print(f"connected {len(subscribers)} subscribers in {connected:.1f} s "
+          f"({sum(isinstance(s, WebSocketSubscriber) for s in subscribers)} WebSocket)")
+    print(f"server RSS {baseline / 1024:.1f} MiB idle, {held / 1024:.1f} MiB with subscribers, "
+          f"{(held - baseline) / len(subscribers):.1f} KiB per connection")
+
+    published = time.perf_counter()
+    status, booking = await request(port, "POST", "/patient/appointments", patient,
+                                    {"doctor_id": slots[0]["doctor_id"], "start": slots[0]["start"]})
+    assert status == 201, booking
+    await asyncio.wait_for(asyncio.gather(*(subscriber.received for subscriber in subscribers)), timeout=60)
+    delays = [subscriber.received.result() - published for subscriber in subscribers]
+    print(f"booking delivered to all subscribers in {max(delays) * 1000:.0f} ms "
+          f"(p50 {percentile(delays, 0.5) * 1000:.0f} ms, p99 {percentile(delays, 0.99) * 1000:.0f} ms)")
+
+    for listener in listeners:
+        listener.cancel()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Hold many change feed subscribers on one worker")
+    parser.add_argument("--subscribers", type=int, default=5000)
+    parser.add_argument("--websocket-share", type=float, default=0.2, help="Fraction of WebSocket subscribers")
+    args = parser.parse_args()
+
+    database = os.path.join(tempfile.mkdtemp(prefix="techmed-bench-"), "bench.db")
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{database}", HASH_PROFILE="test", METRICS_ENABLED="1")
+    os.environ.update(env)
+    first_day = date.today() + timedelta(days=7 - date.today().weekday())
+    from api.generate_dataset import generate
+    generate(env["DATABASE_URL"], patients=100, doctors=20, appointments=200, facilities=3, first_day=first_day,
+             log=lambda message: None).dispose()
+
+    with uvicorn_server(env, "--backlog", str(max(2048, args.subscribers))) as (port, pid):
+        asyncio.run(load_test(args, port, pid))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+# Latency, queries and memory per request of the hot endpoints, served in-process by the real routers
+# against a generated database.
+#
+#   python -m benchmarks.endpoints --save benchmarks/baselines/endpoints.json
+#   python -m benchmarks.endpoints --compare benchmarks/baselines/endpoints.json --threshold 0.25
+#
+# Compare mode exits with status 1 when an endpoint got slower than the baseline by more than --threshold,
+# or issues more queries per request. Latencies only compare meaningfully on the machine that recorded the
+# baseline, so regenerate it when the benchmark host changes. Query counts are deterministic everywhere.
+# The dataset is generated around a fixed --today and date ranges are passed explicitly, so runs on different
+# days measure the same rows.
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+from sqlalchemy import event
+
+
+# Endpoint name -> (method, path, login email). The accounts are the ones created by api.generate_dataset,
+# {start} and {end} in a path are today and today + 90 days of the generated dataset
+ENDPOINTS = {
+    "get_my_info_patient": ("GET", "/auth/get_my_info", "patient1@example.pl"),
+    "get_my_info_doctor": ("GET", "/auth/get_my_info", "doctor1@example.pl"),
+    "verify_token": ("GET", "/auth/verify_token", "patient1@example.pl"),
+    "doctor_appointments": ("GET", "/doctor/appointments?start_date={start}&end_date={end}", "doctor1@example.pl"),
+    "admin_users": ("GET", "/admin/users", "admin@example.pl"),
+    "admin_patients": ("GET", "/admin/patients", "admin@example.pl"),
+    "admin_doctors": ("GET", "/admin/doctors", "admin@example.pl"),
+    "doctor_specialities": ("GET", "/misc/get_doctor_specialities", "patient1@example.pl"),
+}
+
+
+def percentile(samples: list[float], quantile: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(quantile * len(ordered)))]
+
+
+class QueryCounter:
+    def __init__(self, *engines):
+        self.count = 0
+        for engine in engines:
+            event.listen(engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, *args):
+        self.count += 1
+
+
+def run_endpoint(client, counter: QueryCounter, method: str, path: str, requests: int, warmup: int) -> dict:
+    for _ in range(max(1, warmup)):  # The last warmup response is checked and its row count reported
+        response = client.request(method, path)
+        if response.status_code != 200:
+            raise RuntimeError(f"{method} {path} returned {response.status_code}: {response.text[:200]}")
+
+    body = response.json()
+    samples = []
+    queries_before = counter.count
+    for _ in range(requests):
+        start = time.perf_counter()
+        client.request(method, path)
+        samples.append(time.perf_counter() - start)
+    queries = (counter.count - queries_before) / requests
+
+    # tracemalloc slows every allocation down, so memory is measured in a separate, shorter pass
+    peaks = []
+    tracemalloc.start()
+    for _ in range(max(1, requests // 10)):
+        tracemalloc.reset_peak()
+        baseline, _ = tracemalloc.get_traced_memory()
+        client.request(method, path)
+        peaks.append(tracemalloc.get_traced_memory()[1] - baseline)
+    tracemalloc.stop()
+
+    return {
+        "requests": requests,
+        "mean_ms": statistics.fmean(samples) * 1000,
+        "p50_ms": percentile(samples, 0.50) * 1000,
+        "p95_ms": percentile(samples, 0.95) * 1000,
+        "p99_ms": percentile(samples, 0.99) * 1000,
+        "queries": queries,
+        "peak_kib": statistics.median(peaks) / 1024,
+        "rows": len(body) if isinstance(body, list) else None,
+    }
+
+
+def run(args) -> dict:
+    database = args.database or os.path.join(tempfile.mkdtemp(prefix="techmed-bench-"), "bench.db")
+    database_url = f"sqlite:///{database}"
+    # api.config reads DATABASE_URL on import, so it has to be set before anything from api is imported
+    os.environ["DATABASE_URL"] = database_url
+    if not (args.database and os.path.exists(database)):
+        from api.generate_dataset import generate
+        generate(database_url, patients=args.patients, doctors=args.doctors, appointments=args.appointments,
+                 seed=args.seed, today=args.today, log=lambda message: print(message, file=sys.stderr)).dispose()
+
+    from fastapi.testclient import TestClient
+    from api.database import engine, async_engine
+    from api.main import app
+    from api.security import create_token_from_data
+
+    counter = QueryCounter(engine, async_engine.sync_engine)
+    client = TestClient(app)
+    user_types = {"patient": "Patient", "doctor": "Doctor", "admin": "Admin"}
+
+    results = {}
+    for name, (method, path, email) in ENDPOINTS.items():
+        if args.endpoint and name not in args.endpoint:
+            continue
+        client.cookies.clear()
+        if email:
+            user_type = next(value for prefix, value in user_types.items() if email.startswith(prefix))
+            client.cookies["access_token"] = create_token_from_data(email, user_type)
+        path = path.format(start=args.today, end=args.today + timedelta(days=90))
+        results[name] = run_endpoint(client, counter, method, path, args.requests, args.warmup)
+
+    return {
+        "meta": {
+            "patients": args.patients,
+            "doctors": args.doctors,
+            "appointments": args.appointments,
+            "seed": args.seed,
+            "today": args.today.isoformat(),
+            "requests": args.requests,
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+        },
+        "results": results,
+    }
+
+
+def compare(baseline: dict, current: dict, threshold: float, min_delta_ms: float = 0.5) -> list[str]:
+    """
+    Regressions of current against baseline. Latency changes below min_delta_ms are treated as noise,
+    and the tail (p95) is allowed twice the threshold since it moves a lot more between runs than the median
+    """
+    regressions = []
+    for name, result in current["results"].items():
+        previous = baseline["results"].get(name)
+        if previous is None:
+            continue
+        for metric, allowed in (("p50_ms", threshold), ("p95_ms", threshold * 2)):
+            if (result[metric] > previous[metric] * (1 + allowed)
+                    and result[metric] - previous[metric] > min_delta_ms):
+                regressions.append(f"{name}: {metric} {previous[metric]:.2f} -> {result[metric]:.2f}")
+        if result["queries"] > previous["queries"]:
+            regressions.append(f"{name}: queries {previous['queries']:g} -> {result['queries']:g}")
+    return regressions
+
+
+def print_report(report: dict, baseline: dict | None = None):
+    print(f"{'endpoint':<24}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'queries':>10}{'peak KiB':>10}{'rows':>8}"
+          + (f"{'base p50':>10}" if baseline else ""))
+    for name, result in report["results"].items():
+        line = (f"{name:<24}{result['p50_ms']:>10.2f}{result['p95_ms']:>10.2f}{result['p99_ms']:>10.2f}"
+                f"{result['queries']:>10g}{result['peak_kib']:>10.1f}{result['rows'] if result['rows'] is not None else '':>8}")
+        if baseline and name in baseline["results"]:
+            line += f"{baseline['results'][name]['p50_ms']:>10.2f}"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the hot endpoints in-process")
+    parser.add_argument("--patients", type=int, default=20000)
+    parser.add_argument("--doctors", type=int, default=200)
+    parser.add_argument("--appointments", type=int, default=200000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--today", type=date.fromisoformat, default=date(2025, 1, 1),
+                        help="Date the generated agendas are built around")
+    parser.add_argument("--database", help="Generated database to reuse, created on the first run")
+    parser.add_argument("--requests", type=int, default=200, help="Measured requests per endpoint")
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--endpoint", action="append", choices=list(ENDPOINTS), help="Only run these endpoints")
+    parser.add_argument("--save", help="Write the results to this JSON file")
+    parser.add_argument("--compare", help="Baseline JSON file to check the results against")
+    parser.add_argument("--threshold", type=float, default=0.25, help="Allowed relative slowdown, 0.25 = 25%%")
+    args = parser.parse_args()
+
+    # Keep Argon2 out of the picture, none of the benchmarked endpoints hash passwords
+    os.environ.setdefault("HASH_PROFILE", "test")
+    # The periodic revocation check of cached tokens would add a fraction of a query to whichever endpoint
+    # runs when it falls due, and fail the query comparison
+    os.environ.setdefault("TOKEN_REVOCATION_CHECK_SECONDS", "3600")
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as file:
+            baseline = json.load(file)
+        # Results are only comparable on the same dataset
+        for key in ("patients", "doctors", "appointments", "seed"):
+            setattr(args, key, baseline["meta"][key])
+        args.today = date.fromisoformat(baseline["meta"]["today"])
+
+    report = run(args)
+    print_report(report, baseline)
+
+    if args.save:
+        os.makedirs(os.path.dirname(args.save) or ".", exist_ok=True)
+        with open(args.save, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+            file.write("\n")
+
+    if baseline:
+        regressions = compare(baseline, report, args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
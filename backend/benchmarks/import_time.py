@@ -0,0 +1,94 @@
+# Cold start profile: where the time goes when a worker imports the application, and how long it takes until
+# the first request is answered. Every measurement runs in a fresh interpreter.
+#
+#   python -m benchmarks.import_time --runs 5 --top 25
+#
+# Exits with status 1 when the median time to the first request is over --budget seconds.
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+
+
+FIRST_REQUEST_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+from api.main import app
+imported = time.perf_counter()
+from fastapi.testclient import TestClient
+TestClient(app).get("/")
+first_request = time.perf_counter()
+print(json.dumps({"import_s": imported - start, "first_request_s": first_request - start,
+                  "modules": sorted(sys.modules)}))
+"""
+
+
+def _environment() -> dict:
+    env = dict(os.environ)
+    env.setdefault("HASH_PROFILE", "test")
+    return env
+
+
+def time_to_first_request() -> dict:
+    """Import time and time until GET / is answered in a fresh interpreter, plus the modules it loaded"""
+    result = subprocess.run([sys.executable, "-c", FIRST_REQUEST_SCRIPT], capture_output=True, text=True,
+                            env=_environment(), check=True)
+    lines = result.stdout.strip().splitlines()
+    measurement = json.loads(lines[-1])
+    measurement["stdout"] = "\n".join(lines[:-1])
+    return measurement
+
+
+def import_profile(module: str = "api.main") -> dict[str, tuple[int, int]]:
+    """Self and cumulative import time in microseconds of every module, from python -X importtime"""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], capture_output=True,
+                            text=True, env=_environment(), check=True)
+    profile = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        profile[name.strip()] = (int(self_us), int(cumulative_us))
+    return profile
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Profile the import time of the application")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=25, help="Modules to list, by cumulative import time")
+    parser.add_argument("--budget", type=float, default=5.0,
+                        help="Seconds allowed until the first request, about 1.5 s on a developer laptop")
+    args = parser.parse_args()
+
+    samples = defaultdict(list)
+    for _ in range(args.runs):
+        for name, (self_us, cumulative_us) in import_profile().items():
+            samples[name].append((self_us, cumulative_us))
+
+    print(f"Median of {args.runs} runs, milliseconds")
+    print(f"{'cumulative':>10}{'self':>10}  module")
+    rows = sorted(((statistics.median(c for _, c in values), statistics.median(s for s, _ in values), name)
+                   for name, values in samples.items()), reverse=True)
+    for cumulative_us, self_us, name in rows[:args.top]:
+        print(f"{cumulative_us / 1000:>10.1f}{self_us / 1000:>10.1f}  {name}")
+
+    print("\nSlowest first party modules (self time)")
+    for cumulative_us, self_us, name in sorted(rows, key=lambda row: row[1], reverse=True):
+        if name.startswith("api"):
+            print(f"{cumulative_us / 1000:>10.1f}{self_us / 1000:>10.1f}  {name}")
+
+    measurements = [time_to_first_request() for _ in range(args.runs)]
+    first_request = statistics.median(m['first_request_s'] for m in measurements)
+    print(f"\nimport api.main: {statistics.median(m['import_s'] for m in measurements) * 1000:.0f} ms")
+    print(f"first request:   {first_request * 1000:.0f} ms")
+    if first_request > args.budget:
+        print(f"Over the cold start budget of {args.budget:g} s", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
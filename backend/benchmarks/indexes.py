@@ -0,0 +1,116 @@
+# Latency of the hot lookups before and after the indexes from migration 0002.
+#
+#   python -m benchmarks.indexes --appointments 1000000
+
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert, select
+from sqlmodel import create_engine, SQLModel
+
+from api.models import Appointment, AppointmentStatus, Patient, Doctor
+
+
+def build_database(path: str, appointments: int, patients: int, doctors: int, chunk: int = 50000):
+    engine = create_engine(f"sqlite:///{path}")
+    SQLModel.metadata.create_all(engine)
+
+    # Start from the schema without secondary indexes, as it was before migration 0002
+    with engine.begin() as connection:
+        for table in SQLModel.metadata.sorted_tables:
+            for index in table.indexes:
+                index.drop(connection)
+
+    statuses = list(AppointmentStatus)
+    start = datetime(2024, 1, 1, 8, 0)
+    with engine.begin() as connection:
+        connection.execute(insert(Doctor.__table__), [
+            {"first_name": "Doctor", "middle_name": "", "last_name": f"Doctor{i}", "phone_number": "555000000",
+             "license_number": f"{i:05}", "hire_date": "2022-01-01", "speciality_id": 1}
+            for i in range(doctors)])
+        connection.execute(insert(Patient.__table__), [
+            {"first_name": "Patient", "middle_name": None, "last_name": f"Patient{i}", "PESEL": f"{i:011}",
+             "gender": "M", "address": "Main St", "phone_number": "123456789"}
+            for i in range(patients)])
+
+    for offset in range(0, appointments, chunk):
+        with engine.begin() as connection:
+            connection.execute(insert(Appointment.__table__), [
+                {"date": start + timedelta(minutes=20 * (i // doctors)), "doctor_id": i % doctors + 1,
+                 "patient_id": random.randint(1, patients), "reason": "", "treatment_plan": "", "diagnosis": "",
+                 "recommendations": "", "status": random.choice(statuses)}
+                for i in range(offset, min(offset + chunk, appointments))])
+    return engine
+
+
+def queries(appointments: int, patients: int, doctors: int) -> dict:
+    days = 20 * (appointments // doctors) // (60 * 24)
+    middle = datetime(2024, 1, 1) + timedelta(days=days // 2)
+
+    return {
+        "doctor agenda (doctor_id, status, date)": lambda: (
+            select(Appointment.id)
+            .where(Appointment.doctor_id == random.randint(1, doctors))
+            .where(Appointment.status == AppointmentStatus.SCHEDULED)
+            .where(Appointment.date >= middle)
+            .where(Appointment.date <= middle + timedelta(days=90))),
+        "patient appointments (patient_id)": lambda: (
+            select(Appointment.id).where(Appointment.patient_id == random.randint(1, patients))),
+        "patient by PESEL": lambda: (
+            select(Patient.id).where(Patient.PESEL == f"{random.randint(0, patients - 1):011}")),
+        "doctor by license_number": lambda: (
+            select(Doctor.id).where(Doctor.license_number == f"{random.randint(0, doctors - 1):05}")),
+    }
+
+
+def measure(engine, statements: dict, repeats: int) -> dict:
+    results = {}
+    with engine.connect() as connection:
+        for name, build in statements.items():
+            samples = []
+            for _ in range(repeats):
+                stmt = build()
+                start = time.perf_counter()
+                connection.execute(stmt).all()
+                samples.append(time.perf_counter() - start)
+            results[name] = statistics.median(samples) * 1000
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare hot lookups with and without the secondary indexes")
+    parser.add_argument("--appointments", type=int, default=1_000_000)
+    parser.add_argument("--patients", type=int, default=100_000)
+    parser.add_argument("--doctors", type=int, default=1000)
+    parser.add_argument("--repeats", type=int, default=20)
+    args = parser.parse_args()
+
+    random.seed(0)
+    path = os.path.join(tempfile.mkdtemp(), "indexes.db")
+    print(f"Building {args.appointments} appointments in {path} ...")
+    engine = build_database(path, args.appointments, args.patients, args.doctors)
+    statements = queries(args.appointments, args.patients, args.doctors)
+
+    before = measure(engine, statements, args.repeats)
+
+    start = time.perf_counter()
+    with engine.begin() as connection:
+        for table in SQLModel.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(connection)
+    print(f"Index creation: {time.perf_counter() - start:.1f} s")
+
+    after = measure(engine, statements, args.repeats)
+
+    print(f"{'query':<42}{'before ms':>12}{'after ms':>12}{'speedup':>10}")
+    for name in statements:
+        print(f"{name:<42}{before[name]:>12.3f}{after[name]:>12.3f}{before[name] / max(after[name], 1e-6):>9.0f}x")
+
+
+if __name__ == "__main__":
+    main()
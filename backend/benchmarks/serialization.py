@@ -0,0 +1,72 @@
+# Per-request serialization cost of the large list endpoints: FastAPI's default path (response_model validation +
+# jsonable_encoder + json), the same validation with ORJSONResponse, and typed_response without re-validation.
+#
+#   python -m benchmarks.serialization --rows 5000
+
+import argparse
+import asyncio
+import statistics
+import time
+from datetime import datetime, timedelta
+from typing import List
+
+from fastapi.responses import JSONResponse, ORJSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_model_field
+
+from api.models import AppointmentStatus, UserType
+from api.responses import typed_response
+from api.schemas import AppointmentWithPatient, PatientStripped, UserStripped
+
+
+def appointments(rows: int) -> list:
+    start = datetime(2024, 1, 1, 8, 0)
+    return [AppointmentWithPatient(date=start + timedelta(minutes=20 * i), reason="Reason for appointment",
+                                   diagnosis="Diagnosis", status=AppointmentStatus.SCHEDULED,
+                                   patient=PatientStripped(first_name=f"PatientFirstName{i}", middle_name=None,
+                                                           last_name=f"PatientLastName{i}", gender="M"))
+            for i in range(rows)]
+
+
+def users(rows: int) -> list:
+    return [UserStripped(id=i, email=f"user{i}@example.com", mfa_type=None, type=UserType.Patient)
+            for i in range(rows)]
+
+
+def validated(response_class, model, content):
+    field = create_model_field(name="Response", type_=List[model], mode="serialization")
+    body = asyncio.run(serialize_response(field=field, response_content=content))
+    return response_class(body).body
+
+
+def measure(function, repeats: int) -> float:
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare response serialization paths on list endpoints")
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--repeats", type=int, default=20)
+    args = parser.parse_args()
+
+    cases = {
+        "/doctor/appointments": (AppointmentWithPatient, appointments(args.rows)),
+        "/admin/users": (UserStripped, users(args.rows)),
+    }
+
+    print(f"{args.rows} rows per response, median ms")
+    print(f"{'endpoint':<24}{'default':>10}{'orjson':>10}{'typed':>10}")
+    for endpoint, (model, content) in cases.items():
+        default = measure(lambda: validated(JSONResponse, model, content), args.repeats)
+        orjson = measure(lambda: validated(ORJSONResponse, model, content), args.repeats)
+        typed = measure(lambda: typed_response(content).body, args.repeats)
+        print(f"{endpoint:<24}{default:>10.2f}{orjson:>10.2f}{typed:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
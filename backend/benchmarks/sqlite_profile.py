@@ -0,0 +1,95 @@
+# Read/write throughput of the SQLite database with the default settings and with the production profile.
+#
+#   python -m benchmarks.sqlite_profile --readers 8 --writers 4 --seconds 10
+
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy.exc import OperationalError
+from sqlmodel import create_engine, Session, SQLModel, select
+
+from api.database import enable_sqlite_production_mode
+from api.models import Appointment, AppointmentStatus
+
+
+def new_appointment(when: datetime, doctor_id: int, patient_id: int) -> Appointment:
+    return Appointment(date=when, doctor_id=doctor_id, patient_id=patient_id, reason="Checkup", treatment_plan="",
+                       diagnosis="", recommendations="", status=AppointmentStatus.SCHEDULED)
+
+
+def run(production: bool, readers: int, writers: int, seconds: float, doctors: int = 50) -> dict:
+    directory = tempfile.mkdtemp()
+    engine = create_engine(f"sqlite:///{os.path.join(directory, 'bench.db')}")
+    if production:
+        enable_sqlite_production_mode(engine)
+    SQLModel.metadata.create_all(engine)
+
+    with Session(engine) as session:
+        start = datetime(2024, 1, 1, 8, 0)
+        session.add_all(new_appointment(start + timedelta(minutes=20 * i), i % doctors + 1, i % 1000 + 1)
+                        for i in range(10000))
+        session.commit()
+
+    counters = {"reads": 0, "writes": 0, "read_errors": 0, "write_errors": 0}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def count(name: str):
+        with lock:
+            counters[name] += 1
+
+    def reader():
+        while time.perf_counter() < deadline:
+            try:
+                with Session(engine) as session:
+                    stmt = (select(Appointment)
+                            .where(Appointment.doctor_id == random.randint(1, doctors))
+                            .order_by(Appointment.date.desc())
+                            .limit(20))
+                    session.exec(stmt).all()
+                count("reads")
+            except OperationalError:
+                count("read_errors")
+
+    def writer():
+        while time.perf_counter() < deadline:
+            try:
+                with Session(engine) as session:
+                    session.add(new_appointment(datetime.now(), random.randint(1, doctors), random.randint(1, 1000)))
+                    session.commit()
+                count("writes")
+            except OperationalError:
+                count("write_errors")
+
+    threads = ([threading.Thread(target=reader) for _ in range(readers)]
+               + [threading.Thread(target=writer) for _ in range(writers)])
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    engine.dispose()
+
+    return {name: value / seconds if name in ("reads", "writes") else value for name, value in counters.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare SQLite throughput with and without the production profile")
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=10)
+    args = parser.parse_args()
+
+    print(f"{'mode':<12}{'reads/s':>10}{'writes/s':>10}{'read errors':>13}{'write errors':>14}")
+    for name, production in (("default", False), ("production", True)):
+        result = run(production, args.readers, args.writers, args.seconds)
+        print(f"{name:<12}{result['reads']:>10.0f}{result['writes']:>10.0f}"
+              f"{result['read_errors']:>13}{result['write_errors']:>14}")
+
+
+if __name__ == "__main__":
+    main()
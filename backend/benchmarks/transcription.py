@@ -0,0 +1,100 @@
+# Transcription ingestion load test: rounds of concurrent sessions stream audio in real time to one uvicorn
+# worker running the stub engine. Reports server side chunk latency (arrival until processed and answered)
+# per round and the largest round that stayed within the latency budget.
+#
+#   python -m benchmarks.transcription --sessions 10 50 100 200 --seconds 20
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+from benchmarks.change_feed import rss_kib, uvicorn_server
+from benchmarks.endpoints import percentile
+
+SAMPLE_RATE = 16000
+CHUNK_MS = 100
+
+
+async def stream_session(port: int, token: str, appointment_id: int, audio: bytes, pace: float) -> dict:
+    from websockets.asyncio.client import connect
+    chunk = SAMPLE_RATE * 2 * CHUNK_MS // 1000
+    async with connect(f"ws://127.0.0.1:{port}/transcription/appointments/{appointment_id}/ws",
+                       additional_headers={"Cookie": f"access_token={token}"}) as connection:
+        assert json.loads(await connection.recv())["type"] == "ready"
+        started = time.perf_counter()
+        for i, offset in enumerate(range(0, len(audio), chunk)):
+            await connection.send(audio[offset:offset + chunk])
+            if pace:
+                # Real time: chunk i goes out CHUNK_MS * i after the start, however long sending took
+                await asyncio.sleep(max(0.0, started + i * CHUNK_MS / 1000 / pace - time.perf_counter()))
+        ended = time.perf_counter()
+        await connection.send('{"type": "end"}')
+        async for message in connection:
+            message = json.loads(message)
+            if message["type"] == "done":
+                return {**message, "drain": time.perf_counter() - ended}
+
+
+async def run_round(port: int, token: str, appointment_ids: list[int], audio: bytes, pace: float) -> list[dict]:
+    return await asyncio.gather(*(stream_session(port, token, appointment_id, audio, pace)
+                                  for appointment_id in appointment_ids))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stream audio from concurrent transcription sessions")
+    parser.add_argument("--sessions", type=int, nargs="+", default=[10, 50, 100, 200])
+    parser.add_argument("--seconds", type=float, default=20, help="Audio streamed by every session")
+    parser.add_argument("--pace", type=float, default=1.0, help="Speed relative to real time, 0 sends as fast as possible")
+    parser.add_argument("--budget-ms", type=float, default=CHUNK_MS, help="Chunk latency p99 a round must stay below")
+    args = parser.parse_args()
+
+    database = os.path.join(tempfile.mkdtemp(prefix="techmed-bench-"), "bench.db")
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{database}", HASH_PROFILE="test",
+               STT_ENGINE="stub", STT_SAMPLE_RATE=str(SAMPLE_RATE), STT_MAX_SESSIONS=str(max(args.sessions)))
+    os.environ.update(env)
+    first_day = date.today() + timedelta(days=7 - date.today().weekday())
+    from api.generate_dataset import generate
+    from api.models import Appointment
+    from api.security import create_token_from_data
+    from sqlmodel import Session
+
+    engine = generate(env["DATABASE_URL"], patients=100, doctors=20, appointments=200, facilities=3,
+                      first_day=first_day, log=lambda message: None)
+    with Session(engine) as db:
+        appointments = [Appointment(doctor_id=1, patient_id=1, date=datetime(2030, 1, 1) + timedelta(minutes=20 * i),
+                                    reason="", treatment_plan="", diagnosis="", recommendations="")
+                        for i in range(sum(args.sessions))]
+        db.add_all(appointments)
+        db.commit()
+        appointment_ids = [appointment.id for appointment in appointments]
+    engine.dispose()
+
+    token = create_token_from_data("doctor1@example.pl", "Doctor")
+    audio = random.Random(1).randbytes(int(SAMPLE_RATE * 2 * args.seconds))
+    capacity = 0
+    with uvicorn_server(env) as (port, pid):
+        print(f"{'sessions':>8} {'audio s/s':>9} {'p50 ms':>7} {'p99 ms':>7} {'max ms':>7} {'drain ms':>8} "
+              f"{'full waits':>10} {'RSS MiB':>8}")
+        for count in args.sessions:
+            ids, appointment_ids = appointment_ids[:count], appointment_ids[count:]
+            started = time.perf_counter()
+            results = asyncio.run(run_round(port, token, ids, audio, args.pace))
+            elapsed = time.perf_counter() - started
+            p99 = max(result["latency_p99"] for result in results)
+            print(f"{count:>8} {sum(result['audio_seconds'] for result in results) / elapsed:>9.0f} "
+                  f"{percentile([result['latency_p50'] for result in results], 0.5) * 1000:>7.2f} "
+                  f"{p99 * 1000:>7.2f} {max(result['latency_max'] for result in results) * 1000:>7.2f} "
+                  f"{max(result['drain'] for result in results) * 1000:>8.1f} "
+                  f"{sum(result['buffer_full_waits'] for result in results):>10} {rss_kib(pid) / 1024:>8.1f}")
+            if p99 * 1000 <= args.budget_ms:
+                capacity = count
+    print(f"largest round within a {args.budget_ms:.0f} ms p99 budget: {capacity} sessions")
+
+
+if __name__ == "__main__":
+    main()
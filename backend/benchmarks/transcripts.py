@@ -0,0 +1,166 @@
+# Transcript store benchmark: 45 minute transcripts written the way a transcription session writes them, once
+# into the block store of api/transcripts.py and once as one TEXT blob (JSON) per appointment that is rewritten
+# on every append. Reports database size and the latency of time range, tail and full reads. Both return
+# TranscriptSegment models, like the endpoints.
+#
+#   python -m benchmarks.transcripts --appointments 100
+
+import argparse
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import datetime
+
+from sqlalchemy import Column, Integer, MetaData, Table, Text, create_engine, insert, select, update
+from sqlmodel import Session, SQLModel
+
+from api.config import TRANSCRIPT_BLOCK_SEGMENTS
+from api.models import Appointment, AppointmentStatus
+from api.schemas import TranscriptSegment
+from api.transcripts import append_segments, read_range, read_tail
+
+WORDS = ("pacjent", "zgłasza", "ból", "głowy", "od", "trzech", "dni", "bez", "gorączki", "ciśnienie", "w", "normie",
+         "zalecam", "odpoczynek", "i", "kontrolę", "za", "tydzień", "czy", "pan", "pani", "przyjmuje", "leki",
+         "na", "stałe", "tak", "nie", "rano", "wieczorem", "duszności", "kaszel", "suchy", "osłuchowo", "szmery",
+         "pęcherzykowe", "prawidłowe", "brzuch", "miękki", "niebolesny", "badanie", "krwi", "morfologia",
+         "skierowanie", "do", "kardiologa", "ekg", "bez", "zmian", "proszę", "się", "położyć", "głęboki", "oddech")
+
+blob_metadata = MetaData()
+transcript_text = Table("transcript_text", blob_metadata,
+                        Column("appointment_id", Integer, primary_key=True), Column("text", Text, nullable=False))
+
+
+def consultation(minutes: float, rng: random.Random) -> list[TranscriptSegment]:
+    segments = []
+    position = rng.uniform(0, 5)
+    while position < minutes * 60:
+        words = rng.randint(3, 25)
+        duration = words * rng.uniform(0.3, 0.45)
+        text = " ".join(rng.choice(WORDS) for _ in range(words))
+        segments.append(TranscriptSegment(start=round(position, 3), end=round(position + duration, 3), text=text,
+                                          final=True))
+        position += duration + rng.expovariate(1 / 3)
+    return segments
+
+
+def median_ms(function, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings) * 1000
+
+
+def blob_read(db: Session, appointment_id: int) -> list[dict]:
+    return json.loads(db.exec(select(transcript_text.c.text)
+                              .where(transcript_text.c.appointment_id == appointment_id)).scalar_one())
+
+
+def file_size(engine) -> int:
+    with engine.connect() as connection:
+        connection.exec_driver_sql("VACUUM")
+    return os.path.getsize(engine.url.database)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the transcript block store with one TEXT blob per appointment")
+    parser.add_argument("--appointments", type=int, default=100)
+    parser.add_argument("--minutes", type=float, default=45)
+    parser.add_argument("--reads", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    transcripts = {appointment_id: consultation(args.minutes, rng) for appointment_id in range(1, args.appointments + 1)}
+    directory = tempfile.mkdtemp(prefix="techmed-bench-")
+    blocks_engine = create_engine(f"sqlite:///{os.path.join(directory, 'blocks.db')}")
+    blob_engine = create_engine(f"sqlite:///{os.path.join(directory, 'blob.db')}")
+    SQLModel.metadata.create_all(blocks_engine)
+    blob_metadata.create_all(blob_engine)
+
+    # Live sessions append a block every TRANSCRIPT_BLOCK_SEGMENTS segments, the blob is read and rewritten instead
+    with Session(blocks_engine) as db:
+        db.add_all([Appointment(id=appointment_id, doctor_id=1, patient_id=1, date=datetime(2030, 1, 1),
+                                reason="", treatment_plan="", diagnosis="", recommendations="",
+                                status=AppointmentStatus.IN_PROGRESS) for appointment_id in transcripts])
+        db.commit()
+        started = time.perf_counter()
+        for appointment_id, segments in transcripts.items():
+            for first in range(0, len(segments), TRANSCRIPT_BLOCK_SEGMENTS):
+                append_segments(db, appointment_id, segments[first:first + TRANSCRIPT_BLOCK_SEGMENTS])
+        blocks_append = time.perf_counter() - started
+        live_size = file_size(blocks_engine)
+
+        started = time.perf_counter()
+        for appointment_id in transcripts:
+            db.get(Appointment, appointment_id).status = AppointmentStatus.COMPLETED
+            db.commit()
+        compaction = time.perf_counter() - started
+
+    with Session(blob_engine) as db:
+        started = time.perf_counter()
+        for appointment_id, segments in transcripts.items():
+            db.exec(insert(transcript_text).values(appointment_id=appointment_id, text="[]"))
+            for first in range(0, len(segments), TRANSCRIPT_BLOCK_SEGMENTS):
+                stored = blob_read(db, appointment_id) + [segment.model_dump(exclude={"final"}) for segment
+                                                          in segments[first:first + TRANSCRIPT_BLOCK_SEGMENTS]]
+                db.exec(update(transcript_text).where(transcript_text.c.appointment_id == appointment_id)
+                        .values(text=json.dumps(stored, ensure_ascii=False)))
+                db.commit()
+        blob_append = time.perf_counter() - started
+
+    segment_count = sum(len(segments) for segments in transcripts.values())
+    text_bytes = sum(len(segment.text.encode()) for segments in transcripts.values() for segment in segments)
+    print(f"{args.appointments} transcripts of {args.minutes:.0f} min, {segment_count / args.appointments:.0f} "
+          f"segments and {text_bytes / args.appointments / 1024:.1f} KiB of text each")
+    print(f"append as a session would: blocks {blocks_append * 1000 / segment_count * TRANSCRIPT_BLOCK_SEGMENTS:.2f} ms, "
+          f"TEXT blob {blob_append * 1000 / segment_count * TRANSCRIPT_BLOCK_SEGMENTS:.2f} ms per block of "
+          f"{TRANSCRIPT_BLOCK_SEGMENTS} segments")
+    print(f"compaction on COMPLETED: {compaction * 1000 / args.appointments:.2f} ms per appointment")
+    print(f"database size: blocks {live_size / 1024:.0f} KiB while live, {file_size(blocks_engine) / 1024:.0f} KiB "
+          f"compacted, TEXT blob {file_size(blob_engine) / 1024:.0f} KiB")
+
+    reads = [(rng.choice(list(transcripts)), rng.uniform(0, args.minutes * 60 - 60)) for _ in range(args.reads)]
+    cases = iter(reads)
+    with Session(blocks_engine) as blocks_db, Session(blob_engine) as blob_db:
+        def blocks_range():
+            appointment_id, start = next(cases)
+            return read_range(blocks_db, appointment_id, start, start + 60)
+
+        def blob_range():
+            appointment_id, start = next(cases)
+            return [TranscriptSegment(**segment, final=True) for segment in blob_read(blob_db, appointment_id)
+                    if segment["end"] > start and segment["start"] < start + 60]
+
+        def blocks_tail():
+            appointment_id, _ = next(cases)
+            return read_tail(blocks_db, appointment_id, len(transcripts[appointment_id]) - TRANSCRIPT_BLOCK_SEGMENTS)
+
+        def blob_tail():
+            appointment_id, _ = next(cases)
+            return [TranscriptSegment(**segment, final=True)
+                    for segment in blob_read(blob_db, appointment_id)[-TRANSCRIPT_BLOCK_SEGMENTS:]]
+
+        def blocks_full():
+            appointment_id, _ = next(cases)
+            return read_range(blocks_db, appointment_id, 0, float("inf"))
+
+        def blob_full():
+            appointment_id, _ = next(cases)
+            return [TranscriptSegment(**segment, final=True) for segment in blob_read(blob_db, appointment_id)]
+
+        print(f"{'median read ms':<16} {'blocks':>8} {'TEXT blob':>10}")
+        for name, blocks, blob in (("60 s range", blocks_range, blob_range), ("tail", blocks_tail, blob_tail),
+                                   ("whole", blocks_full, blob_full)):
+            cases = iter(reads)
+            blocks_ms = median_ms(blocks, args.reads)
+            cases = iter(reads)
+            print(f"{name:<16} {blocks_ms:>8.3f} {median_ms(blob, args.reads):>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+# Voice activity detection benchmark: streams recordings through api.vad in 100 ms chunks, like a transcription
+# session, and reports the real-time factor (processing time / audio duration) and the share of audio removed.
+#
+#   python -m benchmarks.vad                       # A seeded synthetic 45 minute consultation
+#   python -m benchmarks.vad recording.wav ...     # 16 bit mono WAV files
+#
+# The synthetic consultation has known speech, so kept speech (recall) is reported as well. A per sample Python
+# implementation of the same features runs on the first minute for comparison.
+
+import argparse
+import math
+import time
+import wave
+
+import numpy as np
+
+from api.vad import VoiceActivityDetector, FULL_SCALE
+
+CHUNK_MS = 100
+
+
+def synthetic_consultation(minutes: float, rate: int, seed: int) -> tuple[np.ndarray, np.ndarray]:
+    """(int16 samples, speech mask) of alternating utterances and pauses with room noise and typing"""
+    rng = np.random.default_rng(seed)
+    total = int(minutes * 60 * rate)
+    audio = rng.normal(0, FULL_SCALE * 10 ** (-62 / 20), total)  # Room noise
+    speech = np.zeros(total, dtype=bool)
+
+    position = rate
+    while position < total:
+        # An utterance: syllables of a voiced sound with a few harmonics, separated by short gaps
+        end = min(total, position + int(rng.uniform(1, 6) * rate))
+        f0 = rng.uniform(100, 220)
+        level = FULL_SCALE * 10 ** (rng.uniform(-30, -18) / 20)
+        while position < end:
+            length = min(end - position, int(rng.uniform(0.15, 0.3) * rate))
+            t = np.arange(length) / rate
+            voiced = sum(np.sin(2 * np.pi * f0 * harmonic * t) / harmonic for harmonic in range(1, 6))
+            audio[position:position + length] += level * np.hanning(length) * voiced
+            speech[position:position + length] = True
+            position += length + int(rng.uniform(0.03, 0.12) * rate)
+
+        # A pause, sometimes with typing: 5 ms clicks every 100-250 ms
+        pause = int(rng.uniform(1, 10) * rate)
+        if rng.random() < 0.3:
+            click = position + int(rng.uniform(0.2, 0.5) * rate)
+            while click < min(total, position + pause) - rate // 200:
+                audio[click:click + rate // 200] += rng.normal(0, FULL_SCALE * 0.1, rate // 200)
+                click += int(rng.uniform(0.1, 0.25) * rate)
+        position += pause
+    return np.clip(audio, -FULL_SCALE, FULL_SCALE - 1).astype(np.int16), speech
+
+
+def read_wav(path: str) -> tuple[np.ndarray, int]:
+    with wave.open(path, "rb") as file:
+        if file.getsampwidth() != 2 or file.getnchannels() != 1:
+            raise SystemExit(f"{path}: only 16 bit mono WAV is supported")
+        return np.frombuffer(file.readframes(file.getnframes()), dtype="<i2"), file.getframerate()
+
+
+def python_features(samples: list[int], frame: int) -> list[tuple[float, float]]:
+    """The features of api.vad.frame_features with a loop over every sample, for comparison"""
+    features = []
+    for start in range(0, len(samples) - frame + 1, frame):
+        power = crossings = 0
+        previous = samples[start] < 0
+        for sample in samples[start:start + frame]:
+            power += sample * sample
+            crossings += (sample < 0) != previous
+            previous = sample < 0
+        features.append((10 * math.log10(power / frame / FULL_SCALE ** 2 + 1e-12), crossings / (frame - 1)))
+    return features
+
+
+def detect(samples: np.ndarray, rate: int) -> tuple[np.ndarray, float]:
+    """Speech mask found by the detector and the seconds it took"""
+    vad = VoiceActivityDetector(rate)
+    pcm = samples.tobytes()
+    chunk = rate * 2 * CHUNK_MS // 1000
+    started = time.perf_counter()
+    spans = []
+    for offset in range(0, len(pcm), chunk):
+        spans += vad.process(pcm[offset:offset + chunk])
+    spans += vad.flush()
+    elapsed = time.perf_counter() - started
+
+    kept = np.zeros(len(samples), dtype=bool)
+    for offset, speech in spans:
+        start = round(offset * rate)
+        kept[start:start + len(speech) // 2] = True
+    return kept, elapsed
+
+
+def report(name: str, samples: np.ndarray, rate: int, truth: np.ndarray | None):
+    kept, elapsed = detect(samples, rate)
+    duration = len(samples) / rate
+    line = (f"{name}: {duration / 60:.1f} min, processed in {elapsed * 1000:.0f} ms, real-time factor "
+            f"{elapsed / duration:.5f}, removed {1 - kept.mean():.1%} of the audio")
+    if truth is not None:
+        line += (f", kept {kept[truth].mean():.1%} of the speech and {kept[~truth].mean():.1%} of the rest "
+                 f"(speech is {truth.mean():.1%} of the recording)")
+    print(line)
+
+    # The same audio in a single call, what remains is per chunk overhead
+    started = time.perf_counter()
+    VoiceActivityDetector(rate).process(samples.tobytes())
+    print(f"  as one chunk: real-time factor {(time.perf_counter() - started) / duration:.5f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Real-time factor and removed audio of voice activity detection")
+    parser.add_argument("recordings", nargs="*", help="16 bit mono WAV files, a synthetic consultation when empty")
+    parser.add_argument("--minutes", type=float, default=45)
+    parser.add_argument("--rate", type=int, default=16000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    if args.recordings:
+        for path in args.recordings:
+            samples, rate = read_wav(path)
+            report(path, samples, rate, None)
+        return
+
+    samples, truth = synthetic_consultation(args.minutes, args.rate, args.seed)
+    report("synthetic consultation", samples, args.rate, truth)
+
+    minute = samples[:60 * args.rate]
+    frame = VoiceActivityDetector(args.rate).frame
+    started = time.perf_counter()
+    python_features(minute.tolist(), frame)
+    elapsed = time.perf_counter() - started
+    print(f"per sample Python features of the first minute: {elapsed * 1000:.0f} ms, "
+          f"real-time factor {elapsed / 60:.5f}")
+
+
+if __name__ == "__main__":
+    main()
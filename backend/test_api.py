@@ -1,21 +1,49 @@
+import csv
+import io
+import json
+import os
 import time
 
+os.environ.setdefault("HASH_PROFILE", "test")  # Cheap Argon2 parameters, must be set before importing the app
+os.environ.setdefault("DB_DEBUG_HEADERS", "1")  # X-DB-Queries on every response, used by get_within_budget
+
 import pytest
+from fastapi import HTTPException
 from fastapi.testclient import TestClient
 from jose import jwt
 
 from api.main import app
 from api.insert_mock_data import insert_mock_data
-from api.security import public_key, ALGORITHM
+from api.security import public_key, ALGORITHM, pwd_context, build_pwd_context, token_cache, create_token_from_data
+from api.hashing import HashingExecutor
+from api.functions import principal_cache
+from api.database import engine, enable_sqlite_production_mode, sqlite_writer_lock, track_queries
+from api.models import User, Appointment
+from sqlalchemy import event
+from sqlmodel import Session, SQLModel, select, create_engine
 
 client = TestClient(app, base_url="https://localhost:8000")
 
+# The shipped database, read before reset_state recreates orm.db for every test
+with open("orm.db", "rb") as database_file:
+    COMMITTED_DATABASE = database_file.read()
+
 @pytest.fixture(autouse=True)
 def reset_state():
     global client
     insert_mock_data()
+    principal_cache.clear()
+    token_cache.clear()
     client = TestClient(app)
 
+def get_within_budget(path: str, max_queries: int, **kwargs):
+    """GET path and fail if the request ran more SQL statements than max_queries"""
+    response = client.get(path, **kwargs)
+    assert response.status_code == 200
+    queries = int(response.headers["X-DB-Queries"])
+    assert queries <= max_queries, f"{path} ran {queries} queries, the budget is {max_queries}"
+    return response
+
 def test_login_auth_valid():
     response = client.post("/auth/login", data={"email": "user1@example.com", "password": "password"})
     assert response.status_code == 200
@@ -440,3 +468,1006 @@ def test_get_user_data_admin():
 
 
 
+
+
+def test_hashing_executor_rejects_when_full():
+    executor = HashingExecutor(workers=0, queue_size=0)
+    assert executor.verify_password("password", executor.hash_password("password"))
+
+    executor._reserve(1, blocking=False)  # Occupy the only slot
+    with pytest.raises(HTTPException) as error:
+        executor.hash_password("password")
+    assert error.value.status_code == 503
+    assert int(error.value.headers["Retry-After"]) >= 1
+    assert executor.stats()["rejected"] == 1
+
+    # Batches wait for capacity instead, also when hashing inline
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        batch = pool.submit(executor.hash_passwords, ["first", "second"])
+        time.sleep(0.1)
+        assert not batch.done()
+        executor._release(1)
+        hashes = batch.result(timeout=10)
+    assert [executor.verify_password(password, hashed) for password, hashed in zip(["first", "second"], hashes)] == [True, True]
+    assert executor.stats()["rejected"] == 1
+
+
+def test_hashing_batches_reserve_whole_chunks():
+    from concurrent.futures import ThreadPoolExecutor
+    executor = HashingExecutor(workers=2, queue_size=0)
+    try:
+        executor._reserve(1, blocking=False)
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            batches = [pool.submit(executor.hash_passwords, [f"{batch}-{i}" for i in range(4)]) for batch in range(2)]
+            time.sleep(0.1)
+            # Waiting batches hold no slots, so a login still gets the free one
+            assert executor.verify_password("password", executor.hash_password("password"))
+            assert not any(batch.done() for batch in batches)
+            executor._release(1)
+            assert all(len(batch.result(timeout=30)) == 4 for batch in batches)
+        assert executor.stats()["rejected"] == 0
+    finally:
+        executor.shutdown()
+
+
+def test_login_rehashes_outdated_hash():
+    outdated_hash = build_pwd_context(time_cost=2, memory_cost=8 * 1024, parallelism=1).hash("password")
+    with Session(engine) as session:
+        user = session.exec(select(User).where(User.email == "user1@example.com")).first()
+        user.hashed_password = outdated_hash
+        session.add(user)
+        session.commit()
+
+    response = client.post("/auth/login", data={"email": "user1@example.com", "password": "password"})
+    assert response.status_code == 200
+
+    with Session(engine) as session:
+        user = session.exec(select(User).where(User.email == "user1@example.com")).first()
+        assert user.hashed_password != outdated_hash
+        assert not pwd_context.needs_update(user.hashed_password)
+        assert pwd_context.verify("password", user.hashed_password)
+
+
+def test_verify_token_cached():
+    token_cache.clear()
+    client.cookies["access_token"] = create_token_from_data("user1@example.com", "Patient")
+
+    for _ in range(3):
+        response = client.get("/auth/verify_token")
+        assert response.status_code == 200
+        assert response.json()["email"] == "user1@example.com"
+
+    stats = token_cache.stats()
+    assert stats["misses"] == 1
+    assert stats["hits"] == 2
+
+
+def test_logout_revokes_token():
+    access_token = create_token_from_data("user1@example.com", "Patient")
+    client.cookies["access_token"] = access_token
+    assert client.get("/auth/verify_token").status_code == 200
+
+    response = client.post("/auth/logout")
+    assert response.status_code == 200
+
+    client.cookies["access_token"] = access_token
+    response = client.get("/auth/verify_token")
+    assert response.status_code == 401
+
+
+def test_logout_reaches_other_workers(monkeypatch):
+    from datetime import datetime, timedelta
+    from api.models import RevokedToken
+
+    access_token = create_token_from_data("user1@example.com", "Patient")
+    client.cookies["access_token"] = access_token
+    monkeypatch.setattr(token_cache, "check_seconds", 0)  # Cached payloads are checked again right away
+    assert client.get("/auth/verify_token").status_code == 200
+
+    # A logout handled by another worker is only known from the revoked_token table
+    with Session(engine) as db:
+        db.add(RevokedToken(digest=token_cache.digest(access_token).hex(), expires_at=datetime.utcnow() + timedelta(hours=2)))
+        db.commit()
+    assert client.get("/auth/verify_token").status_code == 401
+    token_cache.clear()  # Like a restarted worker
+    assert client.get("/auth/verify_token").status_code == 401
+
+
+def test_get_my_info_cached():
+    client.cookies["access_token"] = create_token_from_data("doctor@example.com", "Doctor")
+
+    first = client.get("/auth/get_my_info")
+    assert first.status_code == 200
+    assert first.json()["doctor"]["license_number"] == "D1001"
+
+    second = client.get("/auth/get_my_info")
+    assert second.status_code == 200
+    assert second.json() == first.json()
+
+    stats = principal_cache.stats()
+    assert stats["hits"] == 1
+    assert stats["queries_saved"] > 0
+
+
+def test_change_password_invalidates_principal():
+    client.cookies["access_token"] = create_token_from_data("user1@example.com", "Patient")
+    assert client.get("/auth/get_my_info").status_code == 200
+    assert principal_cache.get("user1@example.com") is not None
+
+    response = client.post("/auth/change_password", data={"current_password": "password", "new_password": "bardzobezpiecznehaslo"})
+    assert response.status_code == 200
+    assert principal_cache.get("user1@example.com") is None
+
+
+def test_get_doctor_specialities_async():
+    client.cookies["access_token"] = create_token_from_data("user1@example.com", "Patient")
+
+    response = client.get("/misc/get_doctor_specialities")
+    assert response.status_code == 200
+    assert [speciality["code"] for speciality in response.json()] == ["CARD", "NEUR", "ORTH"]
+
+
+def test_sqlite_production_mode(tmp_path):
+    sqlite_engine = create_engine(f"sqlite:///{tmp_path / 'production.db'}")
+    enable_sqlite_production_mode(sqlite_engine)
+    SQLModel.metadata.create_all(sqlite_engine)
+
+    with sqlite_engine.connect() as connection:
+        assert connection.exec_driver_sql("PRAGMA journal_mode").scalar() == "wal"
+        assert connection.exec_driver_sql("PRAGMA busy_timeout").scalar() > 0
+
+    with Session(sqlite_engine) as session:
+        session.add(User(email="writer@example.com"))
+        session.flush()
+        assert sqlite_writer_lock.locked()
+        # A second writing session on the same thread fails instead of waiting for the first one forever
+        with Session(sqlite_engine) as nested:
+            nested.add(User(email="nested@example.com"))
+            with pytest.raises(RuntimeError):
+                nested.flush()
+        session.commit()
+        assert not sqlite_writer_lock.locked()
+
+    with Session(sqlite_engine) as session:
+        session.add(User(email="after@example.com"))
+        session.commit()
+        assert session.exec(select(User.email).order_by(User.email)).all() == ["after@example.com", "writer@example.com"]
+
+
+def test_doctor_appointments_single_query():
+    client.cookies["access_token"] = create_token_from_data("doctor@example.com", "Doctor")
+    assert client.get("/auth/get_my_info").status_code == 200  # Warm up the principal cache
+
+    statements = []
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        response = client.get("/doctor/appointments", params={"start_date": "2024-12-01", "end_date": "2024-12-31"})
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+
+    assert response.status_code == 200
+    assert response.json() == [
+        {"date": "2024-12-10T10:00:00", "reason": "Reason for appointment", "diagnosis": "Diagnosis", "status": "Scheduled",
+         "patient": {"first_name": "PatientFirstName10", "middle_name": "PatientMiddleName0", "last_name": "PatientLastName10", "gender": "M"}},
+        {"date": "2024-12-20T10:00:00", "reason": "Reason for appointment", "diagnosis": "Diagnosis", "status": "Scheduled",
+         "patient": {"first_name": "PatientFirstName20", "middle_name": "PatientMiddleName0", "last_name": "PatientLastName20", "gender": "M"}},
+    ]
+    # The change stamp lookup for the ETag, then the agenda itself
+    assert len(statements) == 2 and "change_stamp" in statements[0]
+
+
+def test_list_users_admin_keyset_pagination():
+    client.cookies["access_token"] = create_token_from_data("admin@example.com", "Admin")
+
+    emails = []
+    cursor = None
+    pages = 0
+    while True:
+        params = {"limit": 5, "count": True}
+        if cursor:
+            params["cursor"] = cursor
+        response = client.get("/admin/users", params=params)
+        assert response.status_code == 200
+        assert int(response.headers["X-Total-Count"]) == 13
+        emails += [user["email"] for user in response.json()]
+        pages += 1
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+
+    assert pages == 3
+    assert len(emails) == len(set(emails)) == 13
+    assert emails[0] == "user0@example.com"
+    assert client.get("/admin/users", params={"limit": 1}).json()[0]["type"] == "Patient"
+
+    response = client.get("/admin/users", params={"cursor": "not-a-cursor"})
+    assert response.status_code == 400
+
+    # A cursor only continues the list it came from
+    cursor = client.get("/admin/users", params={"limit": 5}).headers["X-Next-Cursor"]
+    assert client.get("/admin/patients", params={"cursor": cursor}).status_code == 400
+
+    response = client.get("/admin/patients", params={"limit": 100000})
+    assert response.status_code == 422
+
+
+def test_admin_export_streams_ndjson_and_csv():
+    client.cookies["access_token"] = create_token_from_data("admin@example.com", "Admin")
+
+    response = client.get("/admin/export/appointments")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    lines = response.text.splitlines()
+    assert len(lines) == 60
+    assert json.loads(lines[0])["patient"]["last_name"] == "PatientLastName1"
+
+    response = client.get("/admin/export/patients", params={"format": "csv"})
+    assert response.status_code == 200
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert len(rows) == 100
+    assert rows[0] == {"first_name": "PatientFirstName0", "middle_name": "PatientMiddleName0", "last_name": "PatientLastName0", "gender": "M"}
+
+    assert client.get("/admin/export/prescriptions").status_code == 422
+
+    client.cookies["access_token"] = create_token_from_data("user1@example.com", "Patient")
+    assert client.get("/admin/export/patients").status_code == 401
+
+
+def test_admin_import_patients():
+    client.cookies["access_token"] = create_token_from_data("admin@example.com", "Admin")
+
+    header = "email,first_name,middle_name,last_name,PESEL,gender,address,phone_number\n"
+    rows = [
+        "import1@example.com,John,,Doe,62042621665,M,123 Main St,123456789",
+        "import2@example.com,Anna,Maria,Nowak,62042621665,F,Polna 1,123456789",
+        "not-an-email,John,,Doe,62042621665,M,123 Main St,123456789",
+        "import1@example.com,John,,Doe,62042621665,M,123 Main St,123456789",
+        "user1@example.com,John,,Doe,62042621665,M,123 Main St,123456789",
+    ]
+    response = client.post("/admin/patients/import",
+                           files={"file": ("patients.csv", header + "\n".join(rows), "text/csv")})
+    assert response.status_code == 202
+    job_id = response.json()["id"]
+
+    response = client.get(f"/admin/patients/import/{job_id}")
+    assert response.status_code == 200
+    job = response.json()
+    assert job["status"] == "completed"
+    assert (job["total"], job["created"], job["failed"]) == (5, 2, 3)
+    assert [row["status"] for row in job["report"]] == ["created", "created", "error", "error", "error"]
+    assert job["report"][2]["detail"] == "Email address must be valid"
+    assert job["report"][3]["detail"] == "Duplicate email in file"
+    assert job["report"][4]["detail"] == "User already exists"
+
+    response = client.get(f"/admin/patients/import/{job_id}/passwords")
+    assert response.status_code == 200
+    passwords = list(csv.DictReader(io.StringIO(response.text)))
+    assert [row["email"] for row in passwords] == ["import1@example.com", "import2@example.com"]
+    assert client.get(f"/admin/patients/import/{job_id}/passwords").status_code == 410
+
+    response = client.post("/auth/login", data={"email": "import2@example.com", "password": passwords[1]["temp_password"]})
+    assert response.status_code == 200
+
+    client.cookies.clear()
+    client.cookies["access_token"] = create_token_from_data("admin@example.com", "Admin")
+    ndjson = json.dumps({"email": "import3@example.com", "first_name": "Jan", "middle_name": None, "last_name": "Kowalski",
+                         "PESEL": "62042621665", "gender": "M", "address": "Polna 2", "phone_number": "123456789"})
+    response = client.post("/admin/patients/import", files={"file": ("patients.ndjson", ndjson + "\n{broken\n")})
+    job = client.get(f"/admin/patients/import/{response.json()['id']}").json()
+    assert (job["created"], job["failed"]) == (1, 1)
+
+    assert client.get("/admin/patients/import/unknown").status_code == 404
+
+
+def test_import_job_store_keeps_unfinished_jobs():
+    from api.patient_import import ImportJob, ImportJobStore, passwords_csv
+
+    store = ImportJobStore(max_jobs=2)
+    running, finished = ImportJob(total=1), ImportJob(total=1)
+    finished.passwords.append(("import1@example.com", "secret"))
+    finished.finished_at = time.time()
+    store.add(running)
+    store.add(finished)
+
+    # Neither can be dropped, the finished job still holds passwords
+    with pytest.raises(HTTPException) as error:
+        store.add(ImportJob(total=1))
+    assert error.value.status_code == 503
+
+    passwords_csv(finished)
+    newest = ImportJob(total=1)
+    store.add(newest)
+    assert store.get(running.id) is running and store.get(newest.id) is newest
+    with pytest.raises(HTTPException) as error:
+        store.get(finished.id)
+    assert error.value.status_code == 404
+
+
+def test_import_race_keeps_hashes(monkeypatch):
+    import api.patient_import as patient_import
+    from api.schemas import NewPatient
+
+    hashed = []
+    def counting_hash_passwords(passwords):
+        hashed.extend(passwords)
+        return [pwd_context.hash(password) for password in passwords]
+    monkeypatch.setattr(patient_import, "hash_passwords", counting_hash_passwords)
+
+    # user1 "registered" after the duplicate check, so the chunk insert fails and is retried row by row
+    chunk = [(row, NewPatient(email=email, first_name="Jan", middle_name=None, last_name="Kowalski", PESEL="62042621665",
+                              gender="M", address="Polna 2", phone_number="123456789"))
+             for row, email in enumerate(["race1@example.com", "user1@example.com", "race2@example.com"], start=1)]
+    job = patient_import.ImportJob(total=3)
+    patient_import._import_chunk(job, chunk)
+
+    assert len(hashed) == 3
+    assert (job.created, job.failed) == (2, 1)
+    assert [email for email, _ in job.passwords] == ["race1@example.com", "race2@example.com"]
+    for email, password in job.passwords:
+        assert client.post("/auth/login", data={"email": email, "password": password}).status_code == 200
+
+
+def test_generate_dataset(tmp_path):
+    from datetime import date, datetime
+    from api.generate_dataset import generate
+    from api.models import Patient, Appointment, AppointmentStatus
+    from api.schemas import PESELMixin
+
+    def snapshot(path):
+        engine = generate(f"sqlite:///{path}", patients=200, doctors=5, appointments=1000, facilities=3,
+                          seed=7, chunk_size=64, today=date.today(), log=lambda message: None)
+        with Session(engine) as db:
+            patients = db.exec(select(Patient).order_by(Patient.id)).all()
+            appointments = db.exec(select(Appointment).order_by(Appointment.id)).all()
+            users = db.exec(select(User)).all()
+        engine.dispose()
+        return patients, appointments, users
+
+    patients, appointments, users = snapshot(tmp_path / "a.db")
+    assert len(patients) == 200 and len(appointments) == 1000 and len(users) == 206
+    for patient in patients:
+        PESELMixin(PESEL=patient.PESEL)
+        assert int(patient.PESEL[9]) % 2 == (patient.gender == "M")
+    assert {appointment.status for appointment in appointments} >= {AppointmentStatus.COMPLETED, AppointmentStatus.SCHEDULED}
+    assert len({(appointment.doctor_id, appointment.date) for appointment in appointments}) == 1000
+    # Agendas are built around the current date, so doctors have upcoming visits
+    assert any(appointment.status == AppointmentStatus.SCHEDULED and appointment.date > datetime.now()
+               for appointment in appointments)
+
+    other_patients, other_appointments, _ = snapshot(tmp_path / "b.db")
+    assert [p.model_dump() for p in patients] == [p.model_dump() for p in other_patients]
+    assert [a.model_dump() for a in appointments] == [a.model_dump() for a in other_appointments]
+
+
+def test_endpoint_benchmark_compare():
+    from benchmarks.endpoints import compare
+
+    def report(p50, p95, queries):
+        return {"results": {"doctor_appointments": {"p50_ms": p50, "p95_ms": p95, "queries": queries}}}
+
+    baseline = report(10.0, 20.0, 1)
+    assert compare(baseline, report(11.0, 24.0, 1), threshold=0.25) == []
+    assert compare(baseline, report(10.2, 20.2, 1), threshold=0.01) == []  # Below the noise floor
+    assert compare(baseline, report(13.0, 20.0, 1), threshold=0.25) == ["doctor_appointments: p50_ms 10.00 -> 13.00"]
+    assert compare(baseline, report(10.0, 31.0, 1), threshold=0.25) == ["doctor_appointments: p95_ms 20.00 -> 31.00"]
+    assert compare(baseline, report(10.0, 20.0, 3), threshold=0.25) == ["doctor_appointments: queries 1 -> 3"]
+    assert compare(baseline, {"results": {"new_endpoint": {"p50_ms": 1, "p95_ms": 1, "queries": 9}}}, 0.25) == []
+
+
+def test_metrics_exposition_format():
+    from api.metrics import registry
+    registry.clear()
+
+    client.cookies["access_token"] = create_token_from_data("admin@example.com", "Admin")
+    assert client.get("/admin/users/1").status_code == 200
+    assert client.get("/admin/users/2").status_code == 200
+    assert client.get("/does/not/exist").status_code == 404
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "text/plain; version=0.0.4; charset=utf-8"
+
+    samples = {}
+    declared = {}
+    for line in response.text.splitlines():
+        if line.startswith("# TYPE "):
+            _, _, name, kind = line.split(" ")
+            declared[name] = kind
+        elif not line.startswith("#"):
+            name_and_labels, value = line.rsplit(" ", 1)
+            samples[name_and_labels] = float(value)
+            assert name_and_labels.split("{")[0].removesuffix("_bucket").removesuffix("_sum").removesuffix("_count") in declared
+
+    assert declared["http_requests_total"] == "counter"
+    assert declared["http_request_duration_seconds"] == "histogram"
+    # Both user ids are recorded under the route template, unknown paths share one series
+    assert samples['http_requests_total{method="GET",route="/admin/users/{user_id}",status="200"}'] == 2
+    assert samples['http_requests_total{method="GET",route="unmatched",status="404"}'] == 1
+
+    buckets = [value for key, value in samples.items()
+               if key.startswith('http_request_duration_seconds_bucket{method="GET",route="/admin/users/{user_id}"')]
+    assert buckets == sorted(buckets) and buckets[-1] == 2
+    assert samples['http_request_duration_seconds_count{method="GET",route="/admin/users/{user_id}"}'] == 2
+    assert samples['http_request_duration_seconds_bucket{method="GET",route="/admin/users/{user_id}",le="+Inf"}'] == 2
+    assert samples['http_response_size_bytes_sum{method="GET",route="/admin/users/{user_id}"}'] > 0
+    assert samples['threadpool_tokens{state="total"}'] == 40
+
+
+def test_query_budgets():
+    # ETag'd endpoints (get_my_info, doctor/appointments, specialities) add one change stamp lookup. The first
+    # request with a token also checks it against the revoked_token table, verify_token takes that one
+    client.cookies["access_token"] = create_token_from_data("admin@example.com", "Admin")
+    get_within_budget("/auth/verify_token", 1)
+    get_within_budget("/auth/get_my_info", 2)  # Resolves and caches the principal
+    get_within_budget("/admin/users", 1)
+    get_within_budget("/admin/patients", 1)
+    get_within_budget("/admin/doctors", 1)
+    get_within_budget("/admin/users/1", 2)
+
+    client.cookies["access_token"] = create_token_from_data("doctor@example.com", "Doctor")
+    get_within_budget("/auth/verify_token", 1)
+    get_within_budget("/auth/get_my_info", 3)
+    get_within_budget("/doctor/appointments", 2)
+    get_within_budget("/misc/get_doctor_specialities", 2)
+
+
+def test_query_stats_detect_n_plus_one():
+    with track_queries() as stats:
+        with Session(engine) as db:
+            appointments = db.exec(select(Appointment)).all()
+            for appointment in appointments:
+                appointment.patient  # Lazy load per distinct patient
+
+    repeated = dict(stats.repeated())
+    assert stats.count > 5 and stats.total_time > 0
+    assert len(repeated) == 1
+    shape, count = next(iter(repeated.items()))
+    assert "FROM patient" in shape and "WHERE patient.id = ?" in shape
+    assert count == stats.count - 1
+
+
+def test_weak_password_index(tmp_path, monkeypatch):
+    import api.password_index
+    from api.password_index import WeakPasswordIndex, build_index
+
+    first = tmp_path / "first.txt"
+    first.write_text("qwerty\nzaq1@WSXcde3\n\npassword\n", encoding="utf-8")
+    second = tmp_path / "second.txt"
+    second.write_text("password\nŻółćGęśląJaźń1\n", encoding="utf-8")
+
+    # A tiny run size forces the on-disk merge path
+    assert build_index([str(first), str(second)], str(tmp_path / "weak.idx"), run_size=2) == 4
+    assert os.stat(tmp_path / "weak.idx").st_mode & 0o777 == 0o644
+    index = WeakPasswordIndex(str(tmp_path / "weak.idx"))
+    assert len(index) == 4
+    assert all(password in index for password in ("qwerty", "zaq1@WSXcde3", "password", "ŻółćGęśląJaźń1"))
+    assert "%*Secure*Password12345" not in index and "" not in index
+
+    monkeypatch.setattr(api.password_index, "_index", index)
+    response = client.post("/auth/register", data={"email": "test@techmed.stasiak", "password": "zaq1@WSXcde3"})
+    assert response.status_code == 400
+    assert response.json()["detail"] == "This password is considered too weak"
+    index.close()
+
+
+def test_import_side_effects():
+    # The time budget is checked by python -m benchmarks.import_time --budget, not on loaded CI machines
+    from benchmarks.import_time import time_to_first_request
+
+    database_mtime = os.path.getmtime("orm.db")
+    measurement = time_to_first_request()
+
+    # Importing the application must not print, seed the database or load dev tooling
+    assert measurement["stdout"] == ""
+    assert os.path.getmtime("orm.db") == database_mtime
+    assert not {"api.insert_mock_data", "websockets", "pyexpat", "numpy"} & set(measurement["modules"])
+
+
+COMMITTED_DATABASE_SCRIPT = """
+import json
+from fastapi.testclient import TestClient
+from api.main import app
+from api.security import create_token_from_data
+client = TestClient(app, cookies={"access_token": create_token_from_data("doctor@example.com", "Doctor")})
+codes = [client.get(path).status_code
+         for path in ("/auth/verify_token", "/misc/get_doctor_specialities", "/misc/availability")]
+# The seed hashes use other parameters than HASH_PROFILE=test, so the login rehashes and bumps the change stamps
+codes.append(client.post("/auth/login", data={"email": "user1@example.com", "password": "password"}).status_code)
+print(json.dumps(codes))
+"""
+
+def test_committed_database(tmp_path):
+    import subprocess
+    import sys
+    from alembic.config import Config
+    from alembic.runtime.migration import MigrationContext
+    from alembic.script import ScriptDirectory
+
+    database = tmp_path / "orm.db"
+    database.write_bytes(COMMITTED_DATABASE)
+    url = f"sqlite:///{database}"
+
+    # The shipped database must be at the migration head, the application does not create tables on startup
+    with create_engine(url).connect() as connection:
+        revision = MigrationContext.configure(connection).get_current_revision()
+    assert revision == ScriptDirectory.from_config(Config("alembic.ini")).get_current_head()
+
+    # Served as shipped, without insert_mock_data
+    result = subprocess.run([sys.executable, "-c", COMMITTED_DATABASE_SCRIPT], capture_output=True, text=True,
+                            env={**os.environ, "DATABASE_URL": url, "HASH_PROFILE": "test"}, check=True)
+    assert json.loads(result.stdout.strip().splitlines()[-1]) == [200, 200, 200, 200]
+
+
+def test_availability():
+    from datetime import datetime, timedelta
+    from api.availability import availability_engine
+
+    availability_engine.invalidate()
+    monday = datetime.combine(datetime.now().date(), datetime.min.time())
+    monday += timedelta(days=7 - monday.weekday())
+
+    client.cookies["access_token"] = create_token_from_data("user1@example.com", "Patient")
+    response = client.get("/misc/availability", params={"facility_id": 2, "start": monday.isoformat(),
+                                                         "end": (monday + timedelta(days=1)).isoformat(), "limit": 100})
+    assert response.status_code == 200
+    slots = response.json()
+    # Facility 2 is open Mon-Fri 9:00-17:00 and has doctors 2 and 3, 24 slots of 20 minutes each
+    assert len(slots) == 48 and {slot["doctor_id"] for slot in slots} == {2, 3}
+    assert slots[0]["start"] == (monday + timedelta(hours=9)).isoformat()
+    assert all(slot["end"] <= (monday + timedelta(hours=17)).isoformat() for slot in slots)
+    assert [slot["start"] for slot in slots] == sorted(slot["start"] for slot in slots)
+
+    # Timestamps with a timezone are converted to local time, like the stored appointment dates
+    for suffix in ("Z", "+01:00"):
+        aware = datetime.fromisoformat((monday + timedelta(hours=9)).isoformat() + suffix)
+        response = client.get("/misc/availability", params={"facility_id": 2, "start": aware.isoformat(),
+                                                             "end": (aware + timedelta(hours=2)).isoformat()})
+        assert response.status_code == 200
+        local = aware.astimezone().replace(tzinfo=None)
+        assert response.json() and all(local.isoformat() <= slot["start"] < (local + timedelta(hours=2)).isoformat()
+                                       for slot in response.json())
+
+    def starts():
+        return [slot["start"] for slot in availability_engine.find_slots(
+            monday + timedelta(hours=9), monday + timedelta(hours=10), limit=100, doctor_ids=[1])]
+
+    assert starts() == [monday + timedelta(hours=9, minutes=m) for m in (0, 20, 40)]
+    with Session(engine) as db:
+        appointment = Appointment(doctor_id=1, patient_id=1, date=monday + timedelta(hours=9, minutes=10),
+                                  reason="Check-up", treatment_plan="", diagnosis="", recommendations="")
+        db.add(appointment)
+        db.commit()
+        # Picked up from the commit, without reloading the agenda
+        assert starts() == [monday + timedelta(hours=9, minutes=40)]
+
+        appointment.status = "Cancelled"
+        db.commit()
+        assert starts() == [monday + timedelta(hours=9, minutes=m) for m in (0, 20, 40)]
+        db.delete(appointment)
+        db.commit()
+
+
+def test_availability_refresh_outside_lock(monkeypatch):
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+    from datetime import datetime, timedelta
+    from api.availability import AvailabilityEngine
+
+    availability = AvailabilityEngine(refresh_seconds=0)
+    monday = datetime.combine(datetime.now().date(), datetime.min.time())
+    monday += timedelta(days=7 - monday.weekday())
+    search = lambda: availability.find_slots(monday + timedelta(hours=9), monday + timedelta(hours=10), doctor_ids=[1])
+    expected = search()
+
+    # A slow refresh of the doctors must not hold up searches, they are answered from the current agendas
+    release = threading.Event()
+    load_doctors = availability._load_doctors
+    monkeypatch.setattr(availability, "_load_doctors", lambda: release.wait(10) and load_doctors())
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        refresh = pool.submit(availability.facility_ids, 1)
+        time.sleep(0.1)
+        assert availability._refresh_lock.locked()
+        started = time.perf_counter()
+        assert search() == expected
+        assert time.perf_counter() - started < 1
+        release.set()
+        assert refresh.result(timeout=10) == [1, 3]
+
+
+def test_book_appointment_concurrently():
+    from concurrent.futures import ThreadPoolExecutor
+    from datetime import datetime, timedelta
+    from api.availability import availability_engine
+    from api.models import AppointmentSlot
+
+    availability_engine.invalidate()
+    monday = datetime.combine(datetime.now().date(), datetime.min.time())
+    monday += timedelta(days=7 - monday.weekday())
+    # Doctor 1 works at facilities 1 and 3, open Mon-Fri from 7:00 and 8:00
+    slots = [(monday + timedelta(hours=10, minutes=20 * i)).isoformat() for i in range(10)]
+    token = create_token_from_data("user1@example.com", "Patient")
+
+    def book(start):
+        return TestClient(app, cookies={"access_token": token}).post(
+            "/patient/appointments", json={"doctor_id": 1, "start": start, "reason": "Check-up"})
+
+    # 30 patients race for every slot
+    with ThreadPoolExecutor(max_workers=32) as pool:
+        responses = list(pool.map(book, slots * 30))
+    codes = [response.status_code for response in responses]
+    assert codes.count(201) == len(slots) and codes.count(409) == len(slots) * 29
+    assert sorted(response.json()["start"] for response in responses if response.status_code == 201) == slots
+
+    with Session(engine) as db:
+        booked = db.exec(select(Appointment).where(Appointment.doctor_id == 1, Appointment.date >= monday)).all()
+        assert len(booked) == len(slots)
+        assert len(db.exec(select(AppointmentSlot)).all()) == len(slots)
+    # The availability search saw every commit
+    assert not [slot for slot in availability_engine.find_slots(monday, monday + timedelta(days=1), limit=100,
+                                                                doctor_ids=[1]) if slot["start"].isoformat() in slots]
+
+    client.cookies["access_token"] = token
+    assert client.post("/patient/appointments", json={"doctor_id": 1, "start": (monday + timedelta(hours=6)).isoformat()}).status_code == 400
+    assert client.post("/patient/appointments", json={"doctor_id": 1, "start": (monday + timedelta(hours=10, minutes=5)).isoformat()}).status_code == 400
+    assert client.post("/patient/appointments", json={"doctor_id": 999, "start": slots[0]}).status_code == 404
+
+    # Cancelling releases the slot for the next patient
+    first = next(response.json() for response in responses if response.status_code == 201
+                 and response.json()["start"] == slots[0])
+    assert client.delete(f"/patient/appointments/{first['id']}").status_code == 200
+    assert client.post("/patient/appointments", json={"doctor_id": 1, "start": slots[0]}).status_code == 201
+
+    # Appointments written without a slot, here off the grid, still block the slots they overlap
+    with Session(engine) as db:
+        db.add(Appointment(doctor_id=1, patient_id=2, date=monday + timedelta(hours=14, minutes=10), reason="Check-up",
+                           treatment_plan="", diagnosis="", recommendations=""))
+        db.commit()
+    for minutes, code in ((0, 409), (20, 409), (40, 201)):
+        start = (monday + timedelta(hours=14, minutes=minutes)).isoformat()
+        assert client.post("/patient/appointments", json={"doctor_id": 1, "start": start}).status_code == code
+
+    # A booking cancelled outside the booking endpoints releases its slot as well
+    booked = client.post("/patient/appointments", json={"doctor_id": 1, "start": (monday + timedelta(hours=15)).isoformat()})
+    with Session(engine) as db:
+        db.get(Appointment, booked.json()["id"]).status = "Cancelled"
+        db.commit()
+        assert db.exec(select(AppointmentSlot).where(AppointmentSlot.appointment_id == booked.json()["id"])).first() is None
+    assert client.post("/patient/appointments", json={"doctor_id": 1, "start": booked.json()["start"]}).status_code == 201
+
+
+def test_conditional_get():
+    from datetime import datetime
+    from api.models import Patient
+
+    client.cookies["access_token"] = create_token_from_data("doctor@example.com", "Doctor")
+    params = {"start_date": "2024-01-01", "end_date": "2024-12-31"}
+    for path in ("/doctor/appointments", "/auth/get_my_info", "/misc/get_doctor_specialities"):
+        response = client.get(path, params=params)
+        etag = response.headers["ETag"]
+        revalidated = client.get(path, params=params, headers={"If-None-Match": etag})
+        assert revalidated.status_code == 304 and revalidated.content == b"" and revalidated.headers["ETag"] == etag
+        # The stamp lookup is the only query, the endpoint's own query is skipped
+        assert revalidated.headers["X-DB-Queries"] == "1"
+        assert client.get(path, params=params, headers={"If-None-Match": '"stale"'}).status_code == 200
+
+    etag = client.get("/doctor/appointments", params=params).headers["ETag"]
+    assert client.get("/doctor/appointments", params={**params, "end_date": "2024-06-30"},
+                      headers={"If-None-Match": etag}).status_code == 200
+
+    # A change committed through any session bumps the stamp, and the next revalidation gets the new content
+    with Session(engine) as db:
+        patient_id = db.exec(select(Appointment.patient_id).where(Appointment.doctor_id == 1,
+                                                                  Appointment.status == "SCHEDULED")).first()
+        patient = db.get(Patient, patient_id)
+        patient.first_name = "Renamed"
+        db.commit()
+    response = client.get("/doctor/appointments", params=params, headers={"If-None-Match": etag})
+    assert response.status_code == 200 and response.headers["ETag"] != etag
+    assert "Renamed" in response.text
+
+    etag = response.headers["ETag"]
+    with Session(engine) as db:
+        db.add(Appointment(doctor_id=1, patient_id=1, date=datetime(2024, 5, 5, 10), reason="Check-up",
+                           treatment_plan="", diagnosis="", recommendations=""))
+        db.commit()
+    assert client.get("/doctor/appointments", params=params, headers={"If-None-Match": etag}).status_code == 200
+
+
+def test_change_feed():
+    import asyncio
+    from datetime import datetime
+    from api.change_feed import ChangeBroker, change_broker
+
+    client.cookies["access_token"] = create_token_from_data("admin@example.com", "Admin")
+    with client.websocket_connect("/feed/appointments/ws?facility_id=1") as websocket:
+        with Session(engine) as db:
+            appointment = Appointment(doctor_id=1, patient_id=2, date=datetime(2030, 1, 7, 10), reason="Check-up",
+                                      treatment_plan="", diagnosis="", recommendations="")
+            db.add(appointment)
+            db.commit()
+            booked = websocket.receive_json()
+            assert booked["type"] == "booked" and booked["appointment_id"] == appointment.id
+            assert booked["topic"] == "facility:1" and booked["status"] == "Scheduled"
+
+            appointment.status = "Cancelled"
+            db.commit()
+            changed = websocket.receive_json()
+            assert changed["type"] == "status_changed" and changed["status"] == "Cancelled"
+
+    # Resuming from the booking replays the status change, an id from another worker (epoch) asks for a reset
+    with client.websocket_connect(f"/feed/appointments/ws?facility_id=1&since={booked['id']}") as websocket:
+        assert websocket.receive_json()["id"] == changed["id"]
+    with client.websocket_connect("/feed/appointments/ws?facility_id=1&since=otherworker:1") as websocket:
+        assert websocket.receive_json()["type"] == "reset"
+
+    broker = ChangeBroker(history=3)
+    for i in range(5):
+        broker.publish("doctor:1", {"type": "booked", "appointment_id": i})
+    assert broker.resume("doctor:1", f"{broker.epoch}:4") == (4, False)
+    assert broker.read("doctor:1", 4)[0] == [(5, broker._topics["doctor:1"].events[-1][1])]
+    assert broker.read("doctor:1", 1)[1]  # Events 2 fell out of the ring
+    assert broker.resume("doctor:1", "otherworker:4") == (5, True)
+
+    async def wait_for_publish():
+        waiting = asyncio.ensure_future(broker.wait("doctor:1", 5, timeout=5))
+        await asyncio.sleep(0)
+        assert broker.stats()["subscribers"] == 1
+        broker.publish("doctor:1", {"type": "booked"})
+        return await waiting, await broker.wait("doctor:2", 0, timeout=0.01)
+    assert asyncio.run(wait_for_publish()) == (True, False)
+    with pytest.raises(ValueError):
+        ChangeBroker(history=0)
+
+    # Every subscription keeps a topic, so only existing doctors and facilities can be followed
+    topics = change_broker.stats()["topics"]
+    assert client.get("/feed/appointments?doctor_id=999999").status_code == 404
+    assert client.get("/feed/appointments?facility_id=999999").status_code == 404
+    assert change_broker.stats()["topics"] == topics
+
+    client.cookies["access_token"] = create_token_from_data("user1@example.com", "Patient")
+    assert client.get("/feed/appointments?doctor_id=1").status_code == 403
+
+
+def test_change_feed_publishes_without_writer_lock(tmp_path, monkeypatch):
+    from datetime import datetime
+    from api.availability import availability_engine
+
+    sqlite_engine = create_engine(f"sqlite:///{tmp_path / 'production.db'}")
+    enable_sqlite_production_mode(sqlite_engine)
+    SQLModel.metadata.create_all(sqlite_engine)
+
+    # Facility ids may need a reload of the agendas, other writers must not wait for it
+    held = []
+    monkeypatch.setattr(availability_engine, "facility_ids", lambda doctor_id: held.append(sqlite_writer_lock.locked()) or [])
+    with Session(sqlite_engine) as db:
+        db.add(Appointment(doctor_id=1, patient_id=2, date=datetime(2030, 1, 7, 10), reason="Check-up",
+                           treatment_plan="", diagnosis="", recommendations=""))
+        db.commit()
+    assert held == [False]
+
+
+def test_change_feed_doctor_facilities():
+    import asyncio
+    from datetime import datetime
+    from starlette.websockets import WebSocketDisconnect
+    from api.change_feed import appointment_events
+
+    # doctor@example.com is doctor 1, working at facilities 1 and 3 but not 2
+    client.cookies["access_token"] = create_token_from_data("doctor@example.com", "Doctor")
+    assert client.get("/feed/appointments?facility_id=2").status_code == 403
+    with pytest.raises(WebSocketDisconnect):
+        with client.websocket_connect("/feed/appointments/ws?facility_id=2") as websocket:
+            websocket.receive_json()
+    with client.websocket_connect("/feed/appointments/ws?facility_id=3") as websocket:
+        with Session(engine) as db:
+            db.add(Appointment(doctor_id=1, patient_id=2, date=datetime(2030, 1, 7, 11), reason="Check-up",
+                               treatment_plan="", diagnosis="", recommendations=""))
+            db.commit()
+        assert websocket.receive_json()["topic"] == "facility:3"
+
+    # The SSE stream never ends, so it is read from the endpoint directly
+    async def first_event():
+        response = await appointment_events(doctor_id=None, facility_id=1, since=None, last_event_id=None,
+                                            payload={"sub": "doctor@example.com", "type": "Doctor"})
+        stream = response.body_iterator
+        assert await anext(stream) == "retry: 3000\n\n"
+        waiting = asyncio.ensure_future(anext(stream))
+        await asyncio.sleep(0.1)  # Subscribed and waiting for the next event
+        with Session(engine) as db:
+            db.add(Appointment(doctor_id=1, patient_id=2, date=datetime(2030, 1, 7, 12), reason="Check-up",
+                               treatment_plan="", diagnosis="", recommendations=""))
+            db.commit()
+        event = await waiting
+        await stream.aclose()
+        return event
+    event = asyncio.run(first_event())
+    assert event.startswith("id: ") and '"topic": "facility:1"' in event and '"type": "booked"' in event
+
+
+def test_transcription():
+    import asyncio
+    from datetime import datetime
+    from starlette.websockets import WebSocketDisconnect
+    from api.transcription import AudioRingBuffer, StubEngine, SttEngine, register_engine
+
+    with Session(engine) as db:
+        appointment = Appointment(doctor_id=1, patient_id=2, date=datetime(2030, 1, 7, 10), reason="Check-up",
+                                  treatment_plan="", diagnosis="", recommendations="")
+        db.add(appointment)
+        db.commit()
+        appointment_id = appointment.id
+
+    audio = bytes(range(256)) * 250  # 2 seconds at 16 kHz
+    client.cookies["access_token"] = create_token_from_data("doctor@example.com", "Doctor")
+    with client.websocket_connect(f"/transcription/appointments/{appointment_id}/ws") as websocket:
+        assert websocket.receive_json()["type"] == "ready"
+        for i in range(0, len(audio), 3200):  # 100 ms chunks
+            websocket.send_bytes(audio[i:i + 3200])
+        websocket.send_text('{"type": "end"}')
+        messages = []
+        while not messages or messages[-1]["type"] != "done":
+            messages.append(websocket.receive_json())
+
+    done = messages.pop()
+    assert done["chunks"] == 20 and done["audio_seconds"] == 2.0 and done["latency_p99"] is not None
+    assert done["speech_seconds"] == 2.0
+    finals = [message for message in messages if message["type"] == "final"]
+    assert [(final["start"], final["end"]) for final in finals] == [(0.0, 2.0)]
+    assert any(message["type"] == "partial" for message in messages)
+    with Session(engine) as db:
+        assert db.get(Appointment, appointment_id).status == "In Progress"
+
+    # The stub is deterministic, and a gap in the offsets (silence left out) closes the utterance
+    async def transcribe(*chunks):
+        stub = StubEngine(16000, "pl-PL")
+        segments = []
+        for offset, pcm in chunks:
+            segments += await stub.feed(pcm, offset)
+        return segments + await stub.finish()
+    first = asyncio.run(transcribe((0.0, audio)))
+    assert first == asyncio.run(transcribe((0.0, audio)))
+    assert first[-1].final and (first[-1].start, first[-1].end) == (0.0, 2.0) and len(first[-1].text.split()) == 5
+    gap = asyncio.run(transcribe((0.0, audio[:25600]), (5.0, audio[:25600])))
+    assert [(segment.start, segment.end) for segment in gap if segment.final] == [(0.0, 0.8), (5.0, 5.8)]
+
+    # A full ring makes the writer wait until the reader frees space
+    async def backpressure():
+        ring = AudioRingBuffer(8)
+        writer = asyncio.ensure_future(ring.write(bytes(range(12))))
+        await asyncio.sleep(0)
+        assert not writer.done() and len(ring) == 8
+        assert await ring.read(5) == bytes(range(4))  # Whole samples only
+        await writer
+        ring.close()
+        return await ring.read(100), await ring.read(100)
+    assert asyncio.run(backpressure()) == (bytes(range(4, 12)), b"")
+
+    client.cookies["access_token"] = create_token_from_data("user1@example.com", "Patient")
+    with pytest.raises(WebSocketDisconnect):
+        with client.websocket_connect(f"/transcription/appointments/{appointment_id}/ws"):
+            pass
+
+    # An engine without finish() is refused up front, not halfway through a session
+    class HalfEngine(SttEngine):
+        async def feed(self, pcm, offset):
+            return []
+    with pytest.raises(TypeError):
+        register_engine("half", HalfEngine)
+    with pytest.raises(TypeError):
+        HalfEngine(16000, "pl-PL")
+
+
+def test_transcription_session_limit(monkeypatch):
+    import asyncio
+    import api.transcription
+    from fastapi import WebSocketException
+    from api.transcription import transcribe_appointment
+
+    # Handshakes arriving together while the first one is still being checked must not exceed the limit
+    def slow_start(payload, appointment_id):
+        time.sleep(0.2)
+        raise HTTPException(status_code=404, detail="Appointment not found")
+    monkeypatch.setattr(api.transcription, "STT_MAX_SESSIONS", 2)
+    monkeypatch.setattr(api.transcription, "start_transcription", slow_start)
+
+    async def handshakes():
+        results = await asyncio.gather(*(transcribe_appointment(None, 1, {"type": "Doctor"}) for _ in range(5)),
+                                       return_exceptions=True)
+        return sorted(result.code for result in results if isinstance(result, WebSocketException))
+    assert asyncio.run(handshakes()) == [1008, 1008, 1013, 1013, 1013]
+    assert api.transcription._sessions == 0
+
+
+def test_voice_activity_detection():
+    import numpy as np
+    from api.vad import VoiceActivityDetector
+
+    rate = 16000
+    tone = (3000 * np.sin(2 * np.pi * 220 * np.arange(rate) / rate)).astype(np.int16)  # -21 dBFS
+    silence = np.zeros(rate, dtype=np.int16)
+    click = silence.copy()
+    click[:160] = 20000  # 10 ms, too short for speech
+    hiss = (np.random.default_rng(1).standard_normal(rate) * 330).astype(np.int16)  # -40 dBFS, but noise-like
+    audio = np.concatenate([silence, tone, silence, click, hiss, tone[:rate // 2]]).tobytes()
+
+    def detect(chunk: int):
+        vad = VoiceActivityDetector(rate, frame_ms=20, energy_db=-45, min_speech_ms=60, hangover_ms=300)
+        spans = []
+        for i in range(0, len(audio), chunk):
+            spans += vad.process(audio[i:i + chunk])
+        spans += vad.flush()
+        merged = []  # Spans cut by chunk boundaries are contiguous
+        for offset, pcm in spans:
+            if merged and abs(merged[-1][1] - offset) < 1e-9:
+                merged[-1][1] += len(pcm) / 2 / rate
+            else:
+                merged.append([offset, offset + len(pcm) / 2 / rate])
+        return [(round(start, 3), round(end, 3)) for start, end in merged], vad.stats()
+
+    # The tones are kept with 300 ms of hangover, silence, the click and the hiss are dropped
+    spans, stats = detect(len(audio))
+    assert spans == [(1.0, 2.3), (5.0, 5.5)]
+    assert stats == {"audio_seconds": 5.5, "speech_seconds": 1.8}
+    # Chunk boundaries that cut frames, and runs not yet long enough to decide, give the same result
+    for chunk in (3200, 1234, 18):
+        assert detect(chunk) == (spans, stats)
+
+
+def test_transcript_store():
+    from datetime import datetime
+    from api.models import TranscriptBlock
+    from api.schemas import TranscriptSegment
+    from api.transcripts import TranscriptWriter, read_range, read_tail
+
+    with Session(engine) as db:
+        appointment = Appointment(doctor_id=1, patient_id=2, date=datetime(2030, 1, 7, 10), reason="Check-up",
+                                  treatment_plan="", diagnosis="", recommendations="")
+        db.add(appointment)
+        db.commit()
+        appointment_id = appointment.id
+
+    def transcribe(seconds: int) -> list[dict]:
+        audio = bytes(range(256)) * (125 * seconds)
+        with client.websocket_connect(f"/transcription/appointments/{appointment_id}/ws") as websocket:
+            websocket.receive_json()
+            websocket.send_bytes(audio)
+            websocket.send_text('{"type": "end"}')
+            messages = [websocket.receive_json()]
+            while messages[-1]["type"] != "done":
+                messages.append(websocket.receive_json())
+        return [message for message in messages if message["type"] == "final"]
+
+    # Finals are stored, a second session continues after the first one
+    client.cookies["access_token"] = create_token_from_data("doctor@example.com", "Doctor")
+    assert [(final["start"], final["end"]) for final in transcribe(10)] == [(0.0, 3.2), (3.2, 6.4), (6.4, 9.6), (9.6, 10.0)]
+    assert [(final["start"], final["end"]) for final in transcribe(2)] == [(10.0, 12.0)]
+
+    path = f"/transcription/appointments/{appointment_id}"
+    assert [segment["start"] for segment in client.get(path).json()] == [0.0, 3.2, 6.4, 9.6, 10.0]
+    assert [segment["start"] for segment in client.get(path, params={"start": 4, "end": 7}).json()] == [3.2, 6.4]
+    tail = client.get(f"{path}/tail", params={"after": 3}).json()
+    assert [segment["start"] for segment in tail["segments"]] == [9.6, 10.0] and tail["next"] == 5
+    assert client.get(f"{path}/tail", params={"after": 5}).json() == {"segments": [], "next": 5}
+
+    # Small blocks are read through the sparse index, and merged when the appointment is completed
+    writer = TranscriptWriter(appointment_id, block_segments=2)
+    for i in range(7):
+        if writer.add(TranscriptSegment(start=20.0 + i, end=20.5 + i, text=f"segment {i}", final=True)):
+            writer.flush()
+    writer.flush()
+    with Session(engine) as db:
+        assert len(db.exec(select(TranscriptBlock).where(TranscriptBlock.appointment_id == appointment_id)).all()) == 6
+        assert [segment.text for segment in read_range(db, appointment_id, 22.2, 24.2)] == ["segment 2", "segment 3", "segment 4"]
+        before = read_range(db, appointment_id, 0, 100)
+
+        db.get(Appointment, appointment_id).status = "Completed"
+        db.commit()
+        blocks = db.exec(select(TranscriptBlock).where(TranscriptBlock.appointment_id == appointment_id)).all()
+        assert [(block.first_segment, block.segment_count, block.compacted) for block in blocks] == [(0, 12, True)]
+        assert read_range(db, appointment_id, 0, 100) == before
+        assert read_tail(db, appointment_id, 10) == (before[10:], 12)
+
+    client.cookies["access_token"] = create_token_from_data("user1@example.com", "Patient")
+    assert client.get(path).status_code == 403